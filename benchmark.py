@@ -0,0 +1,44 @@
+import argparse
+import json
+import os
+
+from sim_utils.benchmark import make_synthetic_data, run_benchmarks
+
+import warnings
+warnings.filterwarnings("ignore")
+
+# Benchmark suite: Data construction, Model.run (unconstrained, 85% and 100%
+# utilisation), Replicator by number of workers, and pivoting/saving results
+# of many replications. Runs on the London data and a synthetic scaled copy,
+# and writes results as JSON (for comparing results across commits).
+
+parser = argparse.ArgumentParser(description='Run model benchmarks')
+parser.add_argument('--quick', action='store_true',
+                    help='fewer repeats, workers and replications')
+parser.add_argument('--scale', type=int, default=4,
+                    help='copies of London data in synthetic data set '
+                         '(0 to skip synthetic data)')
+parser.add_argument('--repeat', type=int, default=3,
+                    help='repeats of data and model run benchmarks')
+parser.add_argument('--output', default=None,
+                    help='JSON output file (default '
+                         'output/benchmarks/benchmark_{commit}_{time}.json)')
+args = parser.parse_args()
+
+data_paths = {'london': 'data'}
+if args.scale > 0:
+    data_paths[f'synthetic_x{args.scale}'] = make_synthetic_data(
+        f'data/cache/synthetic_x{args.scale}', args.scale)
+
+benchmarks = run_benchmarks(data_paths, args.quick, args.repeat)
+
+output = args.output
+if output is None:
+    metadata = benchmarks['metadata']
+    commit = (metadata['commit'] or 'unknown')[:8]
+    timestamp = metadata['timestamp'].replace(':', '')[:17]
+    output = f'output/benchmarks/benchmark_{commit}_{timestamp}.json'
+os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+with open(output, 'w') as f:
+    json.dump(benchmarks, f, indent=2)
+print(f'Benchmark results saved to {output}')
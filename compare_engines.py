@@ -0,0 +1,31 @@
+import time
+
+import numpy as np
+
+from sim_utils.data import load_reference_data
+from sim_utils.model import Model
+from sim_utils.parameters import Scenario
+
+# Check the array event engine reproduces the SimPy model (same seed sequence).
+# Capacity is set to planned beds for 85% occupancy, so that beds are limited
+# (with unconstrained capacity both engines use the vectorised fast path).
+units = load_reference_data().units
+unit_capacity = dict(zip(units.index, units['planned_85_percent']))
+
+audits = ['global_audit', 'occupancy_audit',
+          'unit_occupancy_displaced_preferred_audit',
+          'unit_occupancy_displaced_destination_audit',
+          'unit_occupancy_waiting_preferred_audit']
+models = {}
+for engine in ['simpy', 'array']:
+    time_start = time.time()
+    scenario = Scenario(allow_non_preferred_asu=True, event_engine=engine,
+                        unit_capacity=unit_capacity)
+    models[engine] = Model(scenario, np.random.SeedSequence(42))
+    models[engine].run()
+    print(f'{engine}: finished in {time.time() - time_start:.2f} seconds.')
+
+for audit in audits:
+    difference = np.abs(getattr(models['simpy'], audit).values -
+                        getattr(models['array'], audit).values).max()
+    print(f'{audit}: maximum difference {difference}')
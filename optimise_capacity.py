@@ -0,0 +1,31 @@
+import os
+import time
+
+from sim_utils.optimise import CapacityOptimiser
+from sim_utils.parameters import Scenario
+
+# Search for the fewest beds by unit meeting targets (mean patients waiting
+# for an ASU bed, and 95th percentile wait in days of ASU patients).
+# Candidates are screened with short array engine runs, and confirmed with
+# full replications.
+targets = {'mean_waiting': 1.0, 'p95_wait': 0.5}
+
+time_start = time.time()
+scenario = Scenario(allow_non_preferred_asu=True)
+optimiser = CapacityOptimiser(scenario, targets, replications=30,
+                              screening_replications=3, seed=42)
+capacity = optimiser.run()
+print(f'Finished in {time.time() - time_start:.0f} seconds.')
+
+if capacity is None:
+    print('No capacity found meeting targets.')
+else:
+    print(f'Total beds: {sum(capacity.values())}')
+    print(f'KPIs: {optimiser.best_kpis}')
+    os.makedirs('output', exist_ok=True)
+    optimiser.history.to_csv('output/capacity_optimisation_history.csv',
+                             index=False)
+    with open('output/optimised_capacity.csv', 'w') as f:
+        f.write('Unit,Capacity\n')
+        for unit, beds in capacity.items():
+            f.write(f'{unit},{beds}\n')
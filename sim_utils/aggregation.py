@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+
+
+class P2Quantile(object):
+    """
+    Streaming quantile estimate using the P-squared algorithm (Jain and
+    Chlamtac, 1985). Memory use is fixed (five markers) regardless of the
+    number of observations. Estimates are made independently for each element
+    of the observation vectors passed to `update`.
+
+    methods
+    -------
+    update:
+        Add an observation vector
+    value:
+        Return current quantile estimate for each element
+
+    """
+
+    def __init__(self, p, size):
+        """Constructor method for P2Quantile"""
+
+        self.p = p
+        self.size = size
+        self.count = 0
+        self.initial = []
+        self.heights = None
+        self.positions = None
+        self.desired = np.array([1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5])
+        self.increments = np.array([0, p / 2, p, (1 + p) / 2, 1])
+
+    def update(self, x):
+        """Add an observation vector (one value per element)"""
+
+        x = np.asarray(x, dtype=np.float64)
+        self.count += 1
+
+        # Store first five observations, then initialise markers
+        if self.count <= 5:
+            self.initial.append(x)
+            if self.count == 5:
+                self.heights = np.sort(np.array(self.initial), axis=0)
+                self.positions = np.tile(
+                    np.arange(1., 6.)[:, np.newaxis], (1, self.size))
+                self.initial = []
+            return
+
+        q = self.heights
+        n = self.positions
+
+        # Update extreme markers, find cell of x, and shift marker positions
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        cell = (x[np.newaxis] >= q[1:4]).sum(axis=0)
+        n += np.arange(5)[:, np.newaxis] > cell
+        self.desired += self.increments
+
+        # Adjust heights of middle markers if off their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            up = (d >= 1) & (n[i + 1] - n[i] > 1)
+            down = (d <= -1) & (n[i - 1] - n[i] < -1)
+            adjust = up | down
+            if not adjust.any():
+                continue
+            ds = np.where(up, 1., -1.)
+            parabolic = q[i] + ds / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + ds) * (q[i + 1] - q[i]) /
+                (n[i + 1] - n[i]) +
+                (n[i + 1] - n[i] - ds) * (q[i] - q[i - 1]) /
+                (n[i] - n[i - 1]))
+            neighbour_q = np.where(up, q[i + 1], q[i - 1])
+            neighbour_n = np.where(up, n[i + 1], n[i - 1])
+            linear = q[i] + ds * (neighbour_q - q[i]) / (neighbour_n - n[i])
+            use_parabolic = (q[i - 1] < parabolic) & (parabolic < q[i + 1])
+            q[i] = np.where(
+                adjust, np.where(use_parabolic, parabolic, linear), q[i])
+            n[i] = np.where(adjust, n[i] + ds, n[i])
+
+    def value(self):
+        """Return current quantile estimate for each element"""
+
+        if self.count == 0:
+            return np.full(self.size, np.nan)
+        if self.count < 5:
+            return np.percentile(np.array(self.initial), self.p * 100, axis=0)
+
+        return self.heights[2].copy()
+
+
+class StreamingStats(object):
+    """
+    Running statistics for each column of a stream of observations: count,
+    min, max, mean and variance (Welford's algorithm, updated a block of
+    observations at a time), and approximate median and 95th percentile (P2).
+
+    methods
+    -------
+    update:
+        Add a block of observations (rows) to the running statistics
+    summary:
+        Return DataFrame of statistics (rows) by column
+
+    """
+
+    stat_names = ['min', 'mean', 'median', 'max', 'percentile_95']
+
+    def __init__(self, columns):
+        """Constructor method for StreamingStats"""
+
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.median = P2Quantile(0.5, size)
+        self.percentile_95 = P2Quantile(0.95, size)
+
+    @property
+    def variance(self):
+        """Sample variance of each column"""
+
+        if self.count < 2:
+            return np.full(len(self.columns), np.nan)
+
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        """Sample standard deviation of each column"""
+
+        return np.sqrt(self.variance)
+
+    def update(self, values):
+        """Add a block of observations (2D array, one row per observation)"""
+
+        values = np.asarray(values, dtype=np.float64)
+        block_count = values.shape[0]
+        if block_count == 0:
+            return
+
+        # Combine block mean and sum of squared differences with running values
+        block_mean = values.mean(axis=0)
+        block_m2 = ((values - block_mean) ** 2).sum(axis=0)
+        delta = block_mean - self.mean
+        total = self.count + block_count
+        self.mean += delta * block_count / total
+        self.m2 += block_m2 + delta ** 2 * self.count * block_count / total
+        self.count = total
+
+        self.min = np.minimum(self.min, values.min(axis=0))
+        self.max = np.maximum(self.max, values.max(axis=0))
+
+        for row in values:
+            self.median.update(row)
+            self.percentile_95.update(row)
+
+    def summary(self):
+        """Return DataFrame of statistics (rows) by column"""
+
+        summary = pd.DataFrame(
+            [self.min, self.mean, self.median.value(), self.max,
+             self.percentile_95.value()],
+            index=self.stat_names, columns=self.columns)
+
+        return summary
+
+
+class TrialAggregator(object):
+    """
+    Fold results of each model run into running statistics, by result type and
+    scenario name, as soon as the run finishes. Memory use is independent of
+    the number of replications.
+
+    methods
+    -------
+    add_run:
+        Add results of one model run
+    pivot:
+        Return summary of a result type in the same layout as
+        Replicator.pivot_results
+    mean:
+        Return mean of a result type by scenario name
+
+    """
+
+    # Result types with one row per audit day
+    daily_result_types = [
+        'global', 'occupancy', 'occupancy_percent',
+        'occupancy_displaced_preferred', 'occupancy_displaced_destination',
+        'occupancy_waiting_preferred']
+
+    def __init__(self):
+        """Constructor method for TrialAggregator"""
+
+        # Dictionary (by result type) of dictionaries (by scenario name)
+        self.stats = {}
+
+    def add_run(self, name, results):
+        """Add results (dictionary from Replicator.single_run) of one run"""
+
+        for result_type in self.daily_result_types:
+            df = results[result_type]
+            columns = [column for column in df
+                       if column not in ('index', 'time', 'run', 'name')]
+            self.get_stats(result_type, name, columns).update(
+                df[columns].values)
+
+        unit_admissions = results['unit_admissions']
+        self.get_stats('unit_admissions', name, unit_admissions.index).update(
+            unit_admissions.values[np.newaxis, :])
+
+        self.get_stats('average_wait_time_waiters', name, [0]).update(
+            [[results['average_wait_time_waiters']]])
+
+    def get_stats(self, result_type, name, columns):
+        """Return StreamingStats for result type and scenario name"""
+
+        stats_by_name = self.stats.setdefault(result_type, {})
+        if name not in stats_by_name:
+            stats_by_name[name] = StreamingStats(columns)
+
+        return stats_by_name[name]
+
+    def pivot(self, result_type):
+        """
+        Return summary DataFrame of result type. Index is (statistic, result
+        key), columns are scenario names.
+        """
+
+        summaries = {name: stats.summary().stack()
+                     for name, stats in self.stats[result_type].items()}
+        pivot = pd.DataFrame(summaries)
+        pivot.columns.name = 'name'
+
+        return pivot
+
+    def mean(self, result_type):
+        """Return DataFrame of mean results (rows are scenario names)"""
+
+        means = {name: stats.mean
+                 for name, stats in self.stats[result_type].items()}
+        columns = next(iter(self.stats[result_type].values())).columns
+        mean = pd.DataFrame.from_dict(means, orient='index', columns=columns)
+        mean.index.name = 'name'
+
+        return mean
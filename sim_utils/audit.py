@@ -1,62 +1,112 @@
+import numpy as np
+import pandas as pd
+
+
 class Audit(object):
 
-    def __init__(self):
+    # Global tracker fields (in order of the global audit structured array)
+    global_audit_keys = [
+        ('total_patients', 'total_patients'),
+        ('total_patients_asu', 'total_patients_asu'),
+        ('total_patients_waited', 'total_patients_waited'),
+        ('total_patients_displaced', 'total_patients_displaced'),
+        ('current_patients', 'current_patients'),
+        ('asu_patients_all', 'current_asu_patients_all'),
+        ('asu_patients_allocated', 'current_asu_patients_allocated'),
+        ('asu_patients_unallocated', 'current_asu_patients_unallocated'),
+        ('asu_patients_displaced', 'current_asu_patients_displaced')]
+
+    global_audit_dtype = np.dtype(
+        [('index', np.int64), ('time', np.float64)] +
+        [(field, np.int64) for field, _ in global_audit_keys])
+
+    def __init__(self, sim_duration, units_capacity):
         """
-        Constructor method for audit.
+        Constructor method for audit. Audits are written into preallocated
+        NumPy arrays (one row per audit day, copied by value); DataFrames are
+        built on demand.
 
         Attributes
         ==========
-        global_audit (dictionary):
+        global_audit (NumPy structured array):
             Audit of high level metrics
-        unit_audit (dictionary):
-            Audit at unit level
-
-
+        audit_unit_occupancy (NumPy array, day x unit):
+            Audit of unit occupancy
+        audit_unit_occupancy_displaced_preferred (NumPy array, day x unit):
+            Audit of displaced patients by preferred unit
+        audit_unit_occupancy_displaced_destination (NumPy array, day x unit):
+            Audit of displaced patients by destination unit
+        audit_unit_occupancy_waiting_preferred (NumPy array, day x unit):
+            Audit of patients waiting for a bed by preferred unit
 
         """
+        # Audit is daily during the data collection phase
+        audit_days = int(np.ceil(sim_duration)) + 1
+        number_units = len(units_capacity)
+        self.units_capacity = np.array(units_capacity, dtype=np.float64)
+
         # Initialise global audits
         self.global_audit_index_count = 0
-        self.global_audit = []
-        self.audit_unit_occupancy = []
-        self.audit_unit_occupancy_percent = []
-        self.audit_unit_occupancy_displaced_preferred = []
-        self.audit_unit_occupancy_displaced_destination = []
-        self.audit_unit_occupancy_waiting_preferred = []
+        self.global_audit = np.zeros(audit_days, dtype=self.global_audit_dtype)
+        self.audit_unit_occupancy = np.zeros((audit_days, number_units))
+        self.audit_unit_occupancy_displaced_preferred = \
+            np.zeros((audit_days, number_units))
+        self.audit_unit_occupancy_displaced_destination = \
+            np.zeros((audit_days, number_units))
+        self.audit_unit_occupancy_waiting_preferred = \
+            np.zeros((audit_days, number_units))
+
+    @property
+    def audit_unit_occupancy_percent(self):
+        """Unit occupancy as percentage of capacity (day x unit)"""
+
+        return (self.audit_unit_occupancy[:self.global_audit_index_count] /
+                self.units_capacity) * 100
+
+    def get_global_audit(self):
+        """Return global audit as a DataFrame"""
+
+        return pd.DataFrame(
+            self.global_audit[:self.global_audit_index_count])
+
+    def get_unit_audit(self, audit, units_name):
+        """Return a unit level audit array as a DataFrame"""
+
+        return pd.DataFrame(
+            audit[:self.global_audit_index_count], columns=units_name)
+
+    def record_audit(self, _model, tracker_keys):
+        """Record one audit row of trackers and unit arrays"""
+
+        # Global tracker audit
+        row = self.global_audit_index_count
+        self.global_audit_index_count += 1
+        self.global_audit[row] = (
+            (self.global_audit_index_count, _model.env.now) +
+            tuple(_model.tracker[key] for key in tracker_keys))
+
+        # Occupancy, displaced and waiting patients (copied by value)
+        self.audit_unit_occupancy[row] = _model.unit_occupancy
+        self.audit_unit_occupancy_displaced_preferred[row] = \
+            _model.unit_occupancy_displaced_preferred
+        self.audit_unit_occupancy_displaced_destination[row] = \
+            _model.unit_occupancy_displaced_destination
+        self.audit_unit_occupancy_waiting_preferred[row] = \
+            _model.unit_occupancy_waiting_preferred
 
     def perform_global_audit(self, _model):
         """
         Perform audit of high level model parameters/metrics
         """
-        
+
+        tracker_keys = [key for _, key in self.global_audit_keys]
+
         while True:
             if _model.env.now >= _model.params.sim_warmup:
-                # Global tracker audit
-                self.global_audit_index_count += 1
-                item = dict()
-                item['index'] = self.global_audit_index_count
-                item['time'] = _model.env.now
-                item['total_patients'] = _model.tracker['total_patients']
-                item['total_patients_asu'] = _model.tracker['total_patients_asu']
-                item['total_patients_waited'] = _model.tracker['total_patients_waited']
-                item['total_patients_displaced'] = _model.tracker['total_patients_displaced']
-                item['current_patients'] = _model.tracker['current_patients']
-                item['asu_patients_all'] = _model.tracker['current_asu_patients_all']
-                item['asu_patients_allocated'] = _model.tracker['current_asu_patients_allocated']
-                item['asu_patients_unallocated'] = _model.tracker['current_asu_patients_unallocated']
-                item['asu_patients_displaced'] = _model.tracker['current_asu_patients_displaced']
-                self.global_audit.append(item)
-
-                # Occupancy, displaced and waiting patients
-                self.audit_unit_occupancy.append(_model.unit_occupancy)
-                self.audit_unit_occupancy_percent.append(
-                    (_model.unit_occupancy/_model.data.units_capacity)*100)
-                self.audit_unit_occupancy_displaced_preferred.append(
-                    _model.unit_occupancy_displaced_preferred )
-                self.audit_unit_occupancy_displaced_destination.append(
-                    _model.unit_occupancy_displaced_destination)
-                self.audit_unit_occupancy_waiting_preferred .append(
-                    _model.unit_occupancy_waiting_preferred)
+                if _model.instrumentation is not None:
+                    _model.instrumentation.count('audit_ticks')
+                with _model.timer('audit'):
+                    self.record_audit(_model, tracker_keys)
 
                 # Wait for next audit
             yield _model.env.timeout(1)
-            
@@ -0,0 +1,133 @@
+import copy
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from sim_utils.model import Model
+
+
+def mser(series, batch_size=5, max_truncation_fraction=0.5):
+    """
+    Return warm-up length (number of observations to delete from the start of
+    a series) by the MSER-k method (White, 1997; MSER-5 with default
+    batch_size). The series is averaged in batches of `batch_size`, and the
+    truncation point minimising the marginal standard error of the remaining
+    batch means is chosen. Truncation is limited to `max_truncation_fraction`
+    of the series, as the MSER statistic is unstable near the end of a run.
+    """
+
+    values = np.asarray(series, dtype=np.float64)
+    batch_count = len(values) // batch_size
+    if batch_count < 2:
+        return 0
+    batches = values[:batch_count * batch_size].reshape(
+        batch_count, batch_size).mean(axis=1)
+
+    # Sum and sum of squares of batch means after each truncation point
+    suffix_sum = np.cumsum(batches[::-1])[::-1]
+    suffix_sum_squares = np.cumsum(batches[::-1] ** 2)[::-1]
+    remaining = batch_count - np.arange(batch_count)
+    sum_squared_error = suffix_sum_squares - suffix_sum ** 2 / remaining
+    mser_statistic = sum_squared_error / remaining ** 2
+
+    max_truncation = max(int(batch_count * max_truncation_fraction), 1)
+    truncation = int(np.argmin(mser_statistic[:max_truncation]))
+
+    return truncation * batch_size
+
+
+def batch_means(series, batch_count=20, ci_level=0.95):
+    """
+    Return mean, confidence interval half-width and lag 1 autocorrelation of
+    batch means for a (warm-up truncated) series. The series is split into
+    `batch_count` equal batches (observations left over are dropped from the
+    start). Lag 1 autocorrelation near zero suggests batches are long enough
+    to be treated as independent.
+    """
+
+    values = np.asarray(series, dtype=np.float64)
+    batch_length = len(values) // batch_count
+    if batch_length < 1:
+        raise ValueError('Series is shorter than the number of batches')
+    values = values[len(values) - batch_count * batch_length:]
+    batches = values.reshape(batch_count, batch_length).mean(axis=1)
+
+    mean = batches.mean()
+    t_value = stats.t.ppf(1 - (1 - ci_level) / 2, batch_count - 1)
+    half_width = t_value * batches.std(ddof=1) / np.sqrt(batch_count)
+    deviation = batches - mean
+    variance_sum = (deviation ** 2).sum()
+    if variance_sum > 0:
+        lag_1 = (deviation[:-1] * deviation[1:]).sum() / variance_sum
+    else:
+        lag_1 = 0.0
+
+    return mean, half_width, lag_1
+
+
+def get_kpi_series(model):
+    """Return DataFrame of daily KPI series from a model run: patients
+    waiting, ASU patients, and occupancy of each unit"""
+
+    global_audit = model.global_audit
+    series = pd.DataFrame({
+        'patients_waiting': global_audit['asu_patients_unallocated'].values,
+        'asu_patients': global_audit['asu_patients_all'].values})
+    occupancy = model.occupancy_audit
+    for unit in occupancy:
+        series[f'occupancy_{unit}'] = occupancy[unit].values
+
+    return series
+
+
+def analyse_batch_means(model, batch_count=20, ci_level=0.95,
+                        warmup_kpis=('asu_patients',)):
+    """
+    Detect warm-up of a long model run (audited from time zero) by MSER-5,
+    truncate all KPI series at the longest warm-up found for `warmup_kpis`,
+    and estimate KPI means and confidence intervals by batch means. By
+    default warm-up is set by total ASU patients, which carries the transient
+    from an empty system; MSER-5 warm-up of every KPI is also reported (on
+    short, noisy series such as single unit occupancy it can pick late
+    truncation points by chance).
+
+    Returns
+    -------
+    warmup (int):
+        Warm-up (days) deleted from all series
+    results (DataFrame):
+        KPI mean, half_width, lag_1 autocorrelation and MSER-5 warm-up (days)
+    """
+
+    series = get_kpi_series(model)
+    warmups = series.apply(mser)
+    warmup = int(warmups[list(warmup_kpis)].max())
+    truncated = series.iloc[warmup:]
+
+    results = pd.DataFrame(
+        [batch_means(truncated[kpi], batch_count, ci_level)
+         for kpi in truncated],
+        index=truncated.columns, columns=['mean', 'half_width', 'lag_1'])
+    results['mser_warmup'] = warmups
+
+    return warmup, results
+
+
+def run_batch_means(scenario, run_length=3650, batch_count=20,
+                    ci_level=0.95, seed_sequence=None,
+                    warmup_kpis=('asu_patients',)):
+    """
+    Run one long simulation of a scenario (with no fixed warm-up; the audit
+    starts at time zero), then detect warm-up and estimate KPI confidence
+    intervals by batch means (see analyse_batch_means). This replaces paying
+    a fixed warm-up in every replication of a trial.
+    """
+
+    params = copy.copy(scenario)
+    params.sim_warmup = 0
+    params.sim_duration = run_length
+    model = Model(params, seed_sequence)
+    model.run()
+
+    return analyse_batch_means(model, batch_count, ci_level, warmup_kpis)
@@ -0,0 +1,325 @@
+import contextlib
+import copy
+import datetime
+import io
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import simpy
+from joblib import cpu_count
+
+from sim_utils.data import (Data, clear_reference_data_cache,
+                            load_reference_data)
+from sim_utils.model import Model
+from sim_utils.parameters import Scenario
+from sim_utils.replication import Replicator
+
+
+def time_call(function, repeat=3):
+    """Call function `repeat` times; return dictionary of wall times (min,
+    median, max seconds) and the result of the last call"""
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    timing = {'repeat': repeat, 'min': min(times),
+              'median': float(np.median(times)), 'max': max(times)}
+
+    return timing, result
+
+
+def make_synthetic_data(path, scale=4, source='data', penalty=120):
+    """
+    Write a synthetic data set of `scale` copies of the source data (LSOAs
+    and units) to `path`, for benchmarking larger systems. Copies have their
+    own regions, and travel time and distance between copies are increased by
+    `penalty` per copy apart. Existing data of the same scale is reused.
+    """
+
+    marker = os.path.join(path, 'synthetic.txt')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read() == f'{source} x {scale}':
+                return path
+    os.makedirs(path, exist_ok=True)
+
+    def copy_name(names, copy_number, separator=' #'):
+        if copy_number == 0:
+            return list(names)
+        return [f'{name}{separator}{copy_number}' for name in names]
+
+    # Admissions and preferred units (by LSOA)
+    admissions = pd.read_csv(f'{source}/admissions.csv', index_col='LSOA')
+    pref_unit = pd.read_csv(f'{source}/pref_unit.csv', index_col='LSOA')
+    admissions_copies = []
+    pref_unit_copies = []
+    for copy_number in range(scale):
+        df = admissions.copy()
+        df.index = pd.Index(copy_name(df.index, copy_number), name='LSOA')
+        admissions_copies.append(df)
+        df = pref_unit.copy()
+        df.index = pd.Index(copy_name(df.index, copy_number), name='LSOA')
+        df['Preferred_unit_name'] = copy_name(
+            df['Preferred_unit_name'], copy_number)
+        df['Preferred_unit_postcode'] = copy_name(
+            df['Preferred_unit_postcode'], copy_number, '#')
+        pref_unit_copies.append(df)
+    pd.concat(admissions_copies).to_csv(f'{path}/admissions.csv')
+    pd.concat(pref_unit_copies).to_csv(f'{path}/pref_unit.csv')
+
+    # Units (each copy in its own regions)
+    units = pd.read_csv(f'{source}/hospitals.csv', index_col='Unit')
+    region_count = units['region'].max()
+    units_copies = []
+    for copy_number in range(scale):
+        df = units.copy()
+        df.index = pd.Index(copy_name(df.index, copy_number), name='Unit')
+        df['Postcode'] = copy_name(df['Postcode'], copy_number, '#')
+        df['region'] = df['region'] + copy_number * region_count
+        units_copies.append(df)
+    pd.concat(units_copies).to_csv(f'{path}/hospitals.csv')
+
+    # Travel matrices (blocks of copies, with penalty between copies)
+    for matrix in ['time', 'distance']:
+        df = pd.read_csv(f'{source}/{matrix}.csv', index_col='LSOA')
+        columns = []
+        for copy_number in range(scale):
+            columns.extend(copy_name(df.columns, copy_number, '#'))
+        copies_apart = np.abs(np.subtract.outer(
+            np.arange(scale), np.arange(scale)))
+        values = (np.tile(df.values, (scale, scale)) + penalty *
+                  np.kron(copies_apart, np.ones(df.shape)))
+        index = []
+        for copy_number in range(scale):
+            index.extend(copy_name(df.index, copy_number))
+        pd.DataFrame(values, index=pd.Index(index, name='LSOA'),
+                     columns=columns).to_csv(f'{path}/{matrix}.csv')
+
+    with open(marker, 'w') as f:
+        f.write(f'{source} x {scale}')
+
+    return path
+
+
+def get_capacity(scenario, utilisation):
+    """Return dictionary of beds by unit name giving mean utilisation of about
+    `utilisation` (expected occupancy / beds) at each unit"""
+
+    data = Data(scenario)
+    beds = np.ceil(data.get_expected_occupancy() / utilisation)
+
+    return dict(zip(data.units_name, beds.astype(int).tolist()))
+
+
+def benchmark_data(data_path, repeat=3):
+    """Benchmark loading reference data (from compiled matrix cache) and
+    constructing scenario Data"""
+
+    load_reference_data(data_path)
+
+    def load():
+        clear_reference_data_cache(data_path)
+        return load_reference_data(data_path)
+
+    scenario = Scenario(data_path=data_path, allow_non_preferred_asu=True)
+    results = {}
+    results['reference_load'], _ = time_call(load, repeat)
+    results['data_construction'], _ = time_call(
+        lambda: Data(scenario), repeat)
+
+    return results
+
+
+def benchmark_model_run(data_path, utilisations=(None, 0.85, 1.0),
+                        engines=('simpy', 'array'), repeat=3):
+    """Benchmark one Model.run (excluding model construction) at
+    unconstrained capacity (utilisation None) and at mean utilisations"""
+
+    results = {}
+    for utilisation in utilisations:
+        scenario = Scenario(data_path=data_path, allow_non_preferred_asu=True)
+        if utilisation is None:
+            label = 'unconstrained'
+        else:
+            label = f'utilisation_{int(utilisation * 100)}'
+            scenario.unit_capacity = get_capacity(scenario, utilisation)
+        for engine in engines:
+            scenario = copy.copy(scenario)
+            scenario.event_engine = engine
+            models = []
+
+            def run():
+                model = Model(scenario, np.random.SeedSequence(len(models)))
+                models.append(model)
+                start = time.perf_counter()
+                model.run()
+                return time.perf_counter() - start
+
+            # Time model runs only (model construction builds Data), after an
+            # untimed run (e.g. for Numba compilation)
+            run()
+            times = [run() for _ in range(repeat)]
+            results[f'{label}_{engine}'] = {
+                'repeat': repeat, 'min': min(times),
+                'median': float(np.median(times)), 'max': max(times),
+                'patients': models[-1].patient_id_count,
+                'mean_asu_patients': float(
+                    models[-1].global_audit['asu_patients_all'].mean()),
+                'mean_patients_waiting': float(models[-1].global_audit[
+                    'asu_patients_unallocated'].mean())}
+
+    return results
+
+
+def benchmark_replicator(data_path, n_jobs_list=(1, 4, -1), replications=8,
+                         utilisation=0.85, repeat=1):
+    """Benchmark Replicator.run_scenarios (two scenarios) by number of parallel
+    workers (-1 uses all cores)"""
+
+    scenario = Scenario(data_path=data_path)
+    unit_capacity = get_capacity(scenario, utilisation)
+    scenarios = {
+        'no_redirect': Scenario(data_path=data_path,
+                                unit_capacity=unit_capacity),
+        'redirect': Scenario(data_path=data_path, unit_capacity=unit_capacity,
+                             allow_non_preferred_asu=True)}
+
+    results = {}
+    for n_jobs in n_jobs_list:
+        with tempfile.TemporaryDirectory() as output_dir:
+
+            def run():
+                replicator = Replicator(
+                    scenarios, replications, output_dir=output_dir,
+                    n_jobs=n_jobs, seed=0)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    replicator.run_scenarios()
+
+            results[f'n_jobs_{n_jobs}'], _ = time_call(run, repeat)
+            results[f'n_jobs_{n_jobs}']['workers'] = (
+                cpu_count() if n_jobs == -1 else n_jobs)
+            results[f'n_jobs_{n_jobs}']['runs'] = len(scenarios) * replications
+
+    return results
+
+
+def benchmark_pivot_save(data_path, replication_counts=(30, 300, 3000),
+                         output_format='csv', repeat=1):
+    """Benchmark collating and pivoting (Replicator.pivot_results) and saving
+    (Replicator.save_results) results of many replications. Results of one
+    run are copied for each replication, so no model runs are timed."""
+
+    scenario = Scenario(data_path=data_path)
+    scenario.unit_capacity = get_capacity(scenario, 0.85)
+    replicator = Replicator({'base': scenario}, 1, n_jobs=1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_results = replicator.single_run(
+            scenario, 0, np.random.SeedSequence(0))
+
+    results = {}
+    for replications in replication_counts:
+        with tempfile.TemporaryDirectory() as output_dir:
+            replicator = Replicator({'base': scenario}, replications,
+                                    output_dir=output_dir,
+                                    output_format=output_format, n_jobs=1)
+            pivot_times = []
+            for _ in range(repeat):
+                # Copy run results (unpacking adds columns to DataFrames)
+                replicator.trial_output = {'base': [
+                    {key: value.copy() if hasattr(value, 'copy') else value
+                     for key, value in run_results.items()}
+                    for _ in range(replications)]}
+                replicator.trial_results = {
+                    key: [] for key in replicator.trial_results}
+                start = time.perf_counter()
+                replicator.unpack_trial_output()
+                replicator.collate_trial_results()
+                replicator.pivot_results()
+                pivot_times.append(time.perf_counter() - start)
+
+            results[f'pivot_{replications}'] = {
+                'repeat': repeat, 'min': min(pivot_times),
+                'median': float(np.median(pivot_times)),
+                'max': max(pivot_times)}
+            results[f'save_{replications}'], _ = time_call(
+                replicator.save_results, repeat)
+            replicator.trial_output = {}
+
+    return results
+
+
+def get_metadata():
+    """Return dictionary describing the code version and machine"""
+
+    def git(*args):
+        try:
+            return subprocess.run(
+                ['git'] + list(args), capture_output=True, text=True,
+                check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+
+    return {
+        'timestamp': datetime.datetime.now(
+            datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': git('rev-parse', 'HEAD'),
+        'uncommitted_changes': bool(git('status', '--porcelain',
+                                        '--untracked-files=no')),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'simpy': simpy.__version__,
+        'joblib': joblib.__version__,
+        'numba': numba_version}
+
+
+def run_benchmarks(data_paths, quick=False, repeat=3):
+    """
+    Run benchmark suite for each data set (dictionary of data path by label)
+    and return dictionary of metadata and results (JSON serialisable). Quick
+    mode uses fewer repeats, worker counts and replications.
+    """
+
+    if quick:
+        repeat = 1
+        n_jobs_list = (1, -1)
+        replications = 2
+        replication_counts = (30, 300)
+    else:
+        n_jobs_list = (1, 4, -1)
+        replications = 8
+        replication_counts = (30, 300, 3000)
+
+    results = {}
+    for label, data_path in data_paths.items():
+        print(f'Benchmarking {label} data ({data_path})')
+        results[label] = {}
+        for case, function, kwargs in [
+                ('data', benchmark_data, {'repeat': repeat}),
+                ('model_run', benchmark_model_run, {'repeat': repeat}),
+                ('replicator', benchmark_replicator,
+                 {'n_jobs_list': n_jobs_list, 'replications': replications}),
+                ('pivot_save', benchmark_pivot_save,
+                 {'replication_counts': replication_counts})]:
+            print(f'  {case}')
+            results[label][case] = function(data_path, **kwargs)
+
+    return {'metadata': get_metadata(), 'results': results}
@@ -0,0 +1,202 @@
+import glob
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from sim_utils.instrumentation import Instrumentation
+
+# Unit audit results of a run (DataFrames of audit day x unit)
+unit_audit_results = ['occupancy', 'occupancy_percent',
+                      'occupancy_displaced_preferred',
+                      'occupancy_displaced_destination',
+                      'occupancy_waiting_preferred']
+
+# Scalar results of a run
+scalar_results = ['average_wait_time_all', 'average_wait_time_waiters',
+                  'maximum_wait_time']
+
+
+def save_run_results(filename, results, key=''):
+    """
+    Save results of a run (see Replicator.single_run) to a compressed NumPy
+    .npz archive, via a temporary file so readers never see part files.
+    Unit audits holding whole numbers are stored as int32. `key` identifies
+    the run (see Replicator.get_run_key).
+    """
+
+    arrays = {'key': np.array(key)}
+    arrays['global'] = results['global'].to_records(index=False)
+
+    units = results['occupancy'].columns
+    arrays['units'] = np.array([str(unit) for unit in units], dtype=str)
+    for result in unit_audit_results:
+        values = results[result].values
+        arrays[f'{result}_dtype'] = np.array(str(values.dtype))
+        if (values.dtype.kind == 'f' and np.all(np.isfinite(values)) and
+                np.array_equal(values, np.round(values)) and
+                np.abs(values).max(initial=0) < 2 ** 31):
+            values = values.astype(np.int32)
+        arrays[result] = values
+
+    admissions = results['unit_admissions']
+    arrays['unit_admissions'] = admissions.values
+    arrays['unit_admissions_units'] = np.array(
+        [str(unit) for unit in admissions.index], dtype=str)
+    for result in scalar_results:
+        arrays[result] = np.array(results[result], dtype=np.float64)
+
+    instrumentation = results.get('instrumentation')
+    if instrumentation is not None:
+        arrays['instrumentation_counters'] = np.array(
+            [instrumentation.counters[name]
+             for name in Instrumentation.counter_names], dtype=np.int64)
+        arrays['instrumentation_timers'] = np.array(
+            [instrumentation.timers[name]
+             for name in Instrumentation.timer_names], dtype=np.float64)
+
+    temp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(temp_filename, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temp_filename, filename)
+
+
+def load_run_results(filename, key=None):
+    """Return results of a run saved by save_run_results (None if the file
+    is missing or unreadable, or its key differs from `key`)"""
+
+    try:
+        with np.load(filename) as archive:
+            if key is not None and str(archive['key']) != key:
+                return None
+            arrays = {name: archive[name] for name in archive.files}
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        return None
+
+    results = {'global': pd.DataFrame(arrays['global'])}
+    units = list(arrays['units'])
+    for result in unit_audit_results:
+        values = arrays[result].astype(str(arrays[f'{result}_dtype']))
+        results[result] = pd.DataFrame(values, columns=units)
+    results['unit_admissions'] = pd.Series(
+        arrays['unit_admissions'], index=list(arrays['unit_admissions_units']))
+    for result in scalar_results:
+        results[result] = float(arrays[result])
+
+    results['instrumentation'] = None
+    if 'instrumentation_counters' in arrays:
+        instrumentation = Instrumentation()
+        instrumentation.counters = dict(zip(
+            Instrumentation.counter_names,
+            arrays['instrumentation_counters'].tolist()))
+        instrumentation.timers = dict(zip(
+            Instrumentation.timer_names,
+            arrays['instrumentation_timers'].tolist()))
+        results['instrumentation'] = instrumentation
+
+    return results
+
+
+class CheckpointStore(object):
+    """
+    Checkpoints of completed runs of a trial, one compressed .npz file per
+    (scenario, replication) in `{checkpoint_dir}/{scenario}/run_{i}.npz`.
+    Files are written atomically as each run completes (by the worker making
+    the run), so a stopped trial loses only runs in progress. A checkpoint is
+    used only if its key matches the run (same scenario, data, code and
+    seed), so changed scenarios are run again.
+
+    The root seed entropy of the trial is stored in
+    `{checkpoint_dir}/seed_entropy.txt` (see get_seed_entropy), so that a
+    trial resumed without an explicit seed uses the same seeds, and so the
+    same run keys, as the stopped trial.
+
+    methods
+    -------
+    get_seed_entropy:
+        Return stored root seed entropy (storing it on first use)
+    path:
+        Return file path of a run checkpoint
+    save:
+        Save results of a run
+    load:
+        Return results of a run (None if not checkpointed)
+    completed:
+        Return checkpointed replications of a scenario
+    clear:
+        Remove checkpoints
+
+    """
+
+    def __init__(self, checkpoint_dir='./output/checkpoints'):
+        """Constructor method for CheckpointStore"""
+
+        self.checkpoint_dir = checkpoint_dir
+
+    def get_seed_entropy(self, seed=None):
+        """Return root seed entropy of the trial: the stored entropy if
+        resuming, otherwise that of `seed` (fresh entropy if None), which is
+        stored. Raises ValueError if `seed` is given and differs from the
+        stored seed."""
+
+        entropy = np.random.SeedSequence(seed).entropy
+        filename = os.path.join(self.checkpoint_dir, 'seed_entropy.txt')
+        try:
+            with open(filename) as f:
+                stored_entropy = int(f.read())
+        except (OSError, ValueError):
+            stored_entropy = None
+
+        if stored_entropy is None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            temp_filename = f'{filename}.{os.getpid()}.tmp'
+            with open(temp_filename, 'w') as f:
+                f.write(str(entropy))
+            os.replace(temp_filename, filename)
+            return entropy
+
+        if seed is not None and entropy != stored_entropy:
+            raise ValueError(
+                f'Trial seed differs from seed of checkpoints in '
+                f'{self.checkpoint_dir}')
+
+        return stored_entropy
+
+    def path(self, name, replication):
+        """Return file path of run checkpoint (creating directory)"""
+
+        directory = os.path.join(self.checkpoint_dir, str(name))
+        os.makedirs(directory, exist_ok=True)
+
+        return os.path.join(directory, f'run_{replication:05d}.npz')
+
+    def save(self, name, replication, results, key=''):
+        """Save results of a run"""
+
+        save_run_results(self.path(name, replication), results, key)
+
+    def load(self, name, replication, key=None):
+        """Return results of a run (None if not checkpointed, or key does not
+        match)"""
+
+        return load_run_results(self.path(name, replication), key)
+
+    def completed(self, name):
+        """Return sorted list of checkpointed replications of a scenario
+        (keys not checked)"""
+
+        files = glob.glob(os.path.join(self.checkpoint_dir, str(name),
+                                       'run_[0-9]*.npz'))
+
+        return sorted(int(os.path.basename(file)[4:-4]) for file in files)
+
+    def clear(self, name=None):
+        """Remove checkpoints of a scenario (or all scenarios). The stored
+        seed entropy is kept."""
+
+        pattern = os.path.join(self.checkpoint_dir,
+                               '*' if name is None else str(name),
+                               'run_[0-9]*.npz')
+        for file in glob.glob(pattern):
+            os.remove(file)
@@ -1,60 +1,202 @@
+from types import MappingProxyType
+
 import numpy as np
 import pandas as pd
-from pandas.core.reshape.merge import merge
+
+from sim_utils.matrix_cache import load_matrix
+
+
+# Reference data is loaded once per process and shared by all Data objects
+_reference_data_cache = {}
+
+
+def load_reference_data(path='data'):
+    """
+    Return the pre-processed reference data for `path`. Data are read from
+    CSV on first call only; later calls (from any replication or scenario run
+    in the same process) return the same ReferenceData object.
+    """
+
+    if path not in _reference_data_cache:
+        _reference_data_cache[path] = ReferenceData(path)
+
+    return _reference_data_cache[path]
+
+
+def clear_reference_data_cache(path=None):
+    """Remove reference data loaded for `path` (or for all paths), so the
+    next load_reference_data call reads the data again"""
+
+    if path is None:
+        _reference_data_cache.clear()
+    else:
+        _reference_data_cache.pop(path, None)
+
+
+class ReferenceData(object):
+    """
+    Reference data, loaded and pre-processed once per process and shared by
+    all scenarios. Scenario-specific changes (unit mask, jitter, preferred
+    unit override) are applied by Data. The shared data cannot be changed in
+    place: DataFrame attributes return a new copy on each access, arrays are
+    read-only, and lists and mappings are tuples and read-only mappings.
+
+    attributes
+    ----------
+    admissions (DataFrame):
+        Admissions by LSOA (copy)
+    admission_probs (NumPy array):
+        Probability of each LSOA being the source of an admission
+    admission_cum_probs (NumPy array):
+        Cumulative admission probabilities (for sampling LSOA of admission)
+    distance_values (NumPy array):
+        Read-only array of travel distance (LSOA x unit postcode)
+    lsoa_count (int):
+        Number of LSOAs
+    lsoa_list (tuple):
+        LSOA names (in order of admissions data)
+    matrix_index (Index):
+        LSOA names of travel time and distance matrix rows
+    matrix_column_by_postcode (mapping):
+        Travel matrix column by unit postcode (read-only)
+    matrix_postcodes (tuple):
+        Unit postcodes of travel time and distance matrix columns
+    pref_unit (DataFrame):
+        Preferred unit by LSOA (copy)
+    time_values (NumPy array):
+        Read-only array of travel times (LSOA x unit postcode)
+    units (DataFrame):
+        Information on all stroke units, used or not (copy)
+
+    """
+
+    def __init__(self, path='data'):
+        """ReferenceData constructor method"""
+
+        # Load data (shared DataFrames are private; see properties)
+        self._admissions = pd.read_csv(f'{path}/admissions.csv',
+                                       index_col='LSOA')
+        self._pref_unit = pd.read_csv(f'{path}/pref_unit.csv',
+                                      index_col='LSOA')
+        self._units = pd.read_csv(f'{path}/hospitals.csv', index_col='Unit')
+        self._units['Unit_name'] = list(self._units.index)
+
+        # Travel matrices are memory-mapped from a compiled binary cache
+        self.time_values, lsoa, postcodes = load_matrix(f'{path}/time.csv')
+        self.distance_values, distance_lsoa, distance_postcodes = \
+            load_matrix(f'{path}/distance.csv')
+        if not (np.array_equal(lsoa, distance_lsoa) and
+                np.array_equal(postcodes, distance_postcodes)):
+            raise ValueError('Time and distance matrices do not match')
+        self.matrix_index = pd.Index(lsoa, name='LSOA')
+        self.matrix_postcodes = tuple(str(postcode) for postcode in postcodes)
+        self.matrix_column_by_postcode = MappingProxyType({
+            postcode: i for i, postcode in enumerate(self.matrix_postcodes)})
+
+        # Calculate admissions and probabilities by LSOA
+        self.lsoa_count = self._admissions.shape[0]
+        self.lsoa_list = tuple(self._admissions.index)
+        self.total_admissions = self._admissions['admissions'].sum()
+        self.interarrival_interval = 365 / self.total_admissions
+        self.admission_probs = \
+            np.array(self._admissions['admissions']) / self.total_admissions
+        self.admission_probs.setflags(write=False)
+        self.admission_cum_probs = np.cumsum(self.admission_probs)
+        self.admission_cum_probs /= self.admission_cum_probs[-1]
+        self.admission_cum_probs.setflags(write=False)
+
+    @property
+    def admissions(self):
+        """Admissions by LSOA (copy of shared DataFrame)"""
+        return self._admissions.copy()
+
+    @property
+    def pref_unit(self):
+        """Preferred unit by LSOA (copy of shared DataFrame)"""
+        return self._pref_unit.copy()
+
+    @property
+    def units(self):
+        """Information on all stroke units (copy of shared DataFrame)"""
+        return self._units.copy()
 
 
 class Data(object):
     """
-    
+    Scenario view of the shared reference data. Restricts data to used units
+    (overriding unit use if required), overrides unit capacity if required,
+    adds jitter to travel times, and overwrites preferred unit if required.
+
     methods
     -------
     __init__:
         Data constructor method
-    load_data:
-        Loads data
+    get_expected_occupancy:
+        Expected mean occupancy of each unit (offered load)
     order_by_time:
-        Create a dataframe of units sorted by travel time for each LSOA
-    
+        Sort unit indices by travel time for each LSOA
+
     attributes
     ----------
     admissions(DataFrame):
         Admissions by LSOA
     distance_matrix (DataFrame):
         Travel distance from LSOA to all stroke units
+    lsoa_eligible_units (list of NumPy arrays):
+        Units each LSOA (by index) may use for this scenario: preferred unit,
+        then (if allowed) other eligible units in order of travel time
+    lsoa_pref_unit_index (list):
+        Preferred unit index by LSOA index
+    lsoa_region (list):
+        Region (of preferred unit) by LSOA index
     time_matrix (DataFrame):
         Travel time from LSOA to all stroke units (estimated road travel time,
         clear road conditions)
     units (DataFrame):
         Information on stroke units (including mean length of stay)
-    
+
     """
 
-    def __init__(self, params):
-        """Data constructor method"""
+    def __init__(self, params, reference=None, rng=None):
+        """Data constructor method. `rng` (NumPy Generator) is used for travel
+        time jitter."""
 
         # Store model paramters
         self.params = params
 
-        # Load data
-        self.admissions = pd.read_csv('data/admissions.csv', index_col='LSOA')
-        self.pref_unit = pd.read_csv('data/pref_unit.csv', index_col='LSOA')
-        self.units = pd.read_csv('data/hospitals.csv', index_col='Unit')
-        self.units['Unit_name'] = list(self.units.index)
-        self.time_matrix = pd.read_csv('data/time.csv', index_col='LSOA')
-        self.distance_matrix = pd.read_csv('data/distance.csv',
-                                           index_col='LSOA')
-
-        # Add jitter to time matrix to randomise choice of units with same time
-        jitter = np.random.random(self.time_matrix.shape) * 0.1
-        self.time_matrix += jitter
+        # Get shared reference data (loaded once per process)
+        if reference is None:
+            reference = load_reference_data(self.params.data_path)
+        self.reference = reference
+        self.admissions = reference.admissions
+        self.pref_unit = reference.pref_unit
 
         # Get list of used units and restrict data to used units
-        mask = self.units['Use'] == 1
-        used_unit_postcodes = list(self.units.loc[mask].Postcode)
-        self.units = \
-            self.units[self.units['Postcode'].isin(used_unit_postcodes)]
-        self.time_matrix = self.time_matrix[used_unit_postcodes]
-        self.distance_matrix = self.distance_matrix[used_unit_postcodes]
+        units = reference.units
+        use = units['Use']
+        if self.params.unit_use is not None:
+            use = pd.Series([self.params.unit_use.get(name, value)
+                             for name, value in use.items()], index=use.index)
+        mask = use == 1
+        self.units = units.loc[mask].copy()
+        if self.params.unit_capacity is not None:
+            self.units['Capacity'] = [
+                self.params.unit_capacity.get(name, capacity)
+                for name, capacity in self.units['Capacity'].items()]
+        used_unit_postcodes = list(self.units['Postcode'])
+        used_columns = [reference.matrix_column_by_postcode[postcode]
+                        for postcode in used_unit_postcodes]
+        self.distance_matrix = pd.DataFrame(
+            reference.distance_values[:, used_columns],
+            index=reference.matrix_index, columns=used_unit_postcodes)
+
+        # Add jitter to time matrix to randomise choice of units with same time
+        time = reference.time_values[:, used_columns].astype(np.float64)
+        if rng is None:
+            rng = np.random.default_rng()
+        time += rng.random(time.shape) * 0.1
+        self.time_matrix = pd.DataFrame(
+            time, index=reference.matrix_index, columns=used_unit_postcodes)
 
         # Add index to units
         number_of_units = self.units.shape[0]
@@ -65,50 +207,112 @@ class Data(object):
         self.units_name =  list(self.units.index)
         self.units_postcode = list(self.units['Postcode'])
         self.units_capacity = list(self.units['Capacity'])
+        self.units_los_mean = list(self.units['los_mean'])
         self.unit_region = list(self.units['region'])
         self.allow_pool_use = list(self.units['allow_pool_use'])
 
-        # Get preferred units by travel time from LSOAs to unit
-        self.units_by_time = self.order_by_time(self.time_matrix)
-        self.units_index_by_time = self.convert_unit_postocde_to_index()
-        # Calculate admissions and probabilities by LSOA
-        self.lsoa_count = self.admissions.shape[0]
-        self.lsoa_list = list(self.admissions.index)
-        self.total_admissions = self.admissions['admissions'].sum()
-        self.interarrival_interval = 365 / self.total_admissions
-        self.admission_probs = \
-            np.array(self.admissions['admissions']) / self.total_admissions
-        
+        # Get preferred units by travel time from LSOAs to unit (time matrix
+        # columns are in unit index order)
+        units_index_sorted = self.order_by_time(time)
+        self.units_index_by_time = pd.DataFrame(
+            units_index_sorted, index=self.time_matrix.index)
+        self.units_by_time = pd.DataFrame(
+            np.array(used_unit_postcodes)[units_index_sorted],
+            index=self.time_matrix.index)
+
+        # Admissions and probabilities by LSOA
+        self.lsoa_count = reference.lsoa_count
+        self.lsoa_list = list(reference.lsoa_list)
+        self.total_admissions = reference.total_admissions
+        self.interarrival_interval = reference.interarrival_interval
+        self.admission_probs = reference.admission_probs
+        self.admission_cum_probs = reference.admission_cum_probs
+
         # Overwrite preferred unit if required
         if self.params.overwrite_preferred_unit_with_closest:
-            unit_postcode = self.units_by_time[0]
-            self.pref_unit['Preferred_unit_postcode'] = unit_postcode.values
-            _ = pd.DataFrame(unit_postcode).merge(
-                self.units, left_on=0, right_on='Postcode')
-            self.pref_unit['Preferred_unit_name'] = _['Unit_name'].values
+            closest = units_index_sorted[:, 0]
+            self.pref_unit['Preferred_unit_postcode'] = \
+                np.array(self.units_postcode)[closest]
+            self.pref_unit['Preferred_unit_name'] = \
+                np.array(self.units_name)[closest]
+
+        # Preferred unit index and region by LSOA index (admissions order)
+        index_by_name = {name: i for i, name in enumerate(self.units_name)}
+        pref_unit_names = self.pref_unit['Preferred_unit_name'].reindex(
+            self.lsoa_list)
+        self.lsoa_pref_unit_index = [index_by_name.get(name, -1)
+                                     for name in pref_unit_names]
+        admitting = np.array(self.admissions['admissions']) > 0
+        missing = admitting & (np.array(self.lsoa_pref_unit_index) < 0)
+        if missing.any():
+            raise ValueError(
+                'Preferred unit not in use for LSOAs: ' +
+                ', '.join(np.array(self.lsoa_list)[missing][:5]))
+        self.lsoa_region = [
+            self.unit_region[i] if i >= 0 else None
+            for i in self.lsoa_pref_unit_index]
+
+        # Units each LSOA may use (preferred first, then by travel time)
+        self.lsoa_eligible_units = self.get_eligible_units(units_index_sorted)
 
         return
 
-    def convert_unit_postocde_to_index(self):
-        """Convert a table of unit postcode to unit index numbers"""
+    def get_eligible_units(self, units_index_sorted):
+        """
+        For each LSOA (in admissions order) get an int array of units that
+        patients may use: preferred unit first, then (if non-preferred units
+        are allowed) other units in order of travel time, restricted to units
+        allowing pool use and (if required) in the patient's region.
+        """
 
-        # Create lookup DataFrame
-        lookup = self.units[['Postcode', 'Index']]
-        lookup.set_index('Postcode', inplace=True)
-        # Apply lookup
-        postcode_to_index = lambda x: lookup.loc[x]['Index']
-        df = self.units_by_time.applymap(postcode_to_index)
+        pref_unit_index = np.array(self.lsoa_pref_unit_index)
 
-        return df
+        if not self.params.allow_non_preferred_asu:
+            return [np.array([unit]) for unit in pref_unit_index]
 
+        # Reorder units by travel time from time matrix order to LSOA order
+        matrix_rows = self.reference.matrix_index.get_indexer(self.lsoa_list)
+        if (matrix_rows < 0).any():
+            raise ValueError('LSOAs missing from travel time matrix')
+        sorted_units = units_index_sorted[matrix_rows]
 
-    @staticmethod
-    def order_by_time(matrix):
-        """For each location, sort hospitals by travel time"""
+        # Mask of eligible non-preferred units (in order of travel time)
+        unit_region = np.array(self.unit_region)
+        allow_pool_use = np.array(self.allow_pool_use) == 1
+        eligible = allow_pool_use[sorted_units]
+        eligible &= sorted_units != pref_unit_index[:, np.newaxis]
+        if self.params.restrict_non_preferred_to_regions:
+            eligible &= (unit_region[sorted_units] ==
+                         unit_region[pref_unit_index][:, np.newaxis])
 
-        units = np.array(list(matrix))
-        time = matrix.values
-        argsorted = units[np.argsort(time, axis=1)]
-        df = pd.DataFrame(argsorted, index=matrix.index)
+        lsoa_eligible_units = [
+            np.concatenate(([pref_unit_index[i]],
+                            sorted_units[i][eligible[i]]))
+            for i in range(self.lsoa_count)]
+
+        return lsoa_eligible_units
+
+    def get_expected_occupancy(self):
+        """
+        Return expected mean occupancy (offered load, in beds) of each unit if
+        all ASU patients use their preferred unit: admissions per day to the
+        unit x proportion requiring ASU x mean length of stay.
+        """
+
+        admissions_per_day = (self.total_admissions *
+                              self.params.scale_admissions / 365)
+        pref_unit_index = np.array(self.lsoa_pref_unit_index)
+        admitting = pref_unit_index >= 0
+        unit_share = np.bincount(
+            pref_unit_index[admitting],
+            weights=self.admission_probs[admitting],
+            minlength=len(self.units_index))
+
+        return (unit_share * admissions_per_day * self.params.require_asu *
+                np.array(self.units_los_mean))
+
+    @staticmethod
+    def order_by_time(time):
+        """For each location, sort unit indices by travel time"""
 
-        return df
+        return np.argsort(time, axis=1)
@@ -0,0 +1,329 @@
+import heapq
+import math
+
+import numpy as np
+
+from sim_utils.unconstrained import draw_patients
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+# Positions of tracker fields in tracker array (Audit.global_audit_keys order)
+TOTAL_PATIENTS = 0
+TOTAL_PATIENTS_ASU = 1
+TOTAL_PATIENTS_WAITED = 2
+TOTAL_PATIENTS_DISPLACED = 3
+CURRENT_PATIENTS = 4
+CURRENT_ASU_PATIENTS_ALL = 5
+CURRENT_ASU_PATIENTS_ALLOCATED = 6
+CURRENT_ASU_PATIENTS_UNALLOCATED = 7
+CURRENT_ASU_PATIENTS_DISPLACED = 8
+TRACKER_SIZE = 9
+
+
+def run_events(arrival_times, patient_lsoa, use_asu, los_normal,
+               lsoa_pref_unit, eligible_start, eligible_units, unit_capacity,
+               unit_los_mean, los_cv, sim_warmup, run_duration, audit_times,
+               queues, queue_head, queue_tail, waiting, patient_unit, time_in,
+               time_allocated, occupancy, displaced_preferred,
+               displaced_destination, waiting_preferred, unit_admissions,
+               tracker, global_audit, unit_audit, waiting_times):
+    """
+    Event loop of the array engine. Patients are rows of the patient arrays;
+    discharges are held in a binary heap of (time, patient), arrivals are read
+    in order from `arrival_times`, and audits are made at `audit_times` (after
+    any other events at the same time). Allocation follows the SimPy model:
+    preferred unit, then first eligible unit with a spare bed, otherwise the
+    patient joins a first in, first out queue at each eligible unit, and a
+    bed released at a unit passes to the first patient still waiting in its
+    queue.
+
+    All arguments are arrays (or lists) and are updated in place, so the same
+    code runs as plain Python on lists or compiled by Numba on NumPy arrays.
+    Unit audits are flat arrays (audit row, audit type, unit), and the global
+    audit is flat (audit row, tracker field). Returns the number of audit rows
+    and the number of waiting times recorded.
+    """
+
+    number_units = len(unit_capacity)
+    patient_count = len(arrival_times)
+    audit_count = len(audit_times)
+    queue_length = len(queues) // number_units
+    heap = [(math.inf, -1)]
+    next_patient = 0
+    audit_row = 0
+    waiting_count = 0
+
+    while True:
+        if next_patient < patient_count:
+            arrival_time = arrival_times[next_patient]
+        else:
+            arrival_time = math.inf
+        discharge_time = heap[0][0]
+        if audit_row < audit_count:
+            audit_time = audit_times[audit_row]
+        else:
+            audit_time = math.inf
+        now = min(arrival_time, discharge_time)
+
+        # Audit (after all events up to and including audit time)
+        if audit_time < now:
+            row = audit_row * TRACKER_SIZE
+            for field in range(TRACKER_SIZE):
+                global_audit[row + field] = tracker[field]
+            row = audit_row * 4 * number_units
+            for unit in range(number_units):
+                unit_audit[row + unit] = occupancy[unit]
+                unit_audit[row + number_units + unit] = \
+                    displaced_preferred[unit]
+                unit_audit[row + 2 * number_units + unit] = \
+                    displaced_destination[unit]
+                unit_audit[row + 3 * number_units + unit] = \
+                    waiting_preferred[unit]
+            audit_row += 1
+            continue
+
+        if now >= run_duration:
+            break
+        after_warmup = now >= sim_warmup
+        allocate_patient = -1
+        allocate_unit = -1
+
+        if discharge_time <= arrival_time:
+            # Discharge from ASU, and release bed
+            patient = heapq.heappop(heap)[1]
+            unit = patient_unit[patient]
+            pref_unit = lsoa_pref_unit[patient_lsoa[patient]]
+            tracker[CURRENT_ASU_PATIENTS_ALL] -= 1
+            tracker[CURRENT_ASU_PATIENTS_ALLOCATED] -= 1
+            if unit != pref_unit:
+                displaced_preferred[pref_unit] -= 1
+                displaced_destination[unit] -= 1
+                tracker[CURRENT_ASU_PATIENTS_DISPLACED] -= 1
+            tracker[CURRENT_PATIENTS] -= 1
+            occupancy[unit] -= 1
+
+            # Pass bed to first patient still waiting for this unit
+            while queue_head[unit] < queue_tail[unit]:
+                waiter = queues[unit * queue_length + queue_head[unit]]
+                queue_head[unit] += 1
+                if waiting[waiter]:
+                    allocate_patient = waiter
+                    allocate_unit = unit
+                    break
+
+        else:
+            # Patient arrival
+            patient = next_patient
+            next_patient += 1
+            if after_warmup:
+                tracker[TOTAL_PATIENTS] += 1
+            if use_asu[patient]:
+                lsoa = patient_lsoa[patient]
+                pref_unit = lsoa_pref_unit[lsoa]
+                time_in[patient] = now
+                if after_warmup:
+                    tracker[TOTAL_PATIENTS_ASU] += 1
+                tracker[CURRENT_PATIENTS] += 1
+                tracker[CURRENT_ASU_PATIENTS_ALL] += 1
+                tracker[CURRENT_ASU_PATIENTS_UNALLOCATED] += 1
+                waiting_preferred[pref_unit] += 1
+
+                # Find bed (preferred unit first), or join unit queues
+                if occupancy[pref_unit] < unit_capacity[pref_unit]:
+                    allocate_unit = pref_unit
+                else:
+                    for i in range(eligible_start[lsoa] + 1,
+                                   eligible_start[lsoa + 1]):
+                        unit = eligible_units[i]
+                        if occupancy[unit] < unit_capacity[unit]:
+                            allocate_unit = unit
+                            break
+                if allocate_unit >= 0:
+                    allocate_patient = patient
+                else:
+                    waiting[patient] = True
+                    for i in range(eligible_start[lsoa],
+                                   eligible_start[lsoa + 1]):
+                        unit = eligible_units[i]
+                        queues[unit * queue_length + queue_tail[unit]] = \
+                            patient
+                        queue_tail[unit] += 1
+
+        # Allocate bed, record allocation, and schedule discharge
+        if allocate_patient >= 0:
+            patient = allocate_patient
+            unit = allocate_unit
+            pref_unit = lsoa_pref_unit[patient_lsoa[patient]]
+            waiting[patient] = False
+            patient_unit[patient] = unit
+            time_allocated[patient] = now
+            occupancy[unit] += 1
+            tracker[CURRENT_ASU_PATIENTS_ALLOCATED] += 1
+            tracker[CURRENT_ASU_PATIENTS_UNALLOCATED] -= 1
+            waiting_preferred[pref_unit] -= 1
+            if unit != pref_unit:
+                displaced_preferred[pref_unit] += 1
+                displaced_destination[unit] += 1
+                tracker[CURRENT_ASU_PATIENTS_DISPLACED] += 1
+            if after_warmup:
+                unit_admissions[unit] += 1
+                if unit != pref_unit:
+                    tracker[TOTAL_PATIENTS_DISPLACED] += 1
+            waiting_time = now - time_in[patient]
+            if waiting_time > 0 and after_warmup:
+                tracker[TOTAL_PATIENTS_WAITED] += 1
+                waiting_times[waiting_count] = waiting_time
+                waiting_count += 1
+            los_mean = unit_los_mean[unit]
+            los_sd = los_mean * los_cv
+            los = max(los_mean + los_sd * los_normal[patient], 0.01)
+            heapq.heappush(heap, (now + los, patient))
+
+    return audit_row, waiting_count
+
+
+# Compiled event loop (if Numba is installed)
+if njit is not None:
+    run_events_compiled = njit(cache=True)(run_events)
+else:
+    run_events_compiled = None
+
+
+def run_event_engine(model, compiled=None):
+    """
+    Run a model with the array event engine instead of SimPy. Patients are
+    drawn as arrays for the whole run (see unconstrained.draw_patients), so a
+    run reproduces the SimPy model with the same seed sequence, and results
+    (audits, unit admissions, trackers and waiting times) are written back to
+    the model. The event loop is compiled with Numba if available (or if
+    `compiled` is True); otherwise it runs as plain Python on lists.
+    """
+
+    params = model.params
+    data = model.data
+    number_units = len(data.units_capacity)
+    run_duration = params.sim_warmup + params.sim_duration
+    if compiled is None:
+        compiled = run_events_compiled is not None
+    if compiled and run_events_compiled is None:
+        raise ImportError('Numba is required for the compiled event engine')
+
+    arrival_times, patient_lsoa, los_normal, use_asu = draw_patients(model)
+    patient_count = len(arrival_times)
+    audit_times = np.arange(np.ceil(run_duration))
+    audit_times = audit_times[
+        (audit_times >= params.sim_warmup) & (audit_times < run_duration)]
+    audit_count = len(audit_times)
+
+    # Eligible units by LSOA (concatenated, with start position of each LSOA)
+    eligible_lengths = [len(units) for units in data.lsoa_eligible_units]
+    eligible_start = np.concatenate(([0], np.cumsum(eligible_lengths)))
+    eligible_units = np.concatenate(data.lsoa_eligible_units)
+
+    # Unit queues hold at most one entry per ASU patient
+    queue_length = max(int(use_asu.sum()), 1)
+
+    arrays = {
+        'arrival_times': arrival_times,
+        'patient_lsoa': patient_lsoa.astype(np.int64),
+        'use_asu': use_asu,
+        'los_normal': los_normal,
+        'lsoa_pref_unit': np.array(data.lsoa_pref_unit_index, dtype=np.int64),
+        'eligible_start': eligible_start.astype(np.int64),
+        'eligible_units': eligible_units.astype(np.int64),
+        'unit_capacity': np.array(data.units_capacity, dtype=np.float64),
+        'unit_los_mean': np.array(data.units_los_mean, dtype=np.float64),
+        'audit_times': audit_times,
+        'queues': np.zeros(number_units * queue_length, dtype=np.int64),
+        'queue_head': np.zeros(number_units, dtype=np.int64),
+        'queue_tail': np.zeros(number_units, dtype=np.int64),
+        'waiting': np.zeros(patient_count, dtype=np.bool_),
+        'patient_unit': np.full(patient_count, -1, dtype=np.int64),
+        'time_in': np.zeros(patient_count),
+        'time_allocated': np.full(patient_count, np.nan),
+        'occupancy': np.zeros(number_units),
+        'displaced_preferred': np.zeros(number_units),
+        'displaced_destination': np.zeros(number_units),
+        'waiting_preferred': np.zeros(number_units),
+        'unit_admissions': np.zeros(number_units),
+        'tracker': np.zeros(TRACKER_SIZE, dtype=np.int64),
+        'global_audit': np.zeros(audit_count * TRACKER_SIZE, dtype=np.int64),
+        'unit_audit': np.zeros(audit_count * 4 * number_units),
+        'waiting_times': np.zeros(patient_count)}
+
+    # Plain Python is much faster on lists than on NumPy arrays
+    if compiled:
+        run = run_events_compiled
+    else:
+        run = run_events
+        arrays = {key: value.tolist() for key, value in arrays.items()}
+
+    audit_count, waiting_count = run(
+        los_cv=params.los_cv, sim_warmup=params.sim_warmup,
+        run_duration=run_duration, **arrays)
+    arrays = {key: np.asarray(value) for key, value in arrays.items()}
+
+    # Write audits
+    audit = model.audit
+    audit.global_audit_index_count = audit_count
+    global_audit = audit.global_audit[:audit_count]
+    global_audit['index'] = np.arange(1, audit_count + 1)
+    global_audit['time'] = audit_times[:audit_count]
+    tracker_audit = arrays['global_audit'].reshape(audit_count, TRACKER_SIZE)
+    for field, (name, _) in enumerate(audit.global_audit_keys):
+        global_audit[name] = tracker_audit[:, field]
+    unit_audit = arrays['unit_audit'].reshape(audit_count, 4, number_units)
+    audit.audit_unit_occupancy[:audit_count] = unit_audit[:, 0]
+    audit.audit_unit_occupancy_displaced_preferred[:audit_count] = \
+        unit_audit[:, 1]
+    audit.audit_unit_occupancy_displaced_destination[:audit_count] = \
+        unit_audit[:, 2]
+    audit.audit_unit_occupancy_waiting_preferred[:audit_count] = \
+        unit_audit[:, 3]
+
+    # End of run state
+    model.unit_occupancy = arrays['occupancy']
+    model.unit_has_spare_bed = model.unit_occupancy < model.unit_capacity
+    model.unit_occupancy_displaced_preferred = arrays['displaced_preferred']
+    model.unit_occupancy_displaced_destination = \
+        arrays['displaced_destination']
+    model.unit_occupancy_waiting_preferred = arrays['waiting_preferred']
+    model.unit_admissions = arrays['unit_admissions']
+    model.patient_id_count = patient_count
+    for field, (_, key) in enumerate(audit.global_audit_keys):
+        model.tracker[key] = int(arrays['tracker'][field])
+    model.tracker['patient_waiting_time'] = \
+        arrays['waiting_times'][:waiting_count].tolist()
+
+    # Patient log (patients arriving after warm-up)
+    if model.patient_log is not None:
+        logged = arrival_times >= params.sim_warmup
+        pref_unit = arrays['lsoa_pref_unit'][patient_lsoa]
+        asu_unit = arrays['patient_unit']
+        allocated = asu_unit >= 0
+        los_mean = arrays['unit_los_mean'][np.where(allocated, asu_unit, 0)]
+        los_sd = los_mean * params.los_cv
+        los = np.where(
+            allocated, np.maximum(los_mean + los_sd * los_normal, 0.01),
+            np.nan)
+        time_out = arrays['time_allocated'] + los
+        time_out[time_out >= run_duration] = np.nan
+        time_out[~use_asu] = arrival_times[~use_asu]
+        model.patient_log.add_records(
+            id=np.arange(1, patient_count + 1)[logged],
+            lsoa_index=patient_lsoa[logged],
+            pref_unit_index=pref_unit[logged],
+            asu_unit_index=asu_unit[logged],
+            use_asu=use_asu[logged],
+            displaced=(allocated & (asu_unit != pref_unit))[logged],
+            time_in=arrival_times[logged],
+            time_asu_allocated=arrays['time_allocated'][logged],
+            waiting_time=(arrays['time_allocated'] - arrival_times)[logged],
+            los_asu=los[logged],
+            time_out=time_out[logged])
+
+    return
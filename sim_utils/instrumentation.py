@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class Instrumentation(object):
+    """
+    Counters and timers for phases of model runs (used if Scenario.instrument
+    is True; models otherwise hold None and skip all instrumentation).
+    Instrumentation of several runs may be combined with `add`. Runs without
+    SimPy (unconstrained fast path or array engine) count arrivals and audits
+    only.
+
+    Counters
+    --------
+    arrivals:
+        Patient arrivals
+    allocation_attempts:
+        Searches for an ASU bed on arrival
+    failed_searches:
+        Searches finding no spare bed (patient waits)
+    wake_ups:
+        Waiting patients allocated a bed released at discharge
+    discharges:
+        Discharges from ASU
+    audit_ticks:
+        Daily audits recorded
+
+    Timers (seconds)
+    ----------------
+    data:
+        Scenario data construction
+    simulation:
+        Model run (excluding end of run routine)
+    audit:
+        Audits (SimPy engine only)
+    end_run:
+        End of run routine
+    dataframes:
+        Construction of result DataFrames (Replicator runs)
+
+    methods
+    -------
+    count:
+        Add to a counter
+    timer:
+        Context manager adding elapsed time to a timer
+    add:
+        Add counters and timers of another Instrumentation object
+    summary:
+        Return dictionary of counters, timers and events per second
+
+    """
+
+    counter_names = ['arrivals', 'allocation_attempts', 'failed_searches',
+                     'wake_ups', 'discharges', 'audit_ticks']
+
+    timer_names = ['data', 'simulation', 'audit', 'end_run', 'dataframes']
+
+    def __init__(self):
+        """Constructor method for Instrumentation"""
+
+        self.runs = 1
+        self.counters = dict.fromkeys(self.counter_names, 0)
+        self.timers = dict.fromkeys(self.timer_names, 0.0)
+
+    def count(self, name, n=1):
+        """Add n to counter"""
+
+        self.counters[name] += n
+
+    @contextmanager
+    def timer(self, name):
+        """Context manager adding elapsed (wall) time to timer"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - start
+
+    @property
+    def events(self):
+        """Number of simulation events (arrivals, discharges, wake-ups and
+        audits)"""
+
+        return (self.counters['arrivals'] + self.counters['discharges'] +
+                self.counters['wake_ups'] + self.counters['audit_ticks'])
+
+    def add(self, other):
+        """Add counters, timers and run count of another Instrumentation"""
+
+        self.runs += other.runs
+        for name in self.counter_names:
+            self.counters[name] += other.counters[name]
+        for name in self.timer_names:
+            self.timers[name] += other.timers[name]
+
+    def summary(self):
+        """Return dictionary of run count, counters, timers (`{name}_time`)
+        and simulation events per second"""
+
+        summary = {'runs': self.runs}
+        summary.update(self.counters)
+        for name in self.timer_names:
+            summary[f'{name}_time'] = self.timers[name]
+        simulation_time = self.timers['simulation']
+        summary['events_per_second'] = (
+            self.events / simulation_time if simulation_time > 0 else 0.)
+
+        return summary
+
+
+def get_instrumentation_report(instrumentation):
+    """Return DataFrame of instrumentation summaries (rows) from a dictionary
+    of Instrumentation objects by scenario name"""
+
+    report = pd.DataFrame.from_dict(
+        {name: item.summary() for name, item in instrumentation.items()},
+        orient='index')
+    report.index.name = 'name'
+
+    return report
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def file_hash(filename):
+    """Return SHA-256 hash of a file"""
+
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def _atomic_save(filename, array):
+    """Save NumPy array via a temporary file so readers never see part files"""
+
+    temp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(temp_filename, 'wb') as f:
+        np.save(f, array, allow_pickle=False)
+    os.replace(temp_filename, filename)
+
+
+def _atomic_write_json(filename, item):
+    """Write JSON via a temporary file so readers never see part files"""
+
+    temp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(temp_filename, 'w') as f:
+        json.dump(item, f)
+    os.replace(temp_filename, filename)
+
+
+def load_matrix(csv_file, cache_dir=None, index_col='LSOA'):
+    """
+    Load an LSOA x unit matrix (e.g. travel time or distance) from a compiled
+    binary cache, building the cache from the CSV if it is missing or stale.
+
+    The cache holds three .npy files: contiguous float32 values, LSOA names and
+    unit postcodes. Values are opened with np.load(mmap_mode='r') so that
+    processes (e.g. joblib workers) share the same pages. The cache is valid
+    if the CSV size and mtime are unchanged, or if the CSV hash is unchanged.
+
+    Returns
+    -------
+    values (NumPy array, read-only memory map):
+        Matrix values (LSOA x unit)
+    lsoa (NumPy array):
+        LSOA names (rows)
+    postcodes (NumPy array):
+        Unit postcodes (columns)
+    """
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(csv_file), 'cache')
+    stem = os.path.join(
+        cache_dir, os.path.splitext(os.path.basename(csv_file))[0])
+    meta_file = f'{stem}.meta.json'
+    values_file = f'{stem}.values.npy'
+    lsoa_file = f'{stem}.lsoa.npy'
+    postcodes_file = f'{stem}.postcodes.npy'
+
+    # Check cache against source CSV
+    stat = os.stat(csv_file)
+    meta = None
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+    valid = (meta is not None and
+             meta['size'] == stat.st_size and
+             meta['mtime_ns'] == stat.st_mtime_ns)
+    if meta is not None and not valid:
+        # mtime may change without content changing (e.g. git checkout)
+        csv_hash = file_hash(csv_file)
+        valid = meta['size'] == stat.st_size and meta['sha256'] == csv_hash
+        if valid:
+            meta['mtime_ns'] = stat.st_mtime_ns
+            _atomic_write_json(meta_file, meta)
+    if valid:
+        valid = all(os.path.exists(filename) for filename in
+                    [values_file, lsoa_file, postcodes_file])
+
+    # Build cache from CSV if necessary
+    if not valid:
+        df = pd.read_csv(csv_file, index_col=index_col)
+        os.makedirs(cache_dir, exist_ok=True)
+        _atomic_save(values_file,
+                     np.ascontiguousarray(df.values, dtype=np.float32))
+        _atomic_save(lsoa_file, np.array(list(df.index), dtype=str))
+        _atomic_save(postcodes_file, np.array(list(df), dtype=str))
+        meta = {
+            'source': os.path.basename(csv_file),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_hash(csv_file)}
+        _atomic_write_json(meta_file, meta)
+
+    values = np.load(values_file, mmap_mode='r')
+    lsoa = np.load(lsoa_file)
+    postcodes = np.load(postcodes_file)
+
+    return values, lsoa, postcodes
+
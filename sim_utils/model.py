@@ -1,10 +1,18 @@
+import copy
+from collections import deque
+from contextlib import nullcontext
+
 import numpy as np
 import pandas as pd
 import simpy
 
 from sim_utils.audit import Audit
 from sim_utils.data import Data
+from sim_utils.event_engine import run_event_engine
+from sim_utils.instrumentation import Instrumentation
 from sim_utils.patient import Patient
+from sim_utils.patient_log import PatientLog
+from sim_utils.unconstrained import capacity_never_binds, run_unconstrained
 
 import warnings
 
@@ -13,28 +21,66 @@ warnings.filterwarnings("ignore")
 
 class Model(object):
 
-    def __init__(self, scenario):
+    def __init__(self, scenario, seed_sequence=None):
         """
-
-
+        Model constructor. Random numbers come from independent streams (for
+        arrivals, patient attributes, length of stay, and travel time jitter
+        used in routing) spawned from `seed_sequence` (a NumPy SeedSequence;
+        fresh entropy is used if None). Passing the same seed sequence to
+        models of different scenarios gives common random numbers.
         """
+        if seed_sequence is None:
+            seed_sequence = np.random.SeedSequence()
+        self.seed_sequence = seed_sequence
+        # Child streams are derived without SeedSequence.spawn, which would
+        # change `seed_sequence` and so give different streams on reuse
+        streams = [np.random.SeedSequence(
+            seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (i,),
+            pool_size=seed_sequence.pool_size) for i in range(4)]
+        (self.rng_arrivals, self.rng_patients, self.rng_los,
+         self.rng_routing) = [np.random.default_rng(stream)
+                              for stream in streams]
+
         self.env = simpy.Environment()
         self.params = scenario
-        self.data = Data(self.params)
-        self.audit = Audit()
-        self.patients = []
+        if self.params.instrument:
+            self.instrumentation = Instrumentation()
+        else:
+            self.instrumentation = None
+        with self.timer('data'):
+            self.data = Data(self.params, rng=self.rng_routing)
+        self.audit = Audit(self.params.sim_duration, self.data.units_capacity)
+        # Patients in the system, by id (for constant time removal)
+        self.patients = {}
+        if self.params.patient_log_level > 0:
+            self.patient_log = PatientLog(
+                self.data.units_name, self.data.lsoa_list,
+                self.params.patient_log_level,
+                self.params.patient_log_chunk_size)
+        else:
+            self.patient_log = None
+        self.lsoa_buffer = []
+        self.lsoa_buffer_position = 0
 
         self.patient_id_count = 0
+        self.next_arrival_time = 0
         # Set up 1D NumPy array for patient counts per unit
         number_hospitals = self.data.units.shape[0]
         self.unit_occupancy = np.zeros(number_hospitals)
         self.unit_admissions = np.zeros(number_hospitals)
 
+        # Bitmap of units with at least one spare bed
+        self.unit_capacity = np.array(self.data.units_capacity)
+        self.unit_has_spare_bed = self.unit_capacity > 0
+
         # Count displaced patients
         self.unit_occupancy_displaced_preferred = np.zeros(number_hospitals)
         self.unit_occupancy_displaced_destination = np.zeros(number_hospitals)
         self.unit_occupancy_waiting_preferred = np.zeros(number_hospitals)
 
+        # Queues (first in, first out) of patients waiting for a bed, by unit
+        self.unit_waiting_queues = [deque() for _ in range(number_hospitals)]
+
         # Set up tracker dictionary (total patients updated after warmup)
         self.tracker = {
             'total_patients': 0,
@@ -49,43 +95,96 @@ class Model(object):
             'patient_waiting_time': []
         }
 
+    def allocate_asu_bed(self, patient, unit):
+        """Allocate patient to a bed in unit, and adjust trackers"""
+
+        displaced = unit != patient.pref_unit_index
+        self.unit_occupancy[unit] += 1
+        self.unit_has_spare_bed[unit] = \
+            self.unit_occupancy[unit] < self.unit_capacity[unit]
+        patient.assigned_asu_index = unit
+        patient.assigned_asu_postcode = self.data.units_postcode[unit]
+        patient.assigned_asu_name = self.data.units_name[unit]
+        patient.waiting_for_asu = False
+        patient.displaced = displaced
+        if displaced:
+            self.unit_occupancy_displaced_preferred[
+                patient.pref_unit_index] += 1
+            self.unit_occupancy_displaced_destination[unit] += 1
+        if self.env.now >= self.params.sim_warmup:
+            self.unit_admissions[unit] += 1
+            if displaced:
+                self.tracker['total_patients_displaced'] += 1
+
+        return
+
     def assign_asu_los(self, patient):
-        """Assign length of stay based on assigned ASU unit"""
+        """Assign length of stay based on assigned ASU unit. Uses the
+        standard normal deviate drawn for the patient on arrival, so that
+        streams stay in step between scenarios."""
 
-        los_mean = self.data.units.iloc[patient.assigned_asu_index]['los_mean']
+        los_mean = self.data.units_los_mean[patient.assigned_asu_index]
         los_sd = los_mean * self.params.los_cv
-        los = max(np.random.normal(los_mean, los_sd), 0.01)
+        los = max(los_mean + los_sd * patient.los_normal, 0.01)
         patient.los_asu = los
 
         return
 
+    @property
+    def global_audit(self):
+        """Global audit DataFrame (built on demand)"""
+        return self.audit.get_global_audit()
+
+    @property
+    def occupancy_audit(self):
+        """Unit occupancy audit DataFrame (built on demand)"""
+        return self.audit.get_unit_audit(
+            self.audit.audit_unit_occupancy, self.data.units_name)
+
+    @property
+    def occupancy_percent_audit(self):
+        """Unit occupancy percent audit DataFrame (built on demand)"""
+        return self.audit.get_unit_audit(
+            self.audit.audit_unit_occupancy_percent, self.data.units_name)
+
+    @property
+    def unit_occupancy_displaced_preferred_audit(self):
+        """Displaced patients by preferred unit audit DataFrame (built on
+        demand)"""
+        return self.audit.get_unit_audit(
+            self.audit.audit_unit_occupancy_displaced_preferred,
+            self.data.units_name)
+
+    @property
+    def unit_occupancy_displaced_destination_audit(self):
+        """Displaced patients by destination unit audit DataFrame (built on
+        demand)"""
+        return self.audit.get_unit_audit(
+            self.audit.audit_unit_occupancy_displaced_destination,
+            self.data.units_name)
+
+    @property
+    def unit_occupancy_waiting_preferred_audit(self):
+        """Waiting patients by preferred unit audit DataFrame (built on
+        demand)"""
+        return self.audit.get_unit_audit(
+            self.audit.audit_unit_occupancy_waiting_preferred,
+            self.data.units_name)
+
     def end_run_routine(self):
         """
         Data handling at end of run
         """
-        self.global_audit = pd.DataFrame(self.audit.global_audit)
-
-        self.occupancy_audit = pd.DataFrame(
-            self.audit.audit_unit_occupancy, columns=self.data.units_name)
+        if self.patient_log is not None:
+            # Log patients still in the system
+            for patient in self.patients.values():
+                if (patient.time_in is not None and
+                        patient.time_in >= self.params.sim_warmup):
+                    self.patient_log.record(patient)
+            self.patient_log.flush()
 
         self.admissions_by_unit = pd.Series(
             self.unit_admissions, index=self.data.units_name)
-
-        self.occupancy_percent_audit = pd.DataFrame(
-            self.audit.audit_unit_occupancy_percent, 
-            columns=self.data.units_name)
-
-        self.unit_occupancy_displaced_preferred_audit = pd.DataFrame(
-            self.audit.audit_unit_occupancy_displaced_preferred,
-            columns=self.data.units_name)
-
-        self.unit_occupancy_displaced_destination_audit = pd.DataFrame(
-            self.audit.audit_unit_occupancy_displaced_destination,
-            columns=self.data.units_name)
-
-        self.unit_occupancy_waiting_preferred_audit = pd.DataFrame(
-            self.audit.audit_unit_occupancy_waiting_preferred,
-            columns=self.data.units_name)
         
         if len(self.tracker['patient_waiting_time']) > 0:
             self.average_wait_time_all = (np.sum(
@@ -105,34 +204,71 @@ class Model(object):
                 self.tracker['patient_waiting_time'])   
         else: self.maximum_wait_time = 0        
 
-    def generate_patient_arrival(self):
+    def find_asu_bed(self, patient):
+        """Return index of unit with a spare bed for patient (preferred unit
+        first, then other eligible units in order of travel time), or None if
+        no eligible unit has a spare bed"""
+
+        # Check preferred unit first
+        if self.unit_has_spare_bed[patient.pref_unit_index]:
+            return patient.pref_unit_index
+
+        # Check other eligible units
+        eligible_units = self.get_eligible_units(patient)
+        if len(eligible_units) > 1:
+            spare = self.unit_has_spare_bed[eligible_units]
+            first_spare = spare.argmax()
+            if spare[first_spare]:
+                return int(eligible_units[first_spare])
+
+        return None
+
+    def next_lsoa_index(self, batch_size=10000):
+        """Return LSOA index of next arrival. LSOAs are sampled in batches
+        from the cumulative admission probabilities."""
+
+        if self.lsoa_buffer_position >= len(self.lsoa_buffer):
+            self.lsoa_buffer = np.searchsorted(
+                self.data.admission_cum_probs,
+                self.rng_arrivals.random(batch_size), side='right').tolist()
+            self.lsoa_buffer_position = 0
+        lsoa_index = self.lsoa_buffer[self.lsoa_buffer_position]
+        self.lsoa_buffer_position += 1
+
+        return lsoa_index
+
+    def generate_patient_arrival(self, first_arrival_delay=0):
         """SimPy process. Generate patients. Assign unit and length of stay.
         Pass patient to hospital bed allocation"""
 
+        if first_arrival_delay > 0:
+            yield self.env.timeout(first_arrival_delay)
+
         # Continuous loop of patient arrivals
         while True:
-            # Put patient attributes in a dictionary, and pass to Patient object
+            # Put patient attributes in a dictionary, and pass to Patient
+            # object
             patient_dict = dict()
             self.patient_id_count += 1
             if self.env.now >= self.params.sim_warmup:
                 self.tracker['total_patients'] += 1
+            if self.instrumentation is not None:
+                self.instrumentation.count('arrivals')
             patient_dict['id'] = self.patient_id_count
-            patient_dict['lsoa_index'] = np.random.choice(
-                range(self.data.lsoa_count), p=self.data.admission_probs)
-            patient_dict['lsoa'] = \
-                self.data.lsoa_list[patient_dict['lsoa_index']]
-            patient_dict['pref_unit_postcode'] = (
-                self.data.pref_unit.loc[patient_dict['lsoa']][
-                    'Preferred_unit_postcode'])
-            patient_dict['pref_unit_name'] = (
-                self.data.pref_unit.loc[patient_dict['lsoa']]
-                ['Preferred_unit_name'])
-            patient_dict['pref_unit_index'] = (
-                self.data.units.loc[patient_dict['pref_unit_name']]['Index'])
-            patient_dict['patient_region'] = (
-                self.data.units.loc[patient_dict['pref_unit_name']]['region'])
-            patient = Patient(patient_dict, self.params)
-            self.patients.append(patient)
+            lsoa_index = self.next_lsoa_index()
+            pref_unit_index = self.data.lsoa_pref_unit_index[lsoa_index]
+            patient_dict['lsoa_index'] = lsoa_index
+            patient_dict['lsoa'] = self.data.lsoa_list[lsoa_index]
+            patient_dict['pref_unit_postcode'] = \
+                self.data.units_postcode[pref_unit_index]
+            patient_dict['pref_unit_name'] = \
+                self.data.units_name[pref_unit_index]
+            patient_dict['pref_unit_index'] = pref_unit_index
+            patient_dict['patient_region'] = \
+                self.data.lsoa_region[lsoa_index]
+            patient_dict['los_normal'] = self.rng_los.standard_normal()
+            patient = Patient(patient_dict, self.params, self.rng_patients)
+            self.patients[patient.id] = patient
 
             # Pass patient to patient journey
             process = self.patient_journey(patient)
@@ -141,6 +277,7 @@ class Model(object):
             # Wait for next patient arrival
             time_to_next = (self.data.interarrival_interval /
                             self.params.scale_admissions)
+            self.next_arrival_time = self.env.now + time_to_next
             yield self.env.timeout(time_to_next)
             # Return to top of while loop
 
@@ -163,117 +300,275 @@ class Model(object):
             self.tracker['current_asu_patients_unallocated'] += 1
             self.unit_occupancy_waiting_preferred[patient.pref_unit_index] += 1
 
-            # Look to allocate patient to unit
-            unallocated = True
-            while unallocated:
-                # Check if preferred unit has capacity
-                capacity = self.data.units_capacity[patient.pref_unit_index]
-                occupied_beds = self.unit_occupancy[patient.pref_unit_index]
-                spare_beds = capacity - occupied_beds
-
-                if spare_beds > 0:
-                    # Spare capacity in preferred unit
-                    self.unit_occupancy[patient.pref_unit_index] += 1
-                    if self.env.now >= self.params.sim_warmup:
-                        self.unit_admissions[patient.pref_unit_index] += 1
-                    patient.assigned_asu_index = patient.pref_unit_index
-                    patient.assigned_asu_postcode = \
-                        self.data.units_postcode[patient.pref_unit_index]
-                    patient.assigned_asu_name = \
-                        self.data.units_name[patient.pref_unit_index]
-                    patient.waiting_for_asu = False
-                    patient.displaced = False
-                    unallocated = False
-
-                # Check other units if allowed
-                elif self.params.allow_non_preferred_asu:
-                    choice_order = list(
-                        self.data.units_index_by_time.loc[patient.lsoa])
-                    for unit in choice_order:
-                        # Check if limited to regions and unit in region
-                        if (self.params.restrict_non_preferred_to_regions and 
-                            self.data.unit_region[unit] != patient.patient_region):
-                            # Skip remainder of loop if unit not in patient region
-                            continue
-                        # Check unit is allowed for pool use
-                        if self.data.allow_pool_use[unit] == 0:
-                            continue
-                        # Calculate number of spare beds
-                        capacity = self.data.units_capacity[unit]
-                        occupied_beds = self.unit_occupancy[unit]
-                        spare_beds = capacity - occupied_beds
-                        if spare_beds > 0:
-                            # Bed available in alternative unit
-                            self.unit_occupancy[unit] += 1
-                            patient.assigned_asu_index = unit
-                            patient.assigned_asu_postcode = \
-                                self.data.units_postcode[unit]
-                            patient.assigned_asu_name = \
-                                self.data.units_name[unit]
-                            patient.waiting_for_asu = False
-                            patient.displaced = True
-                            unallocated = False
-                            self.unit_occupancy_displaced_preferred[
-                                patient.pref_unit_index] += 1
-                            self.unit_occupancy_displaced_destination[unit] += 1
-                            if self.env.now >= self.params.sim_warmup:
-                                self.tracker['total_patients_displaced'] += 1
-                                self.unit_admissions[unit] += 1
-                            # End loop
-                            break
-
-                # Wait for 0.25 day before searching again (if necessary)
-                if unallocated:
-                    yield self.env.timeout(0.25)
-
-            # Unit allocated; adjust trackers and patient values
-            self.tracker['current_asu_patients_allocated'] += 1
-            self.tracker['current_asu_patients_unallocated'] -= 1
-            if patient.displaced:
-                self.tracker['current_asu_patients_displaced'] += 1
-            self.unit_occupancy_waiting_preferred[patient.pref_unit_index] -= 1
-            patient.time_asu_allocated = self.env.now
-            patient.time_waiting_for_asu = \
-                patient.time_asu_allocated - patient.time_in
-            patient.waited_for_asu = \
-                True if patient.time_waiting_for_asu > 0 else False
-            if patient.waited_for_asu:
-                if self.env.now >= self.params.sim_warmup:
-                    self.tracker['total_patients_waited'] += 1
-                    self.tracker['patient_waiting_time'].append(
-                        patient.time_waiting_for_asu)
+            # Look to allocate patient to unit, or wait for a bed
+            unit = self.find_asu_bed(patient)
+            if self.instrumentation is not None:
+                self.instrumentation.count('allocation_attempts')
+                if unit is None:
+                    self.instrumentation.count('failed_searches')
+            if unit is not None:
+                self.allocate_asu_bed(patient, unit)
+            else:
+                yield from self.wait_for_asu_bed(patient)
+            self.record_asu_allocation(patient)
 
             # Stay in ASU
             self.assign_asu_los(patient)
-            yield self.env.timeout(patient.los_asu)
+            yield from self.asu_stay(patient, patient.los_asu)
+
+        # TODO Add ESD?
 
-            # End of ASU; adjust trackers
-            self.tracker['current_asu_patients_all'] -= 1
-            self.tracker['current_asu_patients_allocated'] -= 1
-            self.unit_occupancy[patient.assigned_asu_index] -= 1
+        self.end_patient_journey(patient)
 
-            if patient.displaced:
-                self.unit_occupancy_displaced_preferred[
-                patient.pref_unit_index] -= 1
-                self.unit_occupancy_displaced_destination[
-                patient.assigned_asu_index] -= 1
-                self.tracker['current_asu_patients_displaced'] -= 1
+    def resume_patient_journey(self, patient):
+        """SimPy process. Continue journey of an ASU patient restored from a
+        snapshot (either waiting for a bed, or in a bed)"""
 
-        # TODO Add ESD?
+        if patient.waiting_for_asu:
+            unit = self.find_asu_bed(patient)
+            if unit is not None:
+                self.allocate_asu_bed(patient, unit)
+            else:
+                yield from self.wait_for_asu_bed(patient)
+            self.record_asu_allocation(patient)
+            self.assign_asu_los(patient)
+            remaining_los = patient.los_asu
+        else:
+            remaining_los = (patient.time_asu_allocated + patient.los_asu -
+                             self.env.now)
+
+        yield from self.asu_stay(patient, remaining_los)
+        self.end_patient_journey(patient)
+
+    def wait_for_asu_bed(self, patient):
+        """Join the waiting queues of eligible units and wait for a bed to be
+        passed on at discharge (see release_asu_bed)"""
+
+        patient.waiting_for_asu = True
+        patient.bed_allocated = self.env.event()
+        for unit in self.get_eligible_units(patient):
+            self.unit_waiting_queues[unit].append(patient)
+        yield patient.bed_allocated
+
+    def record_asu_allocation(self, patient):
+        """Unit allocated; adjust trackers and patient values"""
+
+        self.tracker['current_asu_patients_allocated'] += 1
+        self.tracker['current_asu_patients_unallocated'] -= 1
+        if patient.displaced:
+            self.tracker['current_asu_patients_displaced'] += 1
+        self.unit_occupancy_waiting_preferred[patient.pref_unit_index] -= 1
+        patient.time_asu_allocated = self.env.now
+        patient.time_waiting_for_asu = \
+            patient.time_asu_allocated - patient.time_in
+        patient.waited_for_asu = \
+            True if patient.time_waiting_for_asu > 0 else False
+        if patient.waited_for_asu:
+            if self.env.now >= self.params.sim_warmup:
+                self.tracker['total_patients_waited'] += 1
+                self.tracker['patient_waiting_time'].append(
+                    patient.time_waiting_for_asu)
+
+    def asu_stay(self, patient, duration):
+        """Stay in ASU for duration, then adjust trackers and release bed"""
+
+        yield self.env.timeout(duration)
+
+        # End of ASU; adjust trackers
+        if self.instrumentation is not None:
+            self.instrumentation.count('discharges')
+        self.tracker['current_asu_patients_all'] -= 1
+        self.tracker['current_asu_patients_allocated'] -= 1
+
+        if patient.displaced:
+            self.unit_occupancy_displaced_preferred[
+            patient.pref_unit_index] -= 1
+            self.unit_occupancy_displaced_destination[
+            patient.assigned_asu_index] -= 1
+            self.tracker['current_asu_patients_displaced'] -= 1
+        self.release_asu_bed(patient.assigned_asu_index)
+
+    def end_patient_journey(self, patient):
+        """End of patient journey"""
 
-        # End of patient journey
         self.tracker['current_patients'] -= 1
-        self.patients.remove(patient)
-        del patient
+        del self.patients[patient.id]
+        if (self.patient_log is not None and
+                patient.time_in >= self.params.sim_warmup):
+            self.patient_log.record(patient, self.env.now)
+
+    def get_eligible_units(self, patient):
+        """Return array of units patient may use: preferred unit, then (if
+        allowed) other units in order of travel time"""
+
+        return self.data.lsoa_eligible_units[patient.lsoa_index]
+
+    def release_asu_bed(self, unit):
+        """Release a bed in unit. If the unit is then below capacity, the bed
+        passes to the longest-waiting patient (first in, first out) queued for
+        that unit, if any. (A unit resumed from a snapshot of a scenario with
+        more beds may be above capacity; it takes no patients until below.)"""
+
+        self.unit_occupancy[unit] -= 1
+        self.unit_has_spare_bed[unit] = \
+            self.unit_occupancy[unit] < self.unit_capacity[unit]
+        if not self.unit_has_spare_bed[unit]:
+            return
+
+        # Queues may hold patients already allocated to another unit; skip them
+        queue = self.unit_waiting_queues[unit]
+        while queue:
+            patient = queue.popleft()
+            if patient.waiting_for_asu:
+                self.allocate_asu_bed(patient, unit)
+                patient.bed_allocated.succeed()
+                if self.instrumentation is not None:
+                    self.instrumentation.count('wake_ups')
+                break
 
-    def run(self):
-        # Initialise processes that will run on model run.
-        self.env.process(self.generate_patient_arrival())
-        self.env.process(self.audit.perform_global_audit(self))
+        return
 
-        # Run
-        run_duration = self.params.sim_warmup + self.params.sim_duration
-        self.env.run(until=run_duration)
+    def restore_snapshot(self, snapshot, restore_rng=False):
+        """
+        Restore model state from a snapshot (see take_snapshot), and start
+        arrival and patient processes from the snapshot time. Random number
+        streams are only restored if `restore_rng` is True, so that runs
+        resumed from the same snapshot are independent by default. The
+        snapshot must be of the same units and unit capacities (so no unit
+        starts above capacity).
+        """
+
+        if snapshot['units_postcode'] != self.data.units_postcode:
+            raise ValueError('Snapshot units do not match scenario units')
+        if not np.array_equal(snapshot['unit_capacity'], self.unit_capacity):
+            raise ValueError(
+                'Snapshot unit capacities do not match scenario capacities')
+        if np.any(snapshot['unit_occupancy'] > self.unit_capacity):
+            raise ValueError('Snapshot unit occupancy exceeds capacity')
+
+        self.env = simpy.Environment(initial_time=snapshot['time'])
+        self.patient_id_count = snapshot['patient_id_count']
+        self.unit_occupancy = snapshot['unit_occupancy'].copy()
+        self.unit_occupancy_displaced_preferred = \
+            snapshot['unit_occupancy_displaced_preferred'].copy()
+        self.unit_occupancy_displaced_destination = \
+            snapshot['unit_occupancy_displaced_destination'].copy()
+        self.unit_occupancy_waiting_preferred = \
+            snapshot['unit_occupancy_waiting_preferred'].copy()
+        self.unit_has_spare_bed = self.unit_occupancy < self.unit_capacity
+        self.tracker = copy.deepcopy(snapshot['tracker'])
+
+        if restore_rng:
+            for name, state in snapshot['rng_state'].items():
+                getattr(self, name).bit_generator.state = state
+            self.lsoa_buffer = list(snapshot['lsoa_buffer'])
+            self.lsoa_buffer_position = snapshot['lsoa_buffer_position']
+
+        # Restart patient journeys (in order of arrival, to keep waiting
+        # queues first in, first out) and arrivals
+        for state in sorted(snapshot['patients'], key=lambda x: x['id']):
+            patient = Patient.from_state(state, self.params)
+            self.patients[patient.id] = patient
+            self.env.process(self.resume_patient_journey(patient))
+        first_arrival_delay = snapshot['next_arrival_time'] - snapshot['time']
+        self.env.process(self.generate_patient_arrival(first_arrival_delay))
+
+    def run(self, snapshot=None, restore_rng=False):
+        """Run model. If a snapshot (see run_warmup) is given, the run resumes
+        from the snapshot rather than simulating the warm-up period (with the
+        snapshot's random number streams if restore_rng is True, which
+        reproduces a run from the start with the same seed). If unit
+        capacity can never bind, the run is computed with arrays rather than
+        simulated (see sim_utils.unconstrained), unless the scenario sets
+        unconstrained_fast_path to False. Scenario event_engine 'array' runs
+        the model with the array event engine (see sim_utils.event_engine)
+        rather than SimPy (runs from a snapshot always use SimPy)."""
+
+        if self.params.event_engine not in ('simpy', 'array'):
+            raise ValueError(
+                f'Unknown event engine {self.params.event_engine!r}')
+
+        with self.timer('simulation'):
+            if (snapshot is None and self.params.unconstrained_fast_path and
+                    capacity_never_binds(self)):
+                # Unconstrained capacity: vectorised fast path
+                run_unconstrained(self)
+                self.count_array_run()
+            elif snapshot is None and self.params.event_engine == 'array':
+                # Array event engine
+                run_event_engine(self)
+                self.count_array_run()
+            else:
+                # Initialise processes that will run on model run.
+                if snapshot is None:
+                    self.env.process(self.generate_patient_arrival())
+                else:
+                    self.restore_snapshot(snapshot, restore_rng)
+                self.env.process(self.audit.perform_global_audit(self))
+
+                # Run
+                self.env.run(
+                    until=self.params.sim_warmup + self.params.sim_duration)
 
         # End of run
-        self.end_run_routine()
+        with self.timer('end_run'):
+            self.end_run_routine()
+
+    def count_array_run(self):
+        """Add arrivals and audits of a run without SimPy (fast path or array
+        engine) to instrumentation counters"""
+
+        if self.instrumentation is not None:
+            self.instrumentation.count('arrivals', self.patient_id_count)
+            self.instrumentation.count(
+                'audit_ticks', self.audit.global_audit_index_count)
+
+    def run_warmup(self):
+        """Run warm-up period only, and return snapshot of model state at the
+        end of warm-up (from which runs may be resumed)"""
+
+        self.env.process(self.generate_patient_arrival())
+        self.env.run(until=self.params.sim_warmup)
+
+        return self.take_snapshot()
+
+    def timer(self, name):
+        """Return context manager timing a phase of the run (see
+        Instrumentation), or doing nothing if instrumentation is off"""
+
+        if self.instrumentation is None:
+            return nullcontext()
+
+        return self.instrumentation.timer(name)
+
+    def take_snapshot(self):
+        """Return model state as a dictionary (picklable, so snapshots can be
+        passed to parallel workers): unit occupancy, tracker, patients in the
+        system (including remaining length of stay, via allocation time and
+        length of stay), unit capacity, next arrival time and random number
+        stream states"""
+
+        snapshot = {
+            'time': self.env.now,
+            'next_arrival_time': self.next_arrival_time,
+            'patient_id_count': self.patient_id_count,
+            'units_postcode': list(self.data.units_postcode),
+            'unit_capacity': self.unit_capacity.copy(),
+            'unit_occupancy': self.unit_occupancy.copy(),
+            'unit_occupancy_displaced_preferred':
+                self.unit_occupancy_displaced_preferred.copy(),
+            'unit_occupancy_displaced_destination':
+                self.unit_occupancy_displaced_destination.copy(),
+            'unit_occupancy_waiting_preferred':
+                self.unit_occupancy_waiting_preferred.copy(),
+            'tracker': copy.deepcopy(self.tracker),
+            'patients': [patient.get_state()
+                         for patient in self.patients.values()],
+            'lsoa_buffer': list(self.lsoa_buffer),
+            'lsoa_buffer_position': self.lsoa_buffer_position,
+            'rng_state': {
+                name: getattr(self, name).bit_generator.state
+                for name in ['rng_arrivals', 'rng_patients', 'rng_los',
+                             'rng_routing']}}
+
+        return snapshot
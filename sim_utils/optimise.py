@@ -0,0 +1,246 @@
+import copy
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from sim_utils.data import Data
+from sim_utils.model import Model
+
+
+def get_capacity_kpis(model):
+    """
+    Return dictionary of KPIs of a model run used as capacity targets:
+
+    mean_waiting: mean patients waiting for an ASU bed
+    mean_displaced: mean patients in a non-preferred unit
+    mean_wait: mean wait (days) of all ASU patients
+    p95_wait: 95th percentile wait (days) of all ASU patients
+    """
+
+    global_audit = model.global_audit
+    waits = np.array(model.tracker['patient_waiting_time'])
+    no_waits = max(model.tracker['total_patients_asu'] - len(waits), 0)
+    all_waits = np.concatenate((np.zeros(no_waits), waits))
+
+    return {
+        'mean_waiting': global_audit['asu_patients_unallocated'].mean(),
+        'mean_displaced': global_audit['asu_patients_displaced'].mean(),
+        'mean_wait': all_waits.mean() if len(all_waits) > 0 else 0.,
+        'p95_wait': (np.percentile(all_waits, 95)
+                     if len(all_waits) > 0 else 0.)}
+
+
+def run_capacity(scenario, unit_capacity, seed_sequence):
+    """Run model of scenario with beds by unit name, and return KPIs"""
+
+    scenario = copy.copy(scenario)
+    scenario.unit_capacity = unit_capacity
+    model = Model(scenario, seed_sequence)
+    model.run()
+
+    return get_capacity_kpis(model)
+
+
+class CapacityOptimiser(object):
+    """
+    Search for beds by unit that minimise total beds while meeting KPI
+    targets (maximum values of KPIs from get_capacity_kpis, e.g.
+    {'mean_waiting': 1, 'p95_wait': 0.5}), by greedy marginal allocation.
+
+    Capacity starts at expected occupancy / start_utilisation. While targets
+    are not met, a bed is added to the unit giving the smallest target
+    violation. Once targets are met, the removal of a bed from each unit is
+    tried, keeping the removal that leaves the most slack against targets;
+    the search stops when no bed can be removed.
+
+    Candidates are screened with a fast approximate model (array event
+    engine, few and short runs); full replications (scenario engine and
+    duration) are reserved for capacities passing screening. All runs of a
+    set of candidates are made in one pool of parallel workers, with common
+    random numbers across candidates.
+
+    methods
+    -------
+    run:
+        Run search, and return beds by unit name
+    evaluate:
+        Return mean KPIs of capacities (screening or full runs)
+    violation:
+        Return normalised violation of targets
+
+    attributes
+    ----------
+    best_capacity (dict):
+        Beds by unit name of the smallest capacity meeting targets (full runs)
+    best_kpis (dict):
+        Mean KPIs of best capacity (full runs)
+    history (DataFrame):
+        Evaluations (total beds, KPIs, violation, capacity) in order
+
+    """
+
+    def __init__(self, scenario, targets, start_utilisation=0.85,
+                 replications=30, screening_replications=3,
+                 screening_duration=None, confirm_candidates=2,
+                 max_iterations=500, n_jobs=-1, seed=None, min_beds=1):
+        """Constructor method for CapacityOptimiser"""
+
+        self.scenario = scenario
+        self.targets = targets
+        self.replications = replications
+        self.screening_replications = screening_replications
+        self.confirm_candidates = confirm_candidates
+        self.max_iterations = max_iterations
+        self.n_jobs = n_jobs
+        self.seed_entropy = np.random.SeedSequence(seed).entropy
+        self.min_beds = min_beds
+
+        # Screening model: array engine and (optionally) shorter runs
+        self.screening_scenario = copy.copy(scenario)
+        self.screening_scenario.event_engine = 'array'
+        if screening_duration is not None:
+            self.screening_scenario.sim_duration = screening_duration
+
+        # Starting capacity from expected occupancy
+        data = Data(scenario)
+        self.units_name = data.units_name
+        expected_occupancy = data.get_expected_occupancy()
+        self.start_capacity = tuple(np.maximum(
+            np.ceil(expected_occupancy / start_utilisation),
+            min_beds).astype(int).tolist())
+
+        self.evaluations = {}
+        self.history_records = []
+        self.best_capacity = None
+        self.best_kpis = None
+
+    @property
+    def history(self):
+        """Evaluations in order as a DataFrame"""
+
+        return pd.DataFrame(self.history_records)
+
+    def violation(self, kpis):
+        """Return sum over targets of violation (KPI above target) relative
+        to target"""
+
+        violation = 0.
+        for kpi, target in self.targets.items():
+            excess = max(kpis[kpi] - target, 0.)
+            violation += excess / target if target > 0 else excess
+
+        return violation
+
+    def slack(self, kpis):
+        """Return largest KPI as a fraction of its target (lower is more
+        slack)"""
+
+        return max(kpis[kpi] / target if target > 0 else kpis[kpi]
+                   for kpi, target in self.targets.items())
+
+    def evaluate(self, parallel, capacities, screening=True):
+        """
+        Return list of mean KPIs for capacities (tuples of beds, in unit
+        order), running screening or full replications of capacities not
+        already evaluated. Replication i of every capacity uses the same
+        random number streams.
+        """
+
+        if screening:
+            scenario = self.screening_scenario
+            replications = self.screening_replications
+        else:
+            scenario = self.scenario
+            replications = self.replications
+
+        new = [capacity for capacity in dict.fromkeys(capacities)
+               if (capacity, screening) not in self.evaluations]
+        tasks = [(capacity, i) for capacity in new
+                 for i in range(replications)]
+        output = parallel(
+            delayed(run_capacity)(
+                scenario, dict(zip(self.units_name, capacity)),
+                np.random.SeedSequence(
+                    self.seed_entropy, spawn_key=(int(screening), i)))
+            for capacity, i in tasks)
+
+        for capacity in new:
+            runs = [kpis for (task_capacity, _), kpis in zip(tasks, output)
+                    if task_capacity == capacity]
+            kpis = pd.DataFrame(runs).mean().to_dict()
+            self.evaluations[(capacity, screening)] = kpis
+            record = {'screening': screening, 'total_beds': sum(capacity)}
+            record.update(kpis)
+            record['violation'] = self.violation(kpis)
+            record['capacity'] = capacity
+            self.history_records.append(record)
+
+        return [self.evaluations[(capacity, screening)]
+                for capacity in capacities]
+
+    def best_addition(self, parallel, capacity):
+        """Return capacity with one bed added to the unit giving the smallest
+        target violation (screening)"""
+
+        candidates = []
+        for unit in range(len(capacity)):
+            candidate = list(capacity)
+            candidate[unit] += 1
+            candidates.append(tuple(candidate))
+        kpis = self.evaluate(parallel, candidates, screening=True)
+        scores = [(self.violation(item), self.slack(item)) for item in kpis]
+
+        return candidates[scores.index(min(scores))]
+
+    def removal_candidates(self, parallel, capacity):
+        """Return capacities with one bed removed from a unit that meet
+        targets in screening, in order of most slack first"""
+
+        candidates = []
+        for unit in range(len(capacity)):
+            if capacity[unit] > self.min_beds:
+                candidate = list(capacity)
+                candidate[unit] -= 1
+                candidates.append(tuple(candidate))
+        kpis = self.evaluate(parallel, candidates, screening=True)
+        feasible = [(self.slack(item), candidate)
+                    for item, candidate in zip(kpis, candidates)
+                    if self.violation(item) == 0]
+
+        return [candidate for _, candidate in sorted(feasible)]
+
+    def run(self):
+        """Run search, and return beds by unit name of the smallest capacity
+        found meeting targets in full replications (None if not found)"""
+
+        capacity = self.start_capacity
+        with Parallel(n_jobs=self.n_jobs) as parallel:
+            for iteration in range(self.max_iterations):
+                print(f'\r>> Iteration {iteration}, '
+                      f'{sum(capacity)} beds', end='')
+
+                # Add beds until targets are met in screening and full runs
+                screen = self.evaluate(parallel, [capacity], True)[0]
+                if self.violation(screen) > 0:
+                    capacity = self.best_addition(parallel, capacity)
+                    continue
+                full = self.evaluate(parallel, [capacity], False)[0]
+                if self.violation(full) > 0:
+                    capacity = self.best_addition(parallel, capacity)
+                    continue
+                self.best_capacity = dict(zip(self.units_name, capacity))
+                self.best_kpis = full
+
+                # Remove a bed (candidates screened, then confirmed in turn)
+                candidates = self.removal_candidates(parallel, capacity)
+                for candidate in candidates[:self.confirm_candidates]:
+                    full = self.evaluate(parallel, [candidate], False)[0]
+                    if self.violation(full) == 0:
+                        capacity = candidate
+                        break
+                else:
+                    break
+        print()
+
+        return self.best_capacity
@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class ResultSink(object):
+    """
+    Base class for writing and reading result tables. Tables are keyed by
+    result table name and (optionally) scenario name. Tables for a scenario are
+    written to their own sub-directory of the output directory, so that sweeps
+    running in parallel do not overwrite each other's results. Tables with no
+    scenario are written to the output directory itself, so writers sharing
+    it must use different table names (see Replicator trial_name).
+
+    methods
+    -------
+    path:
+        Return file path for a table
+    write:
+        Write a DataFrame
+    read:
+        Read a DataFrame
+
+    """
+
+    extension = None
+
+    def __init__(self, output_dir='./output'):
+        """Constructor method for result sink"""
+
+        self.output_dir = output_dir
+
+    def path(self, table, scenario=None):
+        """Return file path for table (creating directory if necessary)"""
+
+        directory = self.output_dir
+        if scenario is not None:
+            directory = os.path.join(directory, str(scenario))
+        os.makedirs(directory, exist_ok=True)
+
+        return os.path.join(directory, f'{table}.{self.extension}')
+
+    def write(self, table, df, scenario=None):
+        """Write DataFrame"""
+
+        raise NotImplementedError
+
+    def read(self, table, scenario=None):
+        """Read DataFrame"""
+
+        raise NotImplementedError
+
+
+class CsvSink(ResultSink):
+    """Write result tables as CSV"""
+
+    extension = 'csv'
+
+    def write(self, table, df, scenario=None):
+        """Write DataFrame to CSV"""
+
+        df.to_csv(self.path(table, scenario))
+
+    def read(self, table, scenario=None, index_col=0):
+        """Read DataFrame from CSV (pass index_col=[0, 1] for pivots)"""
+
+        return pd.read_csv(self.path(table, scenario), index_col=index_col)
+
+
+class ParquetSink(ResultSink):
+    """Write result tables as Parquet (requires pyarrow or fastparquet)"""
+
+    extension = 'parquet'
+
+    def write(self, table, df, scenario=None):
+        """Write DataFrame to Parquet (column names are stored as strings)"""
+
+        df = df.copy()
+        df.columns = [str(column) for column in df.columns]
+        df.to_parquet(self.path(table, scenario))
+
+    def read(self, table, scenario=None):
+        """Read DataFrame from Parquet"""
+
+        return pd.read_parquet(self.path(table, scenario))
+
+
+class NpzSink(ResultSink):
+    """
+    Write result tables as compressed NumPy .npz archives. Each column and
+    index level is stored as a separate array (object columns as strings), so
+    archives can be read without pickle.
+    """
+
+    extension = 'npz'
+
+    def write(self, table, df, scenario=None):
+        """Write DataFrame to compressed .npz"""
+
+        arrays = {}
+        index = df.index.to_frame(index=False)
+        for i, level in enumerate(index):
+            arrays[f'index_{i}'] = self._to_array(index[level])
+        for i, column in enumerate(df.columns):
+            arrays[f'column_{i}'] = self._to_array(df.iloc[:, i])
+        arrays['index_names'] = np.array(
+            [str(name) for name in df.index.names], dtype=str)
+        arrays['columns'] = np.array(
+            [str(column) for column in df.columns], dtype=str)
+
+        np.savez_compressed(self.path(table, scenario), **arrays)
+
+    def read(self, table, scenario=None):
+        """Read DataFrame from .npz (column names are read as strings)"""
+
+        with np.load(self.path(table, scenario)) as archive:
+            index_names = [None if name == 'None' else name
+                           for name in archive['index_names']]
+            columns = list(archive['columns'])
+            levels = [archive[f'index_{i}'] for i in range(len(index_names))]
+            data = {column: archive[f'column_{i}']
+                    for i, column in enumerate(columns)}
+
+        if len(levels) == 1:
+            index = pd.Index(levels[0], name=index_names[0])
+        else:
+            index = pd.MultiIndex.from_arrays(levels, names=index_names)
+
+        return pd.DataFrame(data, index=index, columns=columns)
+
+    @staticmethod
+    def _to_array(values):
+        """Return NumPy array of values, with objects stored as strings"""
+
+        array = np.asarray(values)
+        if array.dtype == object:
+            array = array.astype(str)
+
+        return array
+
+
+result_sinks = {
+    'csv': CsvSink,
+    'parquet': ParquetSink,
+    'npz': NpzSink}
+
+
+def get_result_sink(output_format='csv', output_dir='./output'):
+    """Return result sink for output format ('csv', 'parquet' or 'npz')"""
+
+    if output_format not in result_sinks:
+        raise ValueError(
+            f'Unknown output format {output_format!r}; '
+            f'choose from {list(result_sinks)}')
+
+    return result_sinks[output_format](output_dir)
@@ -1,12 +1,24 @@
 class Scenario(object):
     """Model scenario parameters
 
+    data_path (str):
+        Directory of model data (admissions, units, preferred units and
+        travel matrices)
     esd_use (float):
         Proportion of ASU users who are discharged to early supported discharge
     esd_asu_los_reduction (float):
         Reduction in ASU los (days) if using ESD
+    event_engine (str):
+        Engine used to run the model: 'simpy' (patient processes) or 'array'
+        (event heap over patient arrays, compiled with Numba if installed)
+    instrument (bool):
+        Record counters and timers of model run phases (see Instrumentation)
     los_cv (float):
         cv (std dev /mean) of length of stay
+    patient_log_chunk_size (int):
+        Number of patient log records buffered before moving to a chunk
+    patient_log_level (int):
+        Per-patient journey log: 0 (off), 1 (ASU patients) or 2 (all patients)
     require_asu (float):
         Proportion of HASU admissions requiring ASU admissions
     scale_admissions (float):
@@ -15,6 +27,13 @@ class Scenario(object):
         Duration of simulation data collection phase
     sim_warmup (float):
         Duration of simulation warm-up
+    unconstrained_fast_path (bool):
+        Skip patient by patient simulation when unit capacity can never bind
+    unit_capacity (dict):
+        Beds by unit name, overriding Capacity in hospitals.csv (optional)
+    unit_use (dict):
+        Use (1) or not (0) by unit name, overriding Use in hospitals.csv
+        (optional)
 
     """
 
@@ -23,6 +42,16 @@ class Scenario(object):
         # Simulation parameters
         self.sim_warmup = 100
         self.sim_duration = 365
+        self.unconstrained_fast_path = True
+        self.event_engine = 'simpy'
+        self.patient_log_level = 0
+        self.patient_log_chunk_size = 100000
+        self.instrument = False
+
+        # Data and unit capacity
+        self.data_path = 'data'
+        self.unit_capacity = None
+        self.unit_use = None
 
         # Scale admissions
         self.scale_admissions = 1.0
@@ -1,6 +1,3 @@
-import numpy as np
-
-
 class Patient(object):
     """
     Patient object
@@ -9,6 +6,10 @@ class Patient(object):
     -------
     __init__:
         Constructor method
+    get_state:
+        Return dictionary of patient attributes (for model snapshots)
+    from_state:
+        Create patient from dictionary of attributes
 
     attributes
     ----------
@@ -17,8 +18,18 @@ class Patient(object):
 
     """
 
-    def __init__(self, patient_dict, params):
-        """Constructor method for patient"""
+    # Fixed attributes (no per-instance dictionary, for memory and speed)
+    __slots__ = [
+        'id', 'lsoa_index', 'lsoa', 'pref_unit_postcode', 'pref_unit_name',
+        'pref_unit_index', 'patient_region', 'los_normal',
+        'assigned_asu_index', 'assigned_asu_postcode', 'assigned_asu_name',
+        'waiting_for_asu', 'displaced', 'los_asu', 'los_esd', 'time_in',
+        'time_asu_allocated', 'time_waiting_for_asu', 'time_asu_end',
+        'waited_for_asu', 'bed_allocated', '_params', 'use_asu', 'use_esd']
+
+    def __init__(self, patient_dict, params, rng):
+        """Constructor method for patient. `rng` (NumPy Generator) is used
+        for use of ASU and ESD."""
 
         # Set parameters from patient dictionary
         self.id = patient_dict['id']
@@ -28,6 +39,7 @@ class Patient(object):
         self.pref_unit_name = patient_dict['pref_unit_name']
         self.pref_unit_index = patient_dict['pref_unit_index']
         self.patient_region = patient_dict['patient_region']
+        self.los_normal = patient_dict['los_normal']
 
         # Set default values
         self.assigned_asu_index = None
@@ -42,13 +54,33 @@ class Patient(object):
         self.time_waiting_for_asu = None
         self.time_asu_end = None
         self.waited_for_asu = None
+        self.bed_allocated = None  # SimPy event triggered when bed allocated
 
         # Set link to model parameters
         self._params = params
 
         # Set use of ASU and ESD
-        self.use_asu = (True if np.random.rand() < self._params.require_asu
+        self.use_asu = (True if rng.random() < self._params.require_asu
                         else False)
 
-        self.use_esd = (True if np.random.rand() < self._params.esd_use
+        self.use_esd = (True if rng.random() < self._params.esd_use
                         else False)
+
+    def get_state(self):
+        """Return dictionary of patient attributes (excluding links to model
+        parameters and SimPy events) for model snapshots"""
+
+        return {key: getattr(self, key) for key in self.__slots__
+                if key not in ('_params', 'bed_allocated')}
+
+    @classmethod
+    def from_state(cls, state, params):
+        """Create patient from dictionary of attributes (see get_state)"""
+
+        patient = cls.__new__(cls)
+        for key, value in state.items():
+            setattr(patient, key, value)
+        patient.bed_allocated = None
+        patient._params = params
+
+        return patient
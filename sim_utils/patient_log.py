@@ -0,0 +1,196 @@
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+
+class PatientLog(object):
+    """
+    Per-patient log of journeys (patients arriving after warm-up). Records are
+    written into a preallocated NumPy structured array, which is moved to a
+    chunk when full. Chunks are kept in memory, or written to a result sink
+    (see stream_to) as tables `{table}_{chunk number}`.
+
+    Log level 1 records ASU patients; log level 2 records all patients.
+    Patients still in the system at the end of the run are recorded with no
+    time out (and, if still waiting, no unit, allocation time or waiting time).
+
+    methods
+    -------
+    record:
+        Add a patient
+    add_records:
+        Add arrays of patient records
+    flush:
+        Move buffered records to a chunk (writing it to the sink, if any)
+    stream_to:
+        Write chunks to a result sink rather than keeping them in memory
+    to_dataframe:
+        Return records kept in memory as a DataFrame
+    read:
+        Read a log written to a result sink
+
+    """
+
+    dtype = np.dtype([
+        ('id', np.int64),
+        ('lsoa_index', np.int64),
+        ('pref_unit_index', np.int64),
+        ('asu_unit_index', np.int64),
+        ('use_asu', np.bool_),
+        ('displaced', np.bool_),
+        ('time_in', np.float64),
+        ('time_asu_allocated', np.float64),
+        ('waiting_time', np.float64),
+        ('los_asu', np.float64),
+        ('time_out', np.float64)])
+
+    def __init__(self, units_name, lsoa_list, level=1, chunk_size=100000):
+        """Constructor method for PatientLog"""
+
+        self.units_name = np.array(list(units_name) + [''], dtype=object)
+        self.lsoa_list = np.array(lsoa_list, dtype=object)
+        self.level = level
+        self.chunk_size = chunk_size
+        self.buffer = np.zeros(chunk_size, dtype=self.dtype)
+        self.position = 0
+        self.chunks = []
+        self.chunk_count = 0
+        self.sink = None
+        self.table = None
+        self.scenario = None
+
+    def record(self, patient, time_out=np.nan):
+        """Add a patient (at end of journey, or still in the system at the end
+        of the run if time_out is NaN)"""
+
+        if not patient.use_asu and self.level < 2:
+            return
+
+        allocated = patient.time_asu_allocated is not None
+        self.buffer[self.position] = (
+            patient.id,
+            patient.lsoa_index,
+            patient.pref_unit_index,
+            patient.assigned_asu_index if allocated else -1,
+            patient.use_asu,
+            bool(patient.displaced),
+            patient.time_in,
+            patient.time_asu_allocated if allocated else np.nan,
+            patient.time_waiting_for_asu if allocated else np.nan,
+            patient.los_asu if allocated else np.nan,
+            time_out)
+        self.position += 1
+        if self.position == self.chunk_size:
+            self.flush()
+
+    def add_records(self, **columns):
+        """Add arrays of patient records (one keyword per log field). Records
+        of patients not using ASU are dropped at log level 1."""
+
+        if self.level < 2:
+            use_asu = np.asarray(columns['use_asu'], dtype=bool)
+            columns = {key: np.asarray(value)[use_asu]
+                       for key, value in columns.items()}
+
+        count = len(columns['id'])
+        start = 0
+        while start < count:
+            rows = min(count - start, self.chunk_size - self.position)
+            buffer = self.buffer[self.position:self.position + rows]
+            for key, value in columns.items():
+                buffer[key] = value[start:start + rows]
+            self.position += rows
+            start += rows
+            if self.position == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Move buffered records to a chunk (DataFrame with unit and LSOA
+        names), and write it to the sink if streaming"""
+
+        if self.position == 0:
+            return
+
+        chunk = pd.DataFrame(self.buffer[:self.position])
+        chunk.insert(1, 'lsoa', self.lsoa_list[chunk['lsoa_index'].values])
+        chunk.insert(3, 'pref_unit',
+                     self.units_name[chunk['pref_unit_index'].values])
+        chunk.insert(5, 'asu_unit',
+                     self.units_name[chunk['asu_unit_index'].values])
+        self.position = 0
+
+        if self.sink is not None:
+            self.sink.write(f'{self.table}_{self.chunk_count:04d}', chunk,
+                            self.scenario)
+        else:
+            self.chunks.append(chunk)
+        self.chunk_count += 1
+
+    def stream_to(self, sink, table='patient_log', scenario=None):
+        """Write chunks to a result sink (see sim_utils.output) rather than
+        keeping them in memory"""
+
+        self.sink = sink
+        self.table = table
+        self.scenario = scenario
+
+    def to_dataframe(self):
+        """Return records kept in memory as a DataFrame"""
+
+        self.flush()
+        if not self.chunks:
+            return pd.DataFrame(self.buffer[:0])
+
+        return pd.concat(self.chunks, ignore_index=True)
+
+    @staticmethod
+    def read(sink, table='patient_log', scenario=None, replication=None):
+        """
+        Read a log written to a result sink (all chunks, in chunk order) as a
+        DataFrame. Replicator writes the log of each replication as table
+        `{table}_{replication}`: give `replication` to read one replication,
+        or leave as None to read all replications, with a `replication`
+        column (in replication order).
+        """
+
+        if replication is not None:
+            table = f'{table}_{replication}'
+
+        directory = os.path.dirname(sink.path(table, scenario))
+        files = glob.glob(
+            os.path.join(directory, f'{table}_[0-9]*.{sink.extension}'))
+        chunk_pattern = re.compile(rf'{re.escape(table)}_(\d+)')
+        replication_pattern = re.compile(rf'{re.escape(table)}_(\d+)_(\d+)')
+
+        # Chunks of this table, or else of its replications
+        chunk_tables = []
+        replication_tables = []
+        for file in files:
+            chunk_table = os.path.basename(file)[:-len(sink.extension) - 1]
+            match = chunk_pattern.fullmatch(chunk_table)
+            if match:
+                chunk_tables.append((int(match.group(1)), chunk_table))
+                continue
+            match = replication_pattern.fullmatch(chunk_table)
+            if match:
+                replication_tables.append(
+                    (int(match.group(1)), int(match.group(2)), chunk_table))
+
+        if chunk_tables:
+            chunks = [sink.read(chunk_table, scenario)
+                      for _, chunk_table in sorted(chunk_tables)]
+        else:
+            chunks = []
+            for run, _, chunk_table in sorted(replication_tables):
+                chunk = sink.read(chunk_table, scenario)
+                chunk.insert(0, 'replication', run)
+                chunks.append(chunk)
+
+        if not chunks:
+            raise FileNotFoundError(
+                f'No patient log chunks of {table} in {directory}')
+
+        return pd.concat(chunks, ignore_index=True)
@@ -1,7 +1,75 @@
+import zlib
+
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy import stats
+from sim_utils.aggregation import TrialAggregator
+from sim_utils.batch_means import run_batch_means
+from sim_utils.checkpoint import CheckpointStore
+from sim_utils.instrumentation import get_instrumentation_report
 from sim_utils.model import Model
+from sim_utils.output import get_result_sink
+from sim_utils.result_cache import run_key, scenario_key
+
+
+def single_run(scenario, i=0, seed_sequence=None, snapshot=None, name=None,
+               sink=None):
+    """Run model of scenario (from warm-up snapshot, if given), and return
+    dictionary of run results. The patient log (if the scenario has one) is
+    streamed to the result sink as `patient_log_{i}` under scenario name."""
+
+    print(f'{i}, ', end='' )
+    model = Model(scenario, seed_sequence)
+    # Stream patient log (if scenario has one) to the result sink
+    if model.patient_log is not None and name is not None and sink is not None:
+        model.patient_log.stream_to(sink, f'patient_log_{i}', name)
+    model.run(snapshot)
+
+    # Put results in a dictionary
+    with model.timer('dataframes'):
+        results = {
+            'global': model.global_audit,
+            'occupancy': model.occupancy_audit,
+            'occupancy_percent': model.occupancy_percent_audit,
+            'occupancy_displaced_preferred':
+                model.unit_occupancy_displaced_preferred_audit,
+            'occupancy_displaced_destination':
+                model.unit_occupancy_displaced_destination_audit,
+            'occupancy_waiting_preferred':
+                model.unit_occupancy_waiting_preferred_audit,
+            'unit_admissions': model.admissions_by_unit,
+            'average_wait_time_all': model.average_wait_time_all,
+            'average_wait_time_waiters': model.average_wait_time_waiters,
+            'maximum_wait_time': model.maximum_wait_time}
+    results['instrumentation'] = model.instrumentation
+
+    return results
+
+
+def run_replication(scenario, i=0, seed_sequence=None, snapshot=None,
+                    name=None, sink=None, key=None, checkpoint_dir=None):
+    """
+    Worker task of a Replicator: make a run (see single_run) and, if
+    checkpoint_dir is set, save a checkpoint of its results before returning
+    them. Takes only the arguments of the run, so that dispatching a task
+    does not send the Replicator (and results held by it) to the worker.
+    """
+
+    results = single_run(scenario, i, seed_sequence, snapshot, name, sink)
+    if checkpoint_dir is not None:
+        CheckpointStore(checkpoint_dir).save(name, i, results, key)
+
+    return results
+
+
+def warmup_run(scenario, seed_sequence=None):
+    """Run warm-up of a scenario and return end of warm-up snapshot (worker
+    task of Replicator.build_snapshot_pools)"""
+
+    model = Model(scenario, seed_sequence)
+
+    return model.run_warmup()
 
 
 class Replicator:
@@ -9,20 +77,110 @@ class Replicator:
     Replication of trials for multiple scenarios.
     Uses parallel CPU processing from joblib
 
+    run_tasks (all scenario replications in one pool of parallel workers)
+        -> single run (creates dictionary of results for each  run)
     For each scenario:
-        -> run_trial (creates 'trial_output')
-            -> single run (creates dictionary of results for each  run)
-        -> unpack_trial_results (collates run results for each result type)
-        pivot_results
+        -> unpack_trial_results (lists run results for each result type)
+    collate_trial_results (one DataFrame for each result type)
+    pivot_results
+
+    In streaming mode, runs are made in parallel batches and each run's results
+    are folded into running statistics (TrialAggregator) as soon as the batch
+    finishes, so memory use does not grow with the number of replications.
+    Medians and 95th percentiles are then approximate (P-squared estimates)
+    and trial level results are not kept.
     """
 
-    def __init__(self, scenarios, replications):
+    def __init__(self, scenarios, replications, streaming=False,
+                 batch_size=None, output_dir='./output', output_format='csv',
+                 n_jobs=-1, seed=None, common_random_numbers=True,
+                 max_replications=None, ci_target=0.05,
+                 ci_min_half_width=0.1, ci_level=0.95, warm_start_pool=0,
+                 warm_start_from=None, cache=None, checkpoint_dir=None,
+                 trial_name=None):
         """
-        Constructor class for Simulation Replicator
+        Constructor class for Simulation Replicator. Results are saved to
+        output_dir as 'csv', 'parquet' or 'npz' (see sim_utils.output). Runs
+        use n_jobs parallel workers (joblib convention; -1 uses all cores).
+
+        Results of each scenario are saved in a scenario sub-directory of
+        output_dir. Pivot tables combining all scenarios are saved in
+        output_dir itself, as `{trial_name}_{table}` if trial_name is set.
+        Replicators sharing an output_dir must have different trial names,
+        or their combined pivot tables overwrite each other.
+
+        Each run gets its own random number streams from a NumPy SeedSequence
+        keyed by (scenario, replication), from root `seed` (fresh entropy if
+        None; stored as `seed_entropy` so the trial can be repeated). With
+        common_random_numbers, replication i of every scenario uses the same
+        streams, reducing noise in differences between scenarios.
+
+        If max_replications is set, `replications` is the initial number of
+        runs per scenario, and further batches of runs are added (up to
+        max_replications) until the ci_level confidence interval half-width
+        of each KPI is within ci_target (fraction) of its mean, or below
+        ci_min_half_width (see run_adaptive).
+
+        If warm_start_pool is set, a pool of that many warm-up runs is made
+        for each scenario, and each replication resumes from a snapshot of
+        the end of warm-up (replication i uses snapshot i % warm_start_pool)
+        instead of simulating warm-up again. warm_start_from is an optional
+        dictionary mapping scenario name to the name of a related scenario
+        (with the same units and unit capacities) whose snapshots it should
+        use.
+
+        Scenarios with patient_log_level set write a per-patient log of each
+        run to the result sink, as chunk tables `patient_log_{replication}_*`
+        in the scenario's output directory (read with PatientLog.read, which
+        adds a replication column when reading all replications).
+
+        If cache (a ResultCache) is set, runs already in the cache (same
+        scenario, data, code, seed and replication) are read from it rather
+        than run again, and new runs are added to it. Runs of scenarios with
+        a patient log are not cached.
+
+        If checkpoint_dir is set, the results of each (scenario, replication)
+        are saved there as the run completes (see CheckpointStore). If a trial
+        is stopped, running it again with the same checkpoint_dir restores
+        completed runs and makes only the remaining runs. The root seed is
+        stored in checkpoint_dir: a resumed trial reuses it if seed is None,
+        and raises ValueError if given a different seed.
         """
 
         self.replications = replications
         self.scenarios = scenarios
+        self.streaming = streaming
+        self.n_jobs = n_jobs
+        self.seed_entropy = np.random.SeedSequence(seed).entropy
+        self.common_random_numbers = common_random_numbers
+        self.max_replications = max_replications
+        self.ci_target = ci_target
+        self.ci_min_half_width = ci_min_half_width
+        self.ci_level = ci_level
+        self.replications_completed = None
+        self.batch_means_warmup = None
+        self.warm_start_pool = warm_start_pool
+        self.warm_start_from = warm_start_from if warm_start_from else {}
+        self.snapshots = {}
+        self.batch_means_results = None
+        self.cache = cache
+        self.checkpoints = None
+        if checkpoint_dir is not None:
+            # Resumed trials reuse the seed stored with the checkpoints
+            self.checkpoints = CheckpointStore(checkpoint_dir)
+            self.seed_entropy = self.checkpoints.get_seed_entropy(seed)
+
+        # Results of runs by scenario name (before unpacking), and KPIs by run
+        self.trial_output = {}
+        self.run_kpis = {}
+        # Instrumentation (counters and timers) summed over runs by scenario
+        self.instrumentation = {}
+        # Default batch is one run per worker
+        self.batch_size = (batch_size if batch_size else
+                           effective_n_jobs(n_jobs))
+        self.aggregator = TrialAggregator()
+        self.sink = get_result_sink(output_format, output_dir)
+        self.trial_name = trial_name
 
         # Set up DataFrames for all trials results
         self.summary_global = pd.DataFrame()
@@ -43,9 +201,22 @@ class Replicator:
         self.occupancy_waiting_preferred_pivot = None
         self.average_wait_times_waiting = None
 
+        # Set up lists of run results by result type (collated into summary
+        # DataFrames after all trials have run)
+        self.trial_results = {
+            'global': [],
+            'occupancy': [],
+            'occupancy_percent': [],
+            'occupancy_displaced_preferred': [],
+            'occupancy_displaced_destination': [],
+            'occupancy_waiting_preferred': [],
+            'unit_admissions': [],
+            'average_wait_time_waiters': []}
+
         # Set up variables for table keys
         self.global_keys = None
         self.occupancy_keys = None
+        self.unit_admissions_keys = None
 
 
     def pivot_results(self):
@@ -97,7 +268,8 @@ class Replicator:
         pivot.rename(columns={'amin': 'min', 'amax': 'max'}, inplace=True)
         self.occupancy_percent_pivot = pivot.T
 
-        # Occupancy displaced preferred unit summary (summarises across all runs)
+        # Occupancy displaced preferred unit summary (summarises across all
+        # runs)
 
         df = self.summary_unit_occupancy_displaced_preferred.copy()
         df['result_type'] = df.index
@@ -111,7 +283,8 @@ class Replicator:
         pivot.rename(columns={'amin': 'min', 'amax': 'max'}, inplace=True)
         self.occupancy_displaced_preferred_pivot = pivot.T
 
-        # Occupancy displaced destination unit summary (summarises across all runs)
+        # Occupancy displaced destination unit summary (summarises across all
+        # runs)
 
         df = self.summary_unit_occupancy_displaced_destination.copy()
         df['result_type'] = df.index
@@ -125,7 +298,8 @@ class Replicator:
         pivot.rename(columns={'amin': 'min', 'amax': 'max'}, inplace=True)
         self.occupancy_displaced_destination_pivot = pivot.T
 
-        # Occupancy displaced preferred unit summary (summarises across all runs)
+        # Occupancy waiting by preferred unit summary (summarises across all
+        # runs)
 
         df = self.summary_unit_occupancy_preferred_waiting.copy()
         df['result_type'] = df.index
@@ -146,7 +320,7 @@ class Replicator:
 
         pivot = df.pivot_table(
             index = ['name'],
-            values = self.occupancy_keys,
+            values = self.unit_admissions_keys,
             aggfunc = [np.min, np.mean, np.median, np.max, percentile_95],
             margins = False)
 
@@ -169,11 +343,17 @@ class Replicator:
         pd.set_option('display.max_rows', None)
         pd.options.display.float_format = '{:,.1f}'.format
 
+        # Replications used (adaptive replication)
+        if self.replications_completed:
+            print('\nReplications')
+            print('------------')
+            print(pd.Series(self.replications_completed))
+
         # Global values
         print('\nGlobal results (mean)')
         print('---------------------')
-        fields = ['total_patients', 'total_patients_asu', 'total_patients_displaced',
-                  'total_patients_waited']
+        fields = ['total_patients', 'total_patients_asu',
+                  'total_patients_displaced', 'total_patients_waited']
         print(self.global_pivot.loc['max'].loc[fields])
         
         print('\nAverage patients waiting for ASU')
@@ -201,150 +381,479 @@ class Replicator:
         print('\nUnit occupancy (95th percentile)')
         print('-----------------')
         print(self.occupancy_pivot.loc['percentile_95'])
+
+        # Instrumentation (if any scenario is instrumented)
+        if self.instrumentation:
+            print('\nInstrumentation (totals over runs)')
+            print('----------------------------------')
+            print(self.instrumentation_report().T)
               
     def run_scenarios(self):
         
-        # Run all scenarios
-        scenario_count = len(self.scenarios)
-        counter = 0
-        for name, scenario in self.scenarios.items():
-            counter += 1
-            print(
-                f'\r>> Running scenario {counter} of {scenario_count}', end='')
-            scenario_output = self.run_trial(scenario)
-            self.unpack_trial_results(name, scenario_output)
+        # Make pools of end of warm-up snapshots to resume runs from
+        if self.warm_start_pool:
+            self.build_snapshot_pools()
+
+        # Run all scenarios (adding replications until KPI confidence
+        # intervals are narrow enough, if max_replications is set)
+        if self.max_replications:
+            self.run_adaptive()
+        else:
+            self.run_tasks(self.get_tasks())
         
         # Clear progress output
         clear_line = '\r' + " " * 79
         print(clear_line, end = '')
 
-        # Pivot results
-        self.pivot_results()
+        # Collate and pivot results
+        if self.streaming:
+            self.pivot_streaming_results()
+        else:
+            self.collate_trial_results()
+            self.pivot_results()
 
         # Print results
         self.print_results()
 
         # save results
         self.save_results()
-    
-    def run_trial(self, scenario):
-        trial_output = Parallel(n_jobs=-1)(delayed(self.single_run)(scenario, i) 
-                for i in range(self.replications))
-        
-        return trial_output
-        
-    
-    def save_results(self):
-        
-        self.global_pivot.to_csv('./output/global_pivot.csv')
-        self.summary_global.to_csv('./output/global_trial.csv')
 
-        self.occupancy_pivot.to_csv('./output/occupancy_pivot.csv')
-        self.summary_occupancy.to_csv('./output/occupancy_trial.csv')
+    def run_batch_means(self, run_length=3650, batch_count=20):
+        """
+        Alternative to replication: make one long run of each scenario (in
+        parallel), detect warm-up automatically (MSER-5), and estimate KPI
+        confidence intervals by batch means (see sim_utils.batch_means).
+        Results are stored by scenario name in `batch_means_warmup` (days)
+        and `batch_means_results` (DataFrame of KPI mean and half-width).
+        """
 
-        self.occupancy_percent_pivot.to_csv('./output/occupancy_percent_pivot.csv')
-        self.summary_occupancy_percent.to_csv('./output/occupancy_percent_trial.csv')
+        output = Parallel(n_jobs=self.n_jobs)(
+            delayed(run_batch_means)(
+                scenario, run_length, batch_count, self.ci_level,
+                self.get_seed_sequence(name, 0))
+            for name, scenario in self.scenarios.items())
+
+        self.batch_means_warmup = {}
+        self.batch_means_results = {}
+        for name, (warmup, results) in zip(self.scenarios, output):
+            self.batch_means_warmup[name] = warmup
+            self.batch_means_results[name] = results
+
+        return self.batch_means_results
+
+    def build_snapshot_pools(self):
+        """Make `warm_start_pool` warm-up runs (in parallel) for each scenario
+        not using another scenario's snapshots, and store end of warm-up
+        snapshots by scenario name. Pools are kept in this process: each run
+        task is sent only the snapshot it resumes from (see get_tasks and
+        run_replication)."""
+
+        tasks = [(name, scenario, k,
+                  self.get_seed_sequence(name, k, warmup=True))
+                 for name, scenario in self.scenarios.items()
+                 if name not in self.warm_start_from
+                 for k in range(self.warm_start_pool)]
+        print(f'\r>> Running {len(tasks)} warm-up runs', end='')
+
+        snapshots = Parallel(n_jobs=self.n_jobs)(
+            delayed(warmup_run)(scenario, seed_sequence)
+            for _, scenario, _, seed_sequence in tasks)
+
+        self.snapshots = {}
+        for (name, _, _, _), snapshot in zip(tasks, snapshots):
+            self.snapshots.setdefault(name, []).append(snapshot)
+
+    def get_snapshot(self, name, replication):
+        """Return warm-up snapshot for scenario replication (or None)"""
+
+        name = self.warm_start_from.get(name, name)
+        if name not in self.snapshots:
+            return None
+        pool = self.snapshots[name]
+
+        return pool[replication % len(pool)]
+
+    def get_seed_sequence(self, name, replication, warmup=False):
+        """Return SeedSequence for scenario name and replication (or for
+        warm-up run of a snapshot pool, if warmup is True)"""
+
+        if self.common_random_numbers:
+            scenario_key = 0
+        else:
+            scenario_key = zlib.crc32(str(name).encode()) + 1
+        spawn_key = (scenario_key, replication)
+        if warmup:
+            spawn_key += (1,)
+
+        return np.random.SeedSequence(self.seed_entropy, spawn_key=spawn_key)
+
+    def get_tasks(self, replications=None):
+        """Return list of (scenario name, scenario, replication, seed
+        sequence, warm-up snapshot) tasks. `replications` is an optional
+        dictionary of replication numbers (range) by scenario name."""
+
+        if replications is None:
+            replications = {name: range(self.replications)
+                            for name in self.scenarios}
+
+        tasks = [(name, self.scenarios[name], i,
+                  self.get_seed_sequence(name, i),
+                  self.get_snapshot(name, i))
+                 for name, scenario_replications in replications.items()
+                 for i in scenario_replications]
+
+        return tasks
+
+    def run_tasks(self, tasks):
+        """
+        Run tasks (see get_tasks) in a single pool of workers, so that cores
+        are not left idle at the end of each scenario. Joblib dispatches tasks
+        to workers in automatically sized chunks. Results are routed back to
+        their scenario; in streaming mode tasks are run in batches and each
+        run is folded into running statistics as its batch finishes.
+        """
 
-        self.occupancy_displaced_preferred_pivot.to_csv(
-            './output/displaced_preferred_pivot.csv')
-        self.summary_unit_occupancy_displaced_preferred.to_csv(
-            './output/displaced_preferred_trial.csv')
+        task_count = len(tasks)
+        if task_count == 0:
+            return
 
-        self.occupancy_displaced_destination_pivot.to_csv(
-            './output/displaced_destination_pivot.csv')
-        self.summary_unit_occupancy_displaced_destination.to_csv(
-            './output/displaced_destination_trial.csv')
+        batch_size = self.batch_size if self.streaming else task_count
+        print(f'\r>> Running {task_count} runs', end='')
 
-        self.occupancy_waiting_preferred_pivot.to_csv('./output/waiting_preferred_pivot.csv')
-        self.summary_unit_occupancy_preferred_waiting.to_csv('./output/waiting_preferred_trial.csv')
+        with Parallel(n_jobs=self.n_jobs, batch_size='auto') as parallel:
+            for batch_start in range(0, task_count, batch_size):
+                batch = tasks[batch_start: batch_start + batch_size]
+                self.run_batch(parallel, batch)
 
-        self.unit_admissions_pivot.to_csv('./output/unit_admissions.csv')
+        self.unpack_trial_output()
+
+    def run_adaptive(self):
+        """
+        Run replications in parallel batches until the confidence interval
+        half-width of every KPI (see get_run_kpis) is within `ci_target` of
+        the KPI mean (or below `ci_min_half_width`), or `max_replications` is
+        reached. Each scenario starts with `replications` runs, then adds
+        batches of `batch_size` runs only while it has not converged.
+        """
+
+        completed = {name: 0 for name in self.scenarios}
+        batch_counts = {name: self.replications for name in self.scenarios}
+
+        with Parallel(n_jobs=self.n_jobs, batch_size='auto') as parallel:
+            while batch_counts:
+                replications = {
+                    name: range(completed[name], completed[name] + count)
+                    for name, count in batch_counts.items()}
+                tasks = self.get_tasks(replications)
+                print(f'\r>> Running {len(tasks)} runs '
+                      f'({len(batch_counts)} scenarios not converged)',
+                      end='')
+                self.run_batch(parallel, tasks)
+
+                # Add batch for each scenario that has not converged
+                for name, count in batch_counts.items():
+                    completed[name] += count
+                batch_counts = {}
+                for name in self.scenarios:
+                    remaining = self.max_replications - completed[name]
+                    if remaining > 0 and not self.kpis_converged(name):
+                        batch_counts[name] = min(self.batch_size, remaining)
+
+        self.replications_completed = completed
+        self.unpack_trial_output()
+
+    def run_batch(self, parallel, batch):
+        """Run a batch of tasks with a Joblib Parallel object, and route
+        results back to their scenario. Runs already checkpointed or in the
+        result cache are read rather than run; new runs are checkpointed (by
+        their worker, as each run completes) and added to the cache."""
+
+        # Get completed runs, and keys of runs
+        completed = {}
+        keys = {}
+        if self.checkpoints is not None or self.cache is not None:
+            for position, (name, scenario, i, seed_sequence, _) in \
+                    enumerate(batch):
+                key = self.get_run_key(name, scenario, i, seed_sequence)
+                keys[position] = key
+                results = None
+                if self.checkpoints is not None:
+                    results = self.checkpoints.load(name, i, key)
+                if results is None and self.is_cached(scenario):
+                    results = self.cache.get(key)
+                if results is not None:
+                    completed[position] = results
+        if completed:
+            print(f'\r>> {len(completed)} of {len(batch)} runs restored',
+                  end='')
+
+        # Workers get the arguments of their run only; results are kept in
+        # this process
+        checkpoint_dir = (self.checkpoints.checkpoint_dir
+                          if self.checkpoints is not None else None)
+        run_output = iter(parallel(
+            delayed(run_replication)(
+                scenario, i, seed_sequence, snapshot, name, self.sink,
+                keys.get(position), checkpoint_dir)
+            for position, (name, scenario, i, seed_sequence, snapshot)
+            in enumerate(batch) if position not in completed))
+
+        batch_output = []
+        for position, (_, scenario, _, _, _) in enumerate(batch):
+            if position in completed:
+                results = completed[position]
+            else:
+                results = next(run_output)
+                if self.is_cached(scenario):
+                    self.cache.put(keys[position], results)
+            batch_output.append(results)
+        if self.cache is not None:
+            self.cache.evict()
+
+        for (name, _, _, _, _), results in zip(batch, batch_output):
+            self.run_kpis.setdefault(name, []).append(
+                self.get_run_kpis(results))
+            if results['instrumentation'] is not None:
+                self.add_instrumentation(name, results['instrumentation'])
+            if self.streaming:
+                self.aggregator.add_run(name, results)
+            else:
+                self.trial_output.setdefault(name, []).append(results)
+
+    def is_cached(self, scenario):
+        """Return True if runs of scenario use the result cache (runs writing
+        a patient log are not cached)"""
+
+        return self.cache is not None and scenario.patient_log_level == 0
+
+    def get_run_key(self, name, scenario, replication, seed_sequence):
+        """Return key of a run for the result cache and checkpoints (see
+        run_key). Warm-started runs include the source scenario and seed of
+        their snapshot."""
+
+        warm_start = None
+        source = self.warm_start_from.get(name, name)
+        if source in self.snapshots:
+            pool = len(self.snapshots[source])
+            warmup_seed_sequence = self.get_seed_sequence(
+                source, replication % pool, warmup=True)
+            warm_start = {
+                'scenario': scenario_key(self.scenarios[source]),
+                'entropy': warmup_seed_sequence.entropy,
+                'spawn_key': list(warmup_seed_sequence.spawn_key)}
+
+        return run_key(scenario, seed_sequence, {'warm_start': warm_start})
+
+    def add_instrumentation(self, name, instrumentation):
+        """Add instrumentation of a run (from a worker) to scenario totals"""
+
+        if name in self.instrumentation:
+            self.instrumentation[name].add(instrumentation)
+        else:
+            self.instrumentation[name] = instrumentation
+
+    def instrumentation_report(self):
+        """Return DataFrame of instrumentation counters, timers and events
+        per second, summed over runs by scenario (scenarios with
+        Scenario.instrument set only)"""
+
+        return get_instrumentation_report(self.instrumentation)
+
+    def unpack_trial_output(self):
+        """Unpack stored results of all runs (not used in streaming mode)"""
+
+        for name, scenario_output in self.trial_output.items():
+            self.unpack_trial_results(name, scenario_output)
+        self.trial_output = {}
+
+    @staticmethod
+    def get_run_kpis(results):
+        """Return dictionary of key performance indicators for one run: mean
+        patients waiting, mean wait for patients who waited, and 95th
+        percentile occupancy for each unit"""
+
+        kpis = {
+            'mean_waiting':
+                results['global']['asu_patients_unallocated'].mean(),
+            'mean_wait_waiters': results['average_wait_time_waiters']}
+        occupancy = results['occupancy']
+        percentile_95 = np.percentile(occupancy.values, 95, axis=0)
+        for unit, value in zip(occupancy.columns, percentile_95):
+            kpis[f'occupancy_95_{unit}'] = value
+
+        return kpis
+
+    def get_kpi_intervals(self, name):
+        """Return DataFrame of KPI mean and confidence interval half-width
+        (using the t distribution) across runs of a scenario"""
+
+        kpis = pd.DataFrame(self.run_kpis[name])
+        count = len(kpis)
+        mean = kpis.mean()
+        if count > 1:
+            t_value = stats.t.ppf(1 - (1 - self.ci_level) / 2, count - 1)
+            half_width = t_value * kpis.std(ddof=1) / np.sqrt(count)
+        else:
+            half_width = pd.Series(np.inf, index=kpis.columns)
+
+        intervals = pd.DataFrame({'mean': mean, 'half_width': half_width})
+        intervals['runs'] = count
+
+        return intervals
+
+    def kpis_converged(self, name):
+        """Return True if all KPI confidence intervals of a scenario are
+        narrow enough"""
+
+        intervals = self.get_kpi_intervals(name)
+        narrow = ((intervals['half_width'] <=
+                   self.ci_target * intervals['mean'].abs()) |
+                  (intervals['half_width'] <= self.ci_min_half_width))
+
+        return bool(narrow.all())
+
+    def pivot_streaming_results(self):
+        """Summarise streamed results across multiple scenario replicates"""
+
+        self.global_pivot = self.aggregator.pivot('global')
+        self.occupancy_pivot = self.aggregator.pivot('occupancy')
+        self.occupancy_percent_pivot = \
+            self.aggregator.pivot('occupancy_percent')
+        self.occupancy_displaced_preferred_pivot = \
+            self.aggregator.pivot('occupancy_displaced_preferred')
+        self.occupancy_displaced_destination_pivot = \
+            self.aggregator.pivot('occupancy_displaced_destination')
+        self.occupancy_waiting_preferred_pivot = \
+            self.aggregator.pivot('occupancy_waiting_preferred')
+        self.unit_admissions_pivot = self.aggregator.pivot('unit_admissions')
+        self.average_wait_times_waiting_pivot = \
+            self.aggregator.mean('average_wait_time_waiters')
     
+    def save_results(self):
+        """
+        Save results with the result sink. Pivot tables are saved for all
+        scenarios (in the output directory, prefixed by trial_name if set)
+        and for each scenario (in a scenario sub-directory). Trial results
+        are saved for each scenario.
+        """
+
+        prefix = f'{self.trial_name}_' if self.trial_name else ''
+
+        pivots = {
+            'global_pivot': self.global_pivot,
+            'occupancy_pivot': self.occupancy_pivot,
+            'occupancy_percent_pivot': self.occupancy_percent_pivot,
+            'displaced_preferred_pivot':
+                self.occupancy_displaced_preferred_pivot,
+            'displaced_destination_pivot':
+                self.occupancy_displaced_destination_pivot,
+            'waiting_preferred_pivot': self.occupancy_waiting_preferred_pivot,
+            'unit_admissions': self.unit_admissions_pivot}
+
+        for table, pivot in pivots.items():
+            self.sink.write(f'{prefix}{table}', pivot)
+            for name in pivot.columns:
+                self.sink.write(table, pivot[[name]], scenario=name)
+
+        if self.instrumentation:
+            self.sink.write(f'{prefix}instrumentation',
+                            self.instrumentation_report())
+
+        # Trial level results are not kept in streaming mode
+        if self.streaming:
+            return
+
+        trials = {
+            'global_trial': self.summary_global,
+            'occupancy_trial': self.summary_occupancy,
+            'occupancy_percent_trial': self.summary_occupancy_percent,
+            'displaced_preferred_trial':
+                self.summary_unit_occupancy_displaced_preferred,
+            'displaced_destination_trial':
+                self.summary_unit_occupancy_displaced_destination,
+            'waiting_preferred_trial':
+                self.summary_unit_occupancy_preferred_waiting}
+
+        for table, trial in trials.items():
+            for name, scenario_trial in trial.groupby('name', sort=False):
+                self.sink.write(table, scenario_trial, scenario=name)
     
-    def single_run(self, scenario, i=0):
-        print(f'{i}, ', end='' )
-        model = Model(scenario)
-        model.run()
-        
-        # Put results in a dictionary
-        results = {
-            'global': model.global_audit,
-            'occupancy': model.occupancy_audit,
-            'occupancy_percent': model.occupancy_percent_audit,
-            'occupancy_displaced_preferred': model.unit_occupancy_displaced_preferred_audit,
-            'occupancy_displaced_destination': model.unit_occupancy_displaced_destination_audit,
-            'occupancy_waiting_preferred': model.unit_occupancy_waiting_preferred_audit,
-            'unit_admissions': model.admissions_by_unit,
-            'average_wait_time_all': model.average_wait_time_all,
-            'average_wait_time_waiters': model.average_wait_time_waiters,
-            'maximum_wait_time': model.maximum_wait_time
-                   }
+    def single_run(self, scenario, i=0, seed_sequence=None, snapshot=None,
+                   name=None):
+        """Make a run in this process (see single_run), streaming any patient
+        log to the result sink"""
 
-        return results
-        
+        return single_run(scenario, i, seed_sequence, snapshot, name,
+                          self.sink)
+
+    @staticmethod
+    def union_keys(keys, new_keys):
+        """Return ordered union of table keys (e.g. units) and new keys, so
+        that keys appearing only in later scenarios are kept"""
 
+        keys = [] if keys is None else keys
+        known = set(keys)
+
+        return keys + [key for key in new_keys if key not in known]
 
     def unpack_trial_results(self, name, results):
-        
+        """Add results of each run of a trial to lists of results by result
+        type. Lists are collated into DataFrames by collate_trial_results."""
 
-        for run in range(self.replications):
+        for run in range(len(results)):
             
             # Global summary
             result_item = results[run]['global']
-            if run == 0:
+            if self.global_keys is None:
                 self.global_keys = list(result_item)
                 self.global_keys.remove('index')
                 self.global_keys.remove('time')
             result_item['run'] = run
             result_item['name'] = name
-            self.summary_global = self.summary_global.append(result_item)
+            self.trial_results['global'].append(result_item)
 
             # Occupancy summaries
-            result_item = results[run]['occupancy']
-            if run == 0:
-                self.occupancy_keys = list(result_item)
-            result_item['run'] = run
-            result_item['name'] = name
-            self.summary_occupancy = self.summary_occupancy.append(result_item)
-
-            result_item = results[run]['occupancy_percent']
-            if run == 0:
-                self.occupancy_keys = list(result_item)
-            result_item['run'] = run
-            result_item['name'] = name
-            self.summary_occupancy_percent = self.summary_occupancy_percent.append(result_item)
-
-            result_item = results[run]['occupancy_displaced_preferred']
-            result_item['run'] = run
-            result_item['name'] = name
-            self.summary_unit_occupancy_displaced_preferred = \
-                self.summary_unit_occupancy_displaced_preferred.append(result_item)
-
-            result_item = results[run]['occupancy_displaced_destination']
-            result_item['run'] = run
-            result_item['name'] = name
-            self.summary_unit_occupancy_displaced_destination = \
-                self.summary_unit_occupancy_displaced_destination.append(result_item)
-
-            result_item = results[run]['occupancy_waiting_preferred']
-            result_item['run'] = run
-            result_item['name'] = name
-            self.summary_unit_occupancy_preferred_waiting = \
-                self.summary_unit_occupancy_preferred_waiting.append(result_item)
+            for result_type in ['occupancy', 'occupancy_percent',
+                                'occupancy_displaced_preferred',
+                                'occupancy_displaced_destination',
+                                'occupancy_waiting_preferred']:
+                result_item = results[run][result_type]
+                self.occupancy_keys = self.union_keys(
+                    self.occupancy_keys, result_item.columns)
+                result_item['run'] = run
+                result_item['name'] = name
+                self.trial_results[result_type].append(result_item)
 
             # Admissions
             result_item = results[run]['unit_admissions']
-            if run == 0:
-                self.unit_admissions_keys = list(result_item.index)
+            self.unit_admissions_keys = self.union_keys(
+                self.unit_admissions_keys, result_item.index)
             result_item['run'] = run
             result_item['name'] = name
-            self.summary_unit_admissions = self.summary_unit_admissions.append(
-                result_item, ignore_index=True)
+            self.trial_results['unit_admissions'].append(result_item)
             
             # Waiting time (waiters)
-            result_item = pd.Series(results[run]['average_wait_time_waiters'])
-            result_item['run'] = run
-            result_item['name'] = name
-            self.summary_average_wait_times_waiting = \
-                self.summary_average_wait_times_waiting.append(
-                result_item, ignore_index=True)
+            result_item = {0: results[run]['average_wait_time_waiters'],
+                           'run': run,
+                           'name': name}
+            self.trial_results['average_wait_time_waiters'].append(
+                result_item)
+
+    def collate_trial_results(self):
+        """Collate lists of run results into summary DataFrames (a single
+        concatenation per result type, after all trials have run)"""
+
+        self.summary_global = pd.concat(self.trial_results['global'])
+        self.summary_occupancy = pd.concat(self.trial_results['occupancy'])
+        self.summary_occupancy_percent = pd.concat(
+            self.trial_results['occupancy_percent'])
+        self.summary_unit_occupancy_displaced_preferred = pd.concat(
+            self.trial_results['occupancy_displaced_preferred'])
+        self.summary_unit_occupancy_displaced_destination = pd.concat(
+            self.trial_results['occupancy_displaced_destination'])
+        self.summary_unit_occupancy_preferred_waiting = pd.concat(
+            self.trial_results['occupancy_waiting_preferred'])
+        self.summary_unit_admissions = pd.DataFrame(
+            self.trial_results['unit_admissions']).reset_index(drop=True)
+        self.summary_average_wait_times_waiting = pd.DataFrame(
+            self.trial_results['average_wait_time_waiters'])
@@ -0,0 +1,201 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+from sim_utils.matrix_cache import file_hash
+
+# Data files of a data path included in result cache keys
+data_files = ['admissions.csv', 'hospitals.csv', 'pref_unit.csv', 'time.csv',
+              'distance.csv']
+
+# File hashes by (file name, size, mtime), and code version, per process
+_file_hash_cache = {}
+_code_version = None
+
+
+def data_hash(path='data'):
+    """Return SHA-256 hash of the hashes of the data files of a data path.
+    Files are hashed again only if their size or mtime changes."""
+
+    sha = hashlib.sha256()
+    for name in data_files:
+        filename = os.path.join(path, name)
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+        if key not in _file_hash_cache:
+            _file_hash_cache[key] = file_hash(filename)
+        sha.update(f'{name}:{_file_hash_cache[key]}\n'.encode())
+
+    return sha.hexdigest()
+
+
+def code_version():
+    """Return SHA-256 hash of model code (sim_utils source files)"""
+
+    global _code_version
+    if _code_version is None:
+        sha = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(glob.glob(os.path.join(directory, '*.py'))):
+            sha.update(os.path.basename(filename).encode())
+            sha.update(file_hash(filename).encode())
+        _code_version = sha.hexdigest()
+
+    return _code_version
+
+
+def _json_default(item):
+    """JSON encoding of NumPy scalars and other values in scenario keys"""
+
+    if hasattr(item, 'item'):
+        return item.item()
+
+    return repr(item)
+
+
+def scenario_key(scenario):
+    """Return hash of scenario attributes, data file hashes and code
+    version"""
+
+    item = {'scenario': vars(scenario),
+            'data': data_hash(scenario.data_path),
+            'code': code_version()}
+    text = json.dumps(item, sort_keys=True, default=_json_default)
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def run_key(scenario, seed_sequence, extra=None):
+    """Return key of a run of scenario with seed sequence, and extra (JSON
+    serialisable) items affecting results"""
+
+    item = {'scenario': scenario_key(scenario),
+            'entropy': seed_sequence.entropy,
+            'spawn_key': list(seed_sequence.spawn_key),
+            'extra': extra}
+    text = json.dumps(item, sort_keys=True, default=_json_default)
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Content-addressed cache of the results of model runs. A run is keyed by
+    a hash of the scenario attributes, the hashes of the scenario's data
+    files, the model code version, and the run's seed sequence (root entropy
+    and spawn key, which identify replication and trial seed) plus any extra
+    items (e.g. warm-start snapshot). A run is not repeated if its key is in
+    the cache.
+
+    Keys are made by run_key (see Replicator.get_run_key). Each run is
+    stored (pickled) in its own file `{key}.pkl`, written via a
+    temporary file so readers never see part files. Reading an entry updates
+    its modification time, so that eviction (least recently used first)
+    keeps the cache within max_size (bytes) and max_entries, if set.
+
+    methods
+    -------
+    get:
+        Return cached results of a run (None if not cached)
+    put:
+        Store results of a run
+    evict:
+        Remove least recently used entries beyond size limits
+    clear:
+        Remove all entries
+
+    attributes
+    ----------
+    hits (int):
+        Runs found in the cache
+    misses (int):
+        Runs not found in the cache
+
+    """
+
+    extension = 'pkl'
+
+    def __init__(self, cache_dir='./output/cache', max_size=None,
+                 max_entries=None):
+        """Constructor method for ResultCache"""
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        """Return file path of entry"""
+
+        return os.path.join(self.cache_dir, f'{key}.{self.extension}')
+
+    def get(self, key):
+        """Return cached results of a run (None if not cached), and mark the
+        entry as recently used"""
+
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                results = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+
+        return results
+
+    def put(self, key, results):
+        """Store results of a run (via a temporary file)"""
+
+        path = self.path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def entries(self):
+        """Return list of (mtime, size, path) of entries, least recently used
+        first"""
+
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir,
+                                           f'*.{self.extension}')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        return sorted(entries)
+
+    def evict(self):
+        """Remove least recently used entries until the cache is within
+        max_size and max_entries (if set)"""
+
+        if self.max_size is None and self.max_entries is None:
+            return
+
+        entries = self.entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        count = len(entries)
+        for _, entry_size, path in entries:
+            if ((self.max_size is None or size <= self.max_size) and
+                    (self.max_entries is None or count <= self.max_entries)):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+            count -= 1
+
+    def clear(self):
+        """Remove all entries"""
+
+        for _, _, path in self.entries():
+            os.remove(path)
@@ -0,0 +1,431 @@
+import copy
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from sim_utils.data import Data
+from sim_utils.model import Model
+from sim_utils.output import CsvSink
+
+# Unit KPIs of the surrogate (mean patients over the audit period), with the
+# pivot tables holding them in stored Replicator results
+surrogate_kpis = {
+    'occupancy': 'occupancy_pivot',
+    'waiting': 'waiting_preferred_pivot',
+    'displaced': 'displaced_preferred_pivot'}
+
+
+def erlang_b(servers, load):
+    """
+    Return Erlang B blocking probability for arrays of servers (beds) and
+    offered load. Non-integer servers are interpolated between integer
+    server counts; servers far above load are taken never to block.
+    """
+
+    servers = np.asarray(servers, dtype=float)
+    load = np.asarray(load, dtype=float)
+    lower = np.floor(servers)
+    large = servers > load + 10 * np.sqrt(load) + 20
+    top = int(np.max(np.where(large, 0, lower + 1), initial=0))
+
+    # Erlang B recursion over server count (B = 1 with no servers)
+    blocking = np.ones(load.shape)
+    blocking_lower = np.ones(load.shape)
+    blocking_upper = np.ones(load.shape)
+    for k in range(1, top + 1):
+        blocking = load * blocking / (k + load * blocking)
+        blocking_lower = np.where(lower == k, blocking, blocking_lower)
+        blocking_upper = np.where(lower + 1 == k, blocking, blocking_upper)
+    fraction = servers - lower
+    blocking = (1 - fraction) * blocking_lower + fraction * blocking_upper
+
+    return np.where(large, 0., blocking)
+
+
+def erlang_c(servers, load):
+    """Return Erlang C probability of waiting for arrays of servers and
+    offered load (1 if load is not below servers)"""
+
+    servers = np.asarray(servers, dtype=float)
+    load = np.asarray(load, dtype=float)
+    blocking = erlang_b(servers, load)
+    stable = servers > load
+    denominator = np.where(stable, servers - load * (1 - blocking), 1.)
+
+    return np.where(stable, servers * blocking / denominator, 1.)
+
+
+def approximate_units(load, capacity, region, allow_pool_use, los_cv,
+                      allow_non_preferred_asu=False,
+                      restrict_non_preferred_to_regions=True):
+    """
+    Queueing approximation of unit KPIs (arrays by unit) from offered load
+    (beds) and capacity:
+
+    displaced: load overflowing a full preferred unit (Erlang B) that other
+        units of the pool (units allowing pool use, in the same region if
+        restricted) have spare beds for, shared in proportion to overflow
+    occupancy: load, less displaced load, plus displaced load received
+        (shared in proportion to spare beds), limited to capacity
+    waiting: patients waiting (M/G/c, Allen-Cunneen) for the preferred unit
+        plus beds used elsewhere; infinite if load is not below these beds
+    """
+
+    load = np.asarray(load, dtype=float)
+    capacity = np.asarray(capacity, dtype=float)
+    displaced = np.zeros(load.shape)
+    received = np.zeros(load.shape)
+
+    if allow_non_preferred_asu:
+        blocking = erlang_b(capacity, load)
+        overflow = load * blocking
+        spare = (np.maximum(capacity - load * (1 - blocking), 0) *
+                 (np.asarray(allow_pool_use) == 1))
+        if restrict_non_preferred_to_regions:
+            pools = np.asarray(region)
+        else:
+            pools = np.zeros(load.shape)
+        for pool in np.unique(pools):
+            members = pools == pool
+            total_overflow = overflow[members].sum()
+            total_spare = spare[members].sum()
+            absorbed = min(total_overflow, total_spare)
+            if total_overflow > 0:
+                displaced[members] = \
+                    overflow[members] * absorbed / total_overflow
+            if total_spare > 0:
+                received[members] = spare[members] * absorbed / total_spare
+
+    servers = capacity + displaced
+    stable = servers > load
+    waiting = np.full(load.shape, np.inf)
+    waiting[stable] = (
+        erlang_c(servers[stable], load[stable]) * load[stable] /
+        (servers[stable] - load[stable]) * (1 + los_cv ** 2) / 2)
+    occupancy = np.minimum(load - displaced + received, capacity)
+
+    return {'occupancy': occupancy, 'waiting': waiting,
+            'displaced': displaced}
+
+
+def run_unit_kpis(scenario, seed_sequence):
+    """Run model of scenario; return DataFrame of mean unit KPIs (columns
+    occupancy, waiting and displaced) by unit name"""
+
+    model = Model(scenario, seed_sequence)
+    model.run()
+
+    return pd.DataFrame({
+        'occupancy': model.occupancy_audit.mean(),
+        'waiting': model.unit_occupancy_waiting_preferred_audit.mean(),
+        'displaced': model.unit_occupancy_displaced_preferred_audit.mean()})
+
+
+class OccupancySurrogate(object):
+    """
+    Metamodel of unit occupancy, waiting and displaced patients, for fast
+    what-if queries (e.g. unit capacity or demand changes) without running
+    the simulation.
+
+    Unit KPIs are approximated by queueing models of each unit, pooled by
+    region where patients may use non-preferred units (approximate_units).
+    Each KPI approximation is calibrated against simulation results (a
+    linear fit of simulated on approximate unit KPIs); the uncertainty of a
+    prediction is the standard deviation of calibration residuals, which is
+    fitted as a linear function of the approximation.
+
+    Predictions are trusted for scenarios like the calibration scenarios:
+    the same use of non-preferred units, unit utilisation (load / beds) and
+    los_cv within the calibration range (plus a margin), and at least
+    `min_scenarios` calibration scenarios. Queries outside the trusted
+    region fall back to simulation, whose results are then added to the
+    calibration data (if `learn` is True).
+
+    methods
+    -------
+    add_results:
+        Add simulated unit KPIs of a scenario to the calibration data
+    add_replicator:
+        Add results of scenarios run by a Replicator
+    add_stored_results:
+        Add results of scenarios saved by a Replicator
+    calibrate:
+        Fit calibration of each KPI
+    approximate:
+        Return queueing approximation of unit KPIs of a scenario
+    predict:
+        Return calibrated unit KPIs, with standard deviations
+    trusted:
+        Return True if a scenario is in the trusted region
+    simulate:
+        Return unit KPIs of a scenario from simulation runs
+    query:
+        Return unit KPIs from the surrogate if trusted, else simulation
+
+    attributes
+    ----------
+    calibration (dict):
+        Calibration of each KPI (intercept, slope, residual sd intercept and
+        slope, points) by use of non-preferred units
+    points (DataFrame):
+        Calibration data (approximate and simulated KPIs by scenario unit)
+
+    """
+
+    def __init__(self, min_scenarios=2, margin=0.02, fallback=True,
+                 fallback_replications=10, learn=True, n_jobs=-1, seed=None):
+        """Constructor method for OccupancySurrogate"""
+
+        self.min_scenarios = min_scenarios
+        self.margin = margin
+        self.fallback = fallback
+        self.fallback_replications = fallback_replications
+        self.learn = learn
+        self.n_jobs = n_jobs
+        self.seed_entropy = np.random.SeedSequence(seed).entropy
+
+        # Unit data by (data_path, overwrite_preferred_unit_with_closest,
+        # unit_use)
+        self.unit_data = {}
+        self.point_records = []
+        self.scenario_count = 0
+        self.calibration = None
+
+    @property
+    def points(self):
+        """Calibration data as a DataFrame"""
+
+        return pd.DataFrame(self.point_records)
+
+    def get_unit_data(self, scenario):
+        """Return dictionary of unit arrays (independent of demand and
+        capacity parameters) for scenario data, built once per data path"""
+
+        unit_use = scenario.unit_use if scenario.unit_use else {}
+        key = (scenario.data_path,
+               scenario.overwrite_preferred_unit_with_closest,
+               tuple(sorted(unit_use.items())))
+        if key not in self.unit_data:
+            base = copy.copy(scenario)
+            base.scale_admissions = 1.0
+            base.require_asu = 1.0
+            base.unit_capacity = None
+            data = Data(base)
+            self.unit_data[key] = {
+                'units_name': list(data.units_name),
+                'base_load': data.get_expected_occupancy(),
+                'los_mean': np.array(data.units_los_mean, dtype=float),
+                'capacity': np.array(data.units_capacity, dtype=float),
+                'region': np.array(data.unit_region),
+                'allow_pool_use': np.array(data.allow_pool_use)}
+
+        return self.unit_data[key]
+
+    def approximate(self, scenario):
+        """Return DataFrame of queueing approximation of unit KPIs (with
+        load, beds and utilisation) by unit name"""
+
+        unit_data = self.get_unit_data(scenario)
+        load = (unit_data['base_load'] * scenario.scale_admissions *
+                scenario.require_asu)
+        capacity = unit_data['capacity']
+        if scenario.unit_capacity is not None:
+            capacity = np.array(
+                [scenario.unit_capacity.get(name, beds) for name, beds in
+                 zip(unit_data['units_name'], capacity)], dtype=float)
+
+        kpis = approximate_units(
+            load, capacity, unit_data['region'], unit_data['allow_pool_use'],
+            scenario.los_cv, scenario.allow_non_preferred_asu,
+            scenario.restrict_non_preferred_to_regions)
+        df = pd.DataFrame(kpis, index=unit_data['units_name'])
+        df.insert(0, 'load', load)
+        df.insert(1, 'capacity', capacity)
+        df.insert(2, 'utilisation', load / capacity)
+        df['arrivals_per_day'] = load / unit_data['los_mean']
+
+        return df
+
+    def add_results(self, scenario, occupancy, waiting, displaced):
+        """Add simulated mean unit KPIs (Series or dictionaries by unit name)
+        of a scenario to the calibration data"""
+
+        approximation = self.approximate(scenario)
+        simulated = {'occupancy': occupancy, 'waiting': waiting,
+                     'displaced': displaced}
+        for unit, row in approximation.iterrows():
+            record = {
+                'scenario': self.scenario_count,
+                'unit': unit,
+                'allow_non_preferred_asu': scenario.allow_non_preferred_asu,
+                'los_cv': scenario.los_cv,
+                'utilisation': row['utilisation']}
+            for kpi in surrogate_kpis:
+                record[f'{kpi}_approximate'] = row[kpi]
+                record[f'{kpi}_simulated'] = float(simulated[kpi][unit])
+            self.point_records.append(record)
+        self.scenario_count += 1
+        self.calibration = None
+
+    def add_replicator(self, replicator):
+        """Add results (means of runs) of all scenarios run by a Replicator"""
+
+        pivots = {
+            'occupancy': replicator.occupancy_pivot,
+            'waiting': replicator.occupancy_waiting_preferred_pivot,
+            'displaced': replicator.occupancy_displaced_preferred_pivot}
+        for name, scenario in replicator.scenarios.items():
+            self.add_results(scenario, **{
+                kpi: pivot.loc['mean'][name] for kpi, pivot in pivots.items()})
+
+    def add_stored_results(self, scenarios, sink):
+        """Add results of scenarios (dictionary of Scenario by name) saved by
+        a Replicator to a result sink (see sim_utils.output)"""
+
+        for name, scenario in scenarios.items():
+            results = {}
+            for kpi, table in surrogate_kpis.items():
+                if isinstance(sink, CsvSink):
+                    pivot = sink.read(table, name, index_col=[0, 1])
+                else:
+                    pivot = sink.read(table, name)
+                results[kpi] = pivot.loc['mean'].iloc[:, 0]
+            self.add_results(scenario, **results)
+
+    def calibrate(self):
+        """Fit calibration of each KPI, separately for scenarios with and
+        without use of non-preferred units: simulated = intercept + slope x
+        approximate, with residual sd = sd_intercept + sd_slope x
+        approximate (identity and no uncertainty if too few points)"""
+
+        points = self.points
+        self.calibration = {}
+        for allow_non_preferred_asu in [False, True]:
+            if len(points) > 0:
+                group = points[points['allow_non_preferred_asu'] ==
+                               allow_non_preferred_asu]
+            else:
+                group = points
+            self.calibration[allow_non_preferred_asu] = {
+                kpi: self.fit(group, kpi) for kpi in surrogate_kpis}
+
+    @staticmethod
+    def fit(points, kpi):
+        """Return calibration of KPI (see calibrate) fitted to points"""
+
+        calibration = {'intercept': 0., 'slope': 1., 'sd_intercept': 0.,
+                       'sd_slope': 0., 'points': 0}
+        if len(points) == 0:
+            return calibration
+
+        x = points[f'{kpi}_approximate'].values
+        y = points[f'{kpi}_simulated'].values
+        finite = np.isfinite(x) & np.isfinite(y)
+        x = x[finite]
+        y = y[finite]
+        calibration['points'] = len(x)
+        if len(x) > 2 and np.ptp(x) > 0:
+            slope, intercept = np.polyfit(x, y, 1)
+            residuals = np.abs(y - (intercept + slope * x))
+            # Mean absolute residual x sqrt(pi / 2) estimates sd
+            sd_slope, sd_intercept = np.polyfit(x, residuals, 1)
+            calibration.update({
+                'intercept': intercept, 'slope': slope,
+                'sd_intercept': sd_intercept * np.sqrt(np.pi / 2),
+                'sd_slope': sd_slope * np.sqrt(np.pi / 2)})
+
+        return calibration
+
+    def predict(self, scenario):
+        """
+        Return DataFrame of calibrated unit KPIs (occupancy, waiting and
+        displaced mean patients, each with a standard deviation `{kpi}_sd`)
+        and mean wait (days) of ASU patients by preferred unit, with a
+        `total` row (sds summed, as unit errors are correlated)
+        """
+
+        if self.calibration is None:
+            self.calibrate()
+
+        approximation = self.approximate(scenario)
+        df = pd.DataFrame(index=approximation.index)
+        calibrations = self.calibration[scenario.allow_non_preferred_asu]
+        for kpi, calibration in calibrations.items():
+            x = approximation[kpi].values
+            df[kpi] = np.maximum(
+                calibration['intercept'] + calibration['slope'] * x, 0)
+            df[f'{kpi}_sd'] = np.maximum(
+                calibration['sd_intercept'] + calibration['sd_slope'] * x, 0)
+        df.loc['total'] = df.sum()
+
+        arrivals = approximation['arrivals_per_day']
+        df['wait'] = df['waiting'] / np.append(arrivals, arrivals.sum())
+
+        return df
+
+    def trusted(self, scenario):
+        """Return True if scenario is in the trusted region of the surrogate
+        (like calibration scenarios)"""
+
+        if self.scenario_count < self.min_scenarios:
+            return False
+
+        points = self.points
+        points = points[points['allow_non_preferred_asu'] ==
+                        scenario.allow_non_preferred_asu]
+        if points['scenario'].nunique() < self.min_scenarios:
+            return False
+        if not (points['los_cv'].min() - self.margin <= scenario.los_cv <=
+                points['los_cv'].max() + self.margin):
+            return False
+
+        utilisation = self.approximate(scenario)['utilisation']
+
+        return bool(
+            utilisation.min() >= points['utilisation'].min() - self.margin and
+            utilisation.max() <= points['utilisation'].max() + self.margin)
+
+    def simulate(self, scenario):
+        """Return DataFrame of unit KPIs of scenario (in the format of
+        predict; sds are standard errors of means of replications) from
+        fallback_replications parallel model runs"""
+
+        runs = Parallel(n_jobs=self.n_jobs)(
+            delayed(run_unit_kpis)(
+                scenario, np.random.SeedSequence(self.seed_entropy,
+                                                 spawn_key=(i,)))
+            for i in range(self.fallback_replications))
+        results = pd.concat(runs, keys=range(len(runs)), names=['run', None])
+        results = results.reset_index(level='run')
+        grouped = results.groupby(level=0, sort=False)
+        mean = grouped.mean()
+        sd = grouped.std() / np.sqrt(len(runs))
+
+        df = pd.DataFrame(index=mean.index)
+        for kpi in surrogate_kpis:
+            df[kpi] = mean[kpi]
+            df[f'{kpi}_sd'] = sd[kpi]
+        df.loc['total'] = df.sum()
+        for kpi in surrogate_kpis:
+            df.loc['total', f'{kpi}_sd'] = (
+                results.groupby('run')[kpi].sum().std() / np.sqrt(len(runs)))
+
+        arrivals = self.approximate(scenario)['arrivals_per_day']
+        df['wait'] = df['waiting'] / np.append(arrivals, arrivals.sum())
+
+        if self.learn:
+            self.add_results(scenario, mean['occupancy'], mean['waiting'],
+                             mean['displaced'])
+
+        return df
+
+    def query(self, scenario):
+        """Return unit KPIs of scenario (see predict) and source
+        ('surrogate' or 'simulation'). Scenarios outside the trusted region
+        are simulated if fallback is True."""
+
+        if self.trusted(scenario) or not self.fallback:
+            return self.predict(scenario), 'surrogate'
+
+        return self.simulate(scenario), 'simulation'
@@ -0,0 +1,387 @@
+import contextlib
+import io
+import itertools
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from joblib import effective_n_jobs
+
+from sim_utils.data import load_reference_data
+from sim_utils.parameters import Scenario
+from sim_utils.replication import Replicator
+
+
+def latin_hypercube(parameters, samples, rng):
+    """
+    Return list of dictionaries of parameter values of a Latin hypercube
+    design. Parameters given as (low, high) tuples are sampled uniformly;
+    parameters given as lists are categorical (each value takes an equal
+    share of strata).
+    """
+
+    design = [{} for _ in range(samples)]
+    for parameter, values in parameters.items():
+        strata = (rng.permutation(samples) + rng.random(samples)) / samples
+        for point, u in zip(design, strata):
+            if isinstance(values, tuple):
+                low, high = values
+                point[parameter] = float(low + u * (high - low))
+            else:
+                point[parameter] = values[int(u * len(values))]
+
+    return design
+
+
+def grid(parameters):
+    """Return list of dictionaries of parameter values of all combinations
+    of parameter value lists"""
+
+    names = list(parameters)
+
+    return [dict(zip(names, values))
+            for values in itertools.product(*parameters.values())]
+
+
+def _to_column(value):
+    """Return value for a store column (JSON text if not a scalar)"""
+
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, sort_keys=True)
+    if hasattr(value, 'item'):
+        return value.item()
+
+    return value
+
+
+class Sweep(object):
+    """
+    Parameter sweep: runs replications of scenarios at the points of a grid
+    or Latin hypercube design, and stores results in one SQLite database.
+
+    Parameters are Scenario fields (e.g. scale_admissions, require_asu,
+    los_cv, allow_non_preferred_asu) or unit parameters:
+
+    capacity_column:
+        Column of hospitals.csv giving capacity (e.g. planned_85_percent)
+    capacity_multiplier:
+        Multiplier of the capacity of all units
+    capacity_multiplier:<unit name>:
+        Multiplier of the capacity of one unit (applied after the multiplier
+        of all units)
+    use:<unit name>:
+        Use (1) or not (0) of a unit (LSOAs preferring a closed unit need
+        overwrite_preferred_unit_with_closest)
+
+    Capacity multipliers apply to capacity in hospitals.csv (Capacity or
+    capacity_column, overridden by base unit_capacity) and are rounded to
+    whole beds.
+
+    A grid design takes lists of values of each parameter. A Latin hypercube
+    design ('lhs') takes `samples` points, with (low, high) tuples of
+    continuous parameters or lists of categorical values.
+
+    Points are run in chunks of chunk_size points (default twice the number
+    of parallel workers), each by a Replicator (in one pool of parallel
+    workers, with common random numbers across points). Results of each
+    chunk are added to the store, and progress printed, as the chunk
+    completes, so a sweep that is stopped can be resumed by running it again
+    (points already in the store are not run again; completed runs of an
+    incomplete chunk are restored from checkpoints, see CheckpointStore).
+    Runs may also be read from and added to a ResultCache shared between
+    sweeps (`cache`). The design and seed are stored, and a resumed sweep
+    must have the same design (and seed, if given).
+
+    Store tables (sweep.sqlite in output_dir)
+    -----------------------------------------
+    points:
+        Point, scenario name and parameter values
+    runs:
+        Point, replication and global results of each run (final values of
+        cumulative totals, means of daily audits of other global counts, and
+        average waits)
+    unit_runs:
+        Point, replication, unit and unit results of each run (mean and 95th
+        percentile occupancy, mean waiting and displaced patients by
+        preferred unit, and admissions)
+    meta:
+        Sweep settings (seed entropy, replications, design)
+
+    methods
+    -------
+    get_design:
+        Return list of dictionaries of parameter values by point
+    make_scenario:
+        Return Scenario of a point
+    run:
+        Run points not already in the store
+    query:
+        Return result of an SQL query of the store as a DataFrame
+    results:
+        Return runs (or unit runs) with point parameters
+    summary:
+        Return mean results by point with parameters
+
+    """
+
+    def __init__(self, parameters, design='grid', samples=None, base=None,
+                 replications=10, output_dir='./output/sweep', n_jobs=-1,
+                 seed=None, chunk_size=None, cache=None):
+        """Constructor method for Sweep. `base` is a dictionary of Scenario
+        parameters common to all points."""
+
+        if design not in ('grid', 'lhs'):
+            raise ValueError(f'Unknown design {design!r}; use grid or lhs')
+        if design == 'lhs' and not samples:
+            raise ValueError('Latin hypercube design needs samples')
+
+        self.parameters = parameters
+        self.design = design
+        self.samples = samples
+        self.base = base if base else {}
+        self.replications = replications
+        self.output_dir = output_dir
+        self.n_jobs = n_jobs
+        # Default chunk keeps workers busy while storing results often
+        self.chunk_size = (chunk_size if chunk_size else
+                           2 * effective_n_jobs(n_jobs))
+        os.makedirs(output_dir, exist_ok=True)
+        self.store_path = os.path.join(output_dir, 'sweep.sqlite')
+        self.cache = cache
+        self.checkpoint_dir = os.path.join(output_dir, 'checkpoints')
+
+        # Seed entropy and design are taken from the store, if resuming (a
+        # seed given must match the stored seed)
+        meta = self.read_meta()
+        self.seed_entropy = np.random.SeedSequence(seed).entropy
+        if 'seed_entropy' in meta:
+            stored_entropy = int(meta['seed_entropy'])
+            if seed is not None and self.seed_entropy != stored_entropy:
+                raise ValueError(
+                    f'Sweep seed differs from seed in {self.store_path}')
+            self.seed_entropy = stored_entropy
+        self.points = self.get_design()
+        self.write_design(meta)
+
+    def connect(self):
+        """Return connection to store"""
+
+        return sqlite3.connect(self.store_path)
+
+    def read_meta(self):
+        """Return dictionary of stored sweep settings (empty if new)"""
+
+        with contextlib.closing(self.connect()) as connection:
+            tables = pd.read_sql_query(
+                "SELECT name FROM sqlite_master WHERE type = 'table'",
+                connection)['name'].tolist()
+            if 'meta' not in tables:
+                return {}
+            meta = pd.read_sql_query('SELECT * FROM meta', connection)
+
+        return dict(zip(meta['key'], meta['value']))
+
+    def get_design(self):
+        """Return list of dictionaries of parameter values by point"""
+
+        if self.design == 'grid':
+            return grid(self.parameters)
+
+        rng = np.random.default_rng(
+            np.random.SeedSequence(self.seed_entropy, spawn_key=(1,)))
+
+        return latin_hypercube(self.parameters, self.samples, rng)
+
+    def write_design(self, meta):
+        """Store sweep settings and design points (checking a resumed sweep
+        has the same design)"""
+
+        design = json.dumps(
+            {'design': self.design, 'points': self.points,
+             'base': self.base, 'replications': self.replications},
+            sort_keys=True, default=_to_column)
+        if meta:
+            if meta['design'] != design:
+                raise ValueError(
+                    f'Sweep design differs from design in {self.store_path}')
+            return
+
+        points = pd.DataFrame(
+            [{parameter: _to_column(value)
+              for parameter, value in point.items()}
+             for point in self.points])
+        points.insert(0, 'point', range(len(self.points)))
+        points.insert(1, 'name', self.point_names())
+        meta = pd.DataFrame({
+            'key': ['seed_entropy', 'design'],
+            'value': [str(self.seed_entropy), design]})
+        with contextlib.closing(self.connect()) as connection:
+            points.to_sql('points', connection, index=False)
+            meta.to_sql('meta', connection, index=False)
+
+    def point_names(self):
+        """Return list of scenario names of points"""
+
+        return [f'point_{point:04d}' for point in range(len(self.points))]
+
+    def make_scenario(self, values):
+        """Return Scenario for dictionary of parameter values (on base
+        parameters)"""
+
+        scenario = Scenario(self.base)
+        capacity_column = None
+        capacity_multiplier = {}
+        unit_use = dict(scenario.unit_use) if scenario.unit_use else {}
+        for parameter, value in values.items():
+            if parameter == 'capacity_column':
+                capacity_column = value
+            elif parameter == 'capacity_multiplier':
+                capacity_multiplier[None] = value
+            elif parameter.startswith('capacity_multiplier:'):
+                capacity_multiplier[parameter.split(':', 1)[1]] = value
+            elif parameter.startswith('use:'):
+                unit_use[parameter.split(':', 1)[1]] = int(value)
+            else:
+                setattr(scenario, parameter, value)
+
+        if unit_use:
+            scenario.unit_use = unit_use
+        if capacity_column is not None or capacity_multiplier:
+            units = load_reference_data(scenario.data_path).units
+            base_capacity = (dict(scenario.unit_capacity)
+                             if scenario.unit_capacity else {})
+            column = capacity_column if capacity_column else 'Capacity'
+            unit_capacity = {}
+            for unit, capacity in units[column].items():
+                capacity = base_capacity.get(unit, capacity)
+                multiplier = (capacity_multiplier.get(None, 1) *
+                              capacity_multiplier.get(unit, 1))
+                unit_capacity[unit] = int(round(capacity * multiplier))
+            scenario.unit_capacity = unit_capacity
+
+        return scenario
+
+    def completed_points(self):
+        """Return set of points with results in the store"""
+
+        with contextlib.closing(self.connect()) as connection:
+            tables = pd.read_sql_query(
+                "SELECT name FROM sqlite_master WHERE type = 'table'",
+                connection)['name'].tolist()
+            if 'runs' not in tables:
+                return set()
+            # Unit results of a chunk whose runs were not stored are removed
+            with connection:
+                connection.execute(
+                    'DELETE FROM unit_runs WHERE point NOT IN '
+                    '(SELECT DISTINCT point FROM runs)')
+            points = pd.read_sql_query(
+                'SELECT DISTINCT point FROM runs', connection)['point']
+
+        return set(points.tolist())
+
+    def run(self):
+        """Run replications of points not already in the store, in chunks of
+        points, adding results to the store as each chunk completes"""
+
+        names = self.point_names()
+        completed = self.completed_points()
+        remaining = [point for point in range(len(self.points))
+                     if point not in completed]
+        chunk_size = self.chunk_size
+        print(f'\r>> Sweep: {len(completed)} of {len(self.points)} '
+              f'points complete', end='')
+
+        for chunk_start in range(0, len(remaining), chunk_size):
+            chunk = remaining[chunk_start: chunk_start + chunk_size]
+            scenarios = {names[point]: self.make_scenario(self.points[point])
+                         for point in chunk}
+            replicator = Replicator(
+                scenarios, self.replications, n_jobs=self.n_jobs,
+                seed=self.seed_entropy, cache=self.cache,
+                checkpoint_dir=self.checkpoint_dir,
+                output_dir=self.output_dir)
+            with contextlib.redirect_stdout(io.StringIO()):
+                replicator.run_tasks(replicator.get_tasks())
+            self.write_results(replicator, {names[point]: point
+                                            for point in chunk})
+            completed.update(chunk)
+            print(f'\r>> Sweep: {len(completed)} of {len(self.points)} '
+                  f'points complete', end='')
+        print()
+
+    def write_results(self, replicator, points):
+        """Add results of runs of a Replicator (points by scenario name) to
+        the store (unit results first: runs mark points complete)"""
+
+        trial_results = replicator.trial_results
+        runs = []
+        for item, wait in zip(trial_results['global'],
+                              trial_results['average_wait_time_waiters']):
+            record = {'point': points[item['name'].iloc[0]],
+                      'replication': int(item['run'].iloc[0])}
+            # Cumulative totals (total_*) at end of run; means of other counts
+            for key in replicator.global_keys:
+                if key.startswith('total_'):
+                    record[key] = item[key].max()
+                else:
+                    record[key] = item[key].mean()
+            record['average_wait_time_waiters'] = wait[0]
+            runs.append(record)
+
+        unit_runs = []
+        for occupancy, waiting, displaced, admissions in zip(
+                trial_results['occupancy'],
+                trial_results['occupancy_waiting_preferred'],
+                trial_results['occupancy_displaced_preferred'],
+                trial_results['unit_admissions']):
+            # Units may differ between points (unit use parameters)
+            units = [unit for unit in occupancy.columns
+                     if unit not in ('run', 'name')]
+            df = pd.DataFrame({
+                'point': points[occupancy['name'].iloc[0]],
+                'replication': int(occupancy['run'].iloc[0]),
+                'unit': units,
+                'occupancy_mean': occupancy[units].mean().values,
+                'occupancy_95': np.percentile(
+                    occupancy[units].values, 95, axis=0),
+                'waiting_mean': waiting[units].mean().values,
+                'displaced_mean': displaced[units].mean().values,
+                'admissions': admissions[units].values.astype(float)})
+            unit_runs.append(df)
+
+        with contextlib.closing(self.connect()) as connection:
+            pd.concat(unit_runs).to_sql('unit_runs', connection,
+                                        if_exists='append', index=False)
+            pd.DataFrame(runs).to_sql('runs', connection, if_exists='append',
+                                      index=False)
+
+    def query(self, sql, params=None):
+        """Return result of an SQL query of the store as a DataFrame"""
+
+        with contextlib.closing(self.connect()) as connection:
+            return pd.read_sql_query(sql, connection, params=params)
+
+    def results(self, table='runs'):
+        """Return results of runs ('runs' or 'unit_runs' table) with point
+        parameters"""
+
+        return self.query(
+            f'SELECT * FROM points JOIN {table} USING (point) '
+            f'ORDER BY point, replication')
+
+    def summary(self, table='runs'):
+        """Return mean results over replications by point (and unit, for
+        'unit_runs') with point parameters"""
+
+        results = self.results(table)
+        keys = list(self.query('SELECT * FROM points LIMIT 0').columns)
+        if table == 'unit_runs':
+            keys.append('unit')
+        # Parameters may be missing (None) for some points
+        summary = results.drop(columns='replication').groupby(
+            keys, sort=False, dropna=False).mean()
+
+        return summary.reset_index()
@@ -0,0 +1,160 @@
+import numpy as np
+
+
+def capacity_never_binds(model):
+    """
+    Return True if no unit can ever run out of beds in a model run: every
+    unit's capacity is at least the total number of arrivals in the run
+    (arrivals are at fixed intervals, so this is known before the run). Each
+    unit is then an independent M/G/infinity queue, and no patient waits or
+    is displaced.
+    """
+
+    arrival_count = len(get_arrival_times(model))
+
+    return bool(np.all(model.unit_capacity >= arrival_count))
+
+
+def get_arrival_times(model):
+    """Return array of arrival times in a model run (accumulated in the same
+    way as SimPy timeouts, so times match the simulation exactly)"""
+
+    run_duration = model.params.sim_warmup + model.params.sim_duration
+    interval = model.data.interarrival_interval / model.params.scale_admissions
+    steps = np.full(int(run_duration / interval) + 2, interval)
+    steps[0] = 0
+    arrival_times = np.cumsum(steps)
+
+    return arrival_times[arrival_times < run_duration]
+
+
+def draw_patients(model):
+    """
+    Return arrays of arrival time, LSOA index, length of stay deviate and use
+    of ASU for all patients in a model run. Values are drawn from the model's
+    random number streams in the same order as the SimPy model (LSOAs in
+    batches, as in Model.next_lsoa_index; use of ASU then ESD, as in
+    Patient), so patients match a SimPy run of the same seed sequence.
+    """
+
+    arrival_times = get_arrival_times(model)
+    patient_count = len(arrival_times)
+    batch_size = 10000
+    batch_count = int(np.ceil(patient_count / batch_size))
+    lsoa_index = np.searchsorted(
+        model.data.admission_cum_probs,
+        model.rng_arrivals.random(batch_count * batch_size),
+        side='right')[:patient_count]
+    los_normal = model.rng_los.standard_normal(patient_count)
+    patient_random = model.rng_patients.random((patient_count, 2))
+    use_asu = patient_random[:, 0] < model.params.require_asu
+
+    return arrival_times, lsoa_index, los_normal, use_asu
+
+
+def run_unconstrained(model):
+    """
+    Run a model with unconstrained capacity (see capacity_never_binds)
+    without simulating patients one by one. Arrival LSOAs, use of ASU and
+    length of stay are drawn as arrays for the whole run (see draw_patients),
+    and daily audits are built by counting admissions and discharges between
+    audit times. Results match a SimPy run of the same seed sequence.
+    """
+
+    params = model.params
+    data = model.data
+    number_units = len(data.units_capacity)
+    run_duration = params.sim_warmup + params.sim_duration
+
+    all_arrival_times, lsoa_index, los_normal, use_asu = draw_patients(model)
+    patient_count = len(all_arrival_times)
+    pref_unit = np.array(data.lsoa_pref_unit_index)[lsoa_index]
+
+    # ASU patients are admitted to preferred unit on arrival
+    arrival_times = all_arrival_times[use_asu]
+    unit = pref_unit[use_asu]
+    los_mean = np.array(data.units_los_mean, dtype=np.float64)[unit]
+    los_sd = los_mean * params.los_cv
+    los = np.maximum(los_mean + los_sd * los_normal[use_asu], 0.01)
+    discharge_times = arrival_times + los
+
+    # Audit times (daily from time zero, recorded after warm-up)
+    audit_times = np.arange(np.ceil(run_duration))
+    audit_times = audit_times[
+        (audit_times >= params.sim_warmup) & (audit_times < run_duration)]
+    audit_count = len(audit_times)
+
+    # Occupancy: patient counted at audits from admission to discharge
+    start = np.searchsorted(audit_times, arrival_times, side='left')
+    end = np.searchsorted(audit_times, discharge_times, side='left')
+    change = (np.bincount(start * number_units + unit,
+                          minlength=(audit_count + 1) * number_units) -
+              np.bincount(end * number_units + unit,
+                          minlength=(audit_count + 1) * number_units))
+    occupancy = np.cumsum(
+        change.reshape(audit_count + 1, number_units), axis=0)[:-1]
+
+    # Patients and ASU patients arriving after warm-up, up to each audit
+    warmup_patients = np.searchsorted(
+        all_arrival_times, params.sim_warmup, side='left')
+    total_patients = np.searchsorted(
+        all_arrival_times, audit_times, side='right') - warmup_patients
+    warmup_asu_patients = np.searchsorted(
+        arrival_times, params.sim_warmup, side='left')
+    total_patients_asu = np.searchsorted(
+        arrival_times, audit_times, side='right') - warmup_asu_patients
+    asu_patients = occupancy.sum(axis=1)
+
+    # Write audits
+    audit = model.audit
+    audit.global_audit_index_count = audit_count
+    global_audit = audit.global_audit[:audit_count]
+    global_audit['index'] = np.arange(1, audit_count + 1)
+    global_audit['time'] = audit_times
+    global_audit['total_patients'] = total_patients
+    global_audit['total_patients_asu'] = total_patients_asu
+    global_audit['current_patients'] = asu_patients
+    global_audit['asu_patients_all'] = asu_patients
+    global_audit['asu_patients_allocated'] = asu_patients
+    audit.audit_unit_occupancy[:audit_count] = occupancy
+
+    # End of run state
+    in_system = discharge_times >= run_duration
+    model.unit_occupancy = np.bincount(
+        unit[in_system], minlength=number_units).astype(np.float64)
+    model.unit_has_spare_bed = model.unit_occupancy < model.unit_capacity
+    model.unit_admissions = np.bincount(
+        unit[arrival_times >= params.sim_warmup],
+        minlength=number_units).astype(np.float64)
+    model.patient_id_count = patient_count
+    model.tracker['total_patients'] = patient_count - warmup_patients
+    model.tracker['total_patients_asu'] = (
+        len(arrival_times) - warmup_asu_patients)
+    for key in ['current_patients', 'current_asu_patients_all',
+                'current_asu_patients_allocated']:
+        model.tracker[key] = int(in_system.sum())
+
+    # Patient log (patients arriving after warm-up)
+    if model.patient_log is not None:
+        logged = all_arrival_times >= params.sim_warmup
+        asu_unit = np.full(patient_count, -1)
+        asu_unit[use_asu] = unit
+        time_allocated = np.where(use_asu, all_arrival_times, np.nan)
+        patient_los = np.full(patient_count, np.nan)
+        patient_los[use_asu] = los
+        time_out = np.where(use_asu, np.nan, all_arrival_times)
+        time_out[use_asu] = np.where(in_system, np.nan, discharge_times)
+        model.patient_log.add_records(
+            id=np.arange(1, patient_count + 1)[logged],
+            lsoa_index=lsoa_index[logged],
+            pref_unit_index=pref_unit[logged],
+            asu_unit_index=asu_unit[logged],
+            use_asu=use_asu[logged],
+            displaced=np.zeros(logged.sum(), dtype=bool),
+            time_in=all_arrival_times[logged],
+            time_asu_allocated=time_allocated[logged],
+            waiting_time=np.where(use_asu, 0., np.nan)[logged],
+            los_asu=patient_los[logged],
+            time_out=time_out[logged])
+
+    return
@@ -0,0 +1,20 @@
+from sim_utils.sweep import Sweep
+
+import warnings
+warnings.filterwarnings("ignore")
+
+# Grid of demand, capacity (multiples of planned beds for 85% occupancy) and
+# use of non-preferred units. Results are stored in output/sweep/sweep.sqlite;
+# if stopped, running again resumes the sweep.
+parameters = {
+    'scale_admissions': [1.0, 1.05, 1.1],
+    'capacity_column': ['planned_85_percent'],
+    'capacity_multiplier': [0.9, 1.0, 1.1],
+    'allow_non_preferred_asu': [False, True]}
+
+sweep = Sweep(parameters, replications=10, output_dir='output/sweep',
+              chunk_size=6, seed=42)
+sweep.run()
+print(sweep.summary()[list(parameters) + ['asu_patients_unallocated',
+                                          'asu_patients_displaced',
+                                          'average_wait_time_waiters']])
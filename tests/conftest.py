@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# Tests import sim_utils, and models read data/, from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """Run each test from the repository root"""
+
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture(scope='session')
+def planned_capacity():
+    """Beds by unit name for planned 85% occupancy (capacity binds)"""
+
+    from sim_utils.data import load_reference_data
+
+    units = load_reference_data(os.path.join(ROOT, 'data')).units
+
+    return dict(zip(units.index, units['planned_85_percent']))
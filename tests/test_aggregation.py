@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from sim_utils.aggregation import P2Quantile
+
+
+@pytest.mark.parametrize('p', [0.05, 0.5, 0.95])
+def test_p2_quantile_matches_percentile(p):
+    rng = np.random.default_rng(0)
+    observations = np.column_stack([rng.normal(10, 2, 20000),
+                                    rng.exponential(3, 20000),
+                                    rng.uniform(0, 50, 20000)])
+    quantile = P2Quantile(p, observations.shape[1])
+    for row in observations:
+        quantile.update(row)
+
+    np.testing.assert_allclose(
+        quantile.value(), np.percentile(observations, p * 100, axis=0),
+        rtol=0.02, atol=0.05)
+
+
+def test_p2_quantile_with_few_observations():
+    quantile = P2Quantile(0.5, 2)
+    assert np.isnan(quantile.value()).all()
+
+    observations = np.array([[1., 10.], [3., 30.], [2., 20.]])
+    for row in observations:
+        quantile.update(row)
+
+    assert np.array_equal(quantile.value(), [2., 20.])
@@ -0,0 +1,16 @@
+import numpy as np
+
+from sim_utils.batch_means import mser
+
+
+def test_mser_recovers_known_warmup():
+    rng = np.random.default_rng(0)
+    warmup = 100
+    series = np.concatenate([10 + rng.normal(0, 1, warmup),
+                             rng.normal(0, 1, 900)])
+
+    assert abs(mser(series) - warmup) <= 5
+
+
+def test_mser_short_series():
+    assert mser([1., 2., 3.]) == 0
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sim_utils.replication as replication
+from sim_utils.checkpoint import CheckpointStore
+from sim_utils.parameters import Scenario
+from sim_utils.replication import Replicator, single_run
+from sim_utils.result_cache import ResultCache
+
+
+def short_scenario():
+    return Scenario(event_engine='array', sim_warmup=20, sim_duration=30)
+
+
+def test_resume_without_seed_restores_runs(tmp_path, monkeypatch, capsys):
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    scenarios = {'base': short_scenario()}
+    first = Replicator(scenarios, 3, n_jobs=1, output_dir=str(tmp_path),
+                       checkpoint_dir=checkpoint_dir)
+    first.run_scenarios()
+
+    # Resumed trial (no seed given) reuses the stored seed: no runs made
+    runs = []
+    monkeypatch.setattr(replication, 'run_replication',
+                        lambda *args: runs.append(args))
+    resumed = Replicator(scenarios, 3, n_jobs=1, output_dir=str(tmp_path),
+                         checkpoint_dir=checkpoint_dir)
+    resumed.run_scenarios()
+
+    assert resumed.seed_entropy == first.seed_entropy
+    assert runs == []
+    assert np.array_equal(resumed.summary_global.values,
+                          first.summary_global.values)
+
+
+def test_resume_with_different_seed_raises(tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    scenarios = {'base': short_scenario()}
+    Replicator(scenarios, 1, seed=1, output_dir=str(tmp_path),
+               checkpoint_dir=checkpoint_dir)
+    Replicator(scenarios, 1, seed=1, output_dir=str(tmp_path),
+               checkpoint_dir=checkpoint_dir)
+
+    with pytest.raises(ValueError, match='seed'):
+        Replicator(scenarios, 1, seed=2, output_dir=str(tmp_path),
+                   checkpoint_dir=checkpoint_dir)
+
+
+def assert_same_run_results(expected, results):
+    assert set(results) == set(expected)
+    for name, value in expected.items():
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(results[name], value)
+        elif isinstance(value, pd.Series):
+            pd.testing.assert_series_equal(results[name], value)
+        elif name == 'instrumentation':
+            assert results[name].counters == value.counters
+            assert results[name].timers == value.timers
+        else:
+            assert results[name] == value
+
+
+def run_results(planned_capacity):
+    scenario = Scenario(unit_capacity=planned_capacity, sim_warmup=20,
+                        sim_duration=30, allow_non_preferred_asu=True,
+                        instrument=True)
+
+    return single_run(scenario, seed_sequence=np.random.SeedSequence(7))
+
+
+def test_checkpoint_round_trip(tmp_path, planned_capacity, capsys):
+    results = run_results(planned_capacity)
+    store = CheckpointStore(str(tmp_path))
+    store.save('base', 3, results, key='abc')
+
+    assert store.completed('base') == [3]
+    assert store.load('base', 3, key='other') is None
+    assert_same_run_results(results, store.load('base', 3, key='abc'))
+
+
+def test_result_cache_round_trip(tmp_path, planned_capacity, capsys):
+    results = run_results(planned_capacity)
+    cache = ResultCache(str(tmp_path))
+    cache.put('abc', results)
+
+    assert cache.get('other') is None
+    assert_same_run_results(results, cache.get('abc'))
+    assert (cache.hits, cache.misses) == (1, 1)
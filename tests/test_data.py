@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from sim_utils.data import Data, load_reference_data
+from sim_utils.parameters import Scenario
+
+
+def test_reference_data_cannot_be_changed_in_place():
+    reference = load_reference_data()
+    capacity = list(reference.units['Capacity'])
+
+    # DataFrames are copies: changes do not reach the shared data
+    units = reference.units
+    units['Capacity'] = 1
+    assert list(reference.units['Capacity']) == capacity
+    assert Data(Scenario()).units_capacity == capacity
+
+    # Arrays are read-only
+    for values in [reference.admission_probs, reference.admission_cum_probs,
+                   reference.time_values, reference.distance_values]:
+        with pytest.raises(ValueError):
+            values[0] = 0
+
+    with pytest.raises(TypeError):
+        reference.matrix_column_by_postcode['new'] = 0
+
+
+def test_unit_capacity_override_does_not_change_reference(planned_capacity):
+    data = Data(Scenario(unit_capacity=planned_capacity))
+    reference = load_reference_data()
+
+    assert data.units_capacity == [planned_capacity[name]
+                                   for name in data.units_name]
+    assert not np.array_equal(reference.units.loc[data.units_name, 'Capacity'],
+                              data.units_capacity)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from sim_utils.model import Model
+from sim_utils.parameters import Scenario
+
+audits = ['global_audit', 'occupancy_audit',
+          'unit_occupancy_displaced_preferred_audit',
+          'unit_occupancy_displaced_destination_audit',
+          'unit_occupancy_waiting_preferred_audit']
+
+
+def run_model(seed=42, **kwargs):
+    model = Model(Scenario(allow_non_preferred_asu=True, **kwargs),
+                  np.random.SeedSequence(seed))
+    model.run()
+
+    return model
+
+
+def assert_same_results(expected, model):
+    for audit in audits:
+        assert np.array_equal(getattr(expected, audit).values,
+                              getattr(model, audit).values), audit
+    assert np.array_equal(expected.admissions_by_unit.values,
+                          model.admissions_by_unit.values)
+    assert expected.average_wait_time_all == model.average_wait_time_all
+    assert expected.maximum_wait_time == model.maximum_wait_time
+
+
+def test_array_engine_matches_simpy_with_capacity(planned_capacity):
+    # Capacity binds: patients wait and are displaced
+    simpy_model = run_model(unit_capacity=planned_capacity)
+    array_model = run_model(unit_capacity=planned_capacity,
+                            event_engine='array')
+
+    assert simpy_model.tracker['total_patients_waited'] > 0
+    assert_same_results(simpy_model, array_model)
+
+
+@pytest.mark.parametrize('event_engine', ['simpy', 'array'])
+def test_fast_path_matches_engines_without_capacity(event_engine):
+    # Default (unlimited) capacity never binds: fast path is used
+    fast_model = run_model()
+    model = run_model(event_engine=event_engine,
+                      unconstrained_fast_path=False)
+
+    assert_same_results(fast_model, model)
+
+
+def test_restored_snapshot_reproduces_cold_run(planned_capacity):
+    scenario = Scenario(unit_capacity=planned_capacity,
+                        allow_non_preferred_asu=True, sim_warmup=50,
+                        sim_duration=100)
+    cold = Model(scenario, np.random.SeedSequence(3))
+    cold.run()
+    snapshot = Model(scenario, np.random.SeedSequence(3)).run_warmup()
+    resumed = Model(scenario, np.random.SeedSequence(3))
+    resumed.run(snapshot, restore_rng=True)
+
+    assert_same_results(cold, resumed)
+    assert cold.average_wait_time_waiters == resumed.average_wait_time_waiters
@@ -0,0 +1,62 @@
+import types
+
+import numpy as np
+
+from sim_utils.model import Model
+from sim_utils.parameters import Scenario
+
+
+def waiting_patient(model, unit):
+    """Return stand-in for a patient waiting for a bed (see
+    Model.wait_for_asu_bed)"""
+
+    return types.SimpleNamespace(waiting_for_asu=True,
+                                 bed_allocated=model.env.event(),
+                                 pref_unit_index=unit)
+
+
+def full_unit_model(planned_capacity, unit=0):
+    model = Model(Scenario(unit_capacity=planned_capacity),
+                  np.random.SeedSequence(1))
+    model.unit_occupancy[unit] = model.unit_capacity[unit]
+    model.unit_has_spare_bed[unit] = False
+
+    return model
+
+
+def test_released_bed_goes_to_longest_waiting_patient(planned_capacity):
+    unit = 0
+    model = full_unit_model(planned_capacity, unit)
+    patients = [waiting_patient(model, unit) for _ in range(3)]
+    model.unit_waiting_queues[unit].extend(patients)
+
+    for released in range(1, 4):
+        model.release_asu_bed(unit)
+        assert [patient.bed_allocated.triggered for patient in patients] == \
+            [i < released for i in range(3)]
+        assert model.unit_occupancy[unit] == model.unit_capacity[unit]
+
+
+def test_release_skips_patients_allocated_elsewhere(planned_capacity):
+    unit = 0
+    model = full_unit_model(planned_capacity, unit)
+    allocated, waiting = [waiting_patient(model, unit) for _ in range(2)]
+    allocated.waiting_for_asu = False
+    model.unit_waiting_queues[unit].extend([allocated, waiting])
+
+    model.release_asu_bed(unit)
+
+    assert not allocated.bed_allocated.triggered
+    assert waiting.bed_allocated.triggered
+    assert waiting.assigned_asu_index == unit
+    assert not model.unit_waiting_queues[unit]
+
+
+def test_release_with_no_waiting_patient_frees_bed(planned_capacity):
+    unit = 0
+    model = full_unit_model(planned_capacity, unit)
+
+    model.release_asu_bed(unit)
+
+    assert model.unit_occupancy[unit] == model.unit_capacity[unit] - 1
+    assert model.unit_has_spare_bed[unit]
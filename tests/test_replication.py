@@ -0,0 +1,27 @@
+import os
+
+from sim_utils.parameters import Scenario
+from sim_utils.replication import Replicator
+
+
+def short_scenario(**kwargs):
+    return Scenario(event_engine='array', sim_warmup=20, sim_duration=30,
+                    **kwargs)
+
+
+def test_trials_sharing_output_dir_keep_combined_pivots(tmp_path, capsys):
+    output_dir = str(tmp_path)
+    for trial_name, scenarios in [
+            ('pooling', {'pooled': short_scenario(
+                allow_non_preferred_asu=True)}),
+            ('demand', {'growth': short_scenario(scale_admissions=1.1)})]:
+        replicator = Replicator(scenarios, 2, n_jobs=1, seed=1,
+                                output_dir=output_dir, trial_name=trial_name)
+        replicator.run_scenarios()
+
+    for trial_name, name in [('pooling', 'pooled'), ('demand', 'growth')]:
+        pivot = replicator.sink.read(f'{trial_name}_global_pivot',
+                                     index_col=[0, 1])
+        assert list(pivot.columns) == [name]
+        assert os.path.exists(replicator.sink.path('global_pivot', name))
+    assert not os.path.exists(os.path.join(output_dir, 'global_pivot.csv'))
@@ -0,0 +1,64 @@
+import types
+
+import numpy as np
+import pytest
+
+from sim_utils.model import Model
+from sim_utils.parameters import Scenario
+
+
+def make_scenario(unit_capacity, **kwargs):
+    """Return short scenario (capacity binds) for snapshot tests"""
+
+    return Scenario(unit_capacity=unit_capacity, sim_warmup=50,
+                    sim_duration=60, allow_non_preferred_asu=True, **kwargs)
+
+
+def scaled_capacity(unit_capacity, factor):
+    return {unit: int(beds * factor) for unit, beds in unit_capacity.items()}
+
+
+def test_restore_rejects_different_capacity(planned_capacity):
+    snapshot = Model(make_scenario(planned_capacity),
+                     np.random.SeedSequence(1)).run_warmup()
+    model = Model(make_scenario(scaled_capacity(planned_capacity, 0.7)),
+                  np.random.SeedSequence(2))
+
+    with pytest.raises(ValueError, match='capacities'):
+        model.run(snapshot)
+
+
+def test_restore_rejects_occupancy_above_capacity(planned_capacity):
+    scenario = make_scenario(planned_capacity)
+    snapshot = Model(scenario, np.random.SeedSequence(1)).run_warmup()
+    model = Model(scenario, np.random.SeedSequence(2))
+    snapshot['unit_occupancy'] = model.unit_capacity + 1
+
+    with pytest.raises(ValueError, match='occupancy'):
+        model.run(snapshot)
+
+
+def test_release_above_capacity_keeps_patients_waiting(planned_capacity):
+    model = Model(make_scenario(planned_capacity), np.random.SeedSequence(1))
+    unit = 0
+    capacity = model.unit_capacity[unit]
+    model.unit_occupancy[unit] = capacity + 1
+    model.unit_has_spare_bed[unit] = False
+    patient = types.SimpleNamespace(
+        waiting_for_asu=True, bed_allocated=model.env.event(),
+        pref_unit_index=unit)
+    model.unit_waiting_queues[unit].append(patient)
+
+    # Release leaves unit at capacity: no bed for the waiting patient
+    model.release_asu_bed(unit)
+    assert model.unit_occupancy[unit] == capacity
+    assert not model.unit_has_spare_bed[unit]
+    assert patient.waiting_for_asu
+    assert not patient.bed_allocated.triggered
+
+    # Release below capacity: bed passes to the waiting patient
+    model.release_asu_bed(unit)
+    assert model.unit_occupancy[unit] == capacity
+    assert not patient.waiting_for_asu
+    assert patient.bed_allocated.triggered
+    assert patient.assigned_asu_index == unit